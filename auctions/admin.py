@@ -1,11 +1,159 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 
-from .models import Listing, User, Watchlist, Bid, Comment, Category
+from . import hot
+from .models import Listing, User, Watchlist, Bid, Comment, Category, Job
+from .paginator import EstimatedCountPaginator
+from .signals import listing_closed
 
-# Register your models here.
-admin.site.register(Listing)
-admin.site.register(User)
-admin.site.register(Watchlist)
-admin.site.register(Bid)
-admin.site.register(Comment)
-admin.site.register(Category)
\ No newline at end of file
+
+admin.site.register(User, UserAdmin)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    """
+    Admin of the categories. Searchable so that listings can select their category with an autocomplete field.
+    """
+    search_fields = ["name"]
+
+
+@admin.register(Listing)
+class ListingAdmin(admin.ModelAdmin):
+    """
+    Admin of the listings with a bulk action for closing listings.
+    """
+    list_display = ["title", "creator", "category", "current_bid", "active", "created_on"]
+    list_filter = ["active", "category"]
+    list_select_related = ["creator", "category"]
+    search_fields = ["title"]
+    # Select the users by id instead of rendering every user in a select box
+    raw_id_fields = ["creator", "winner"]
+    autocomplete_fields = ["category"]
+    readonly_fields = ["comment_count"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ["close_listings"]
+
+    def close_listings(self, request, queryset):
+        """
+        Closes the selected active listings with a single UPDATE, making the last (highest) bidder of each listing the
+        winner.
+        """
+        ids = list(queryset.filter(active=True).values_list("pk", flat=True))
+        # Write the bids held in memory before the winners are determined
+        for listing_id in ids:
+            hot.deactivate(listing_id)
+
+        last_bidder = Bid.objects.filter(listing=OuterRef("pk")).order_by("-pk").values("bidder")[:1]
+        with transaction.atomic():
+            now = timezone.now()
+            Listing.objects.filter(pk__in=ids).update(active=False, winner=Subquery(last_bidder), closed_on=now,
+                                                      modified_on=now)
+            # Notify the receivers, e.g. to let the winners know they have won the auctions
+            for listing in Listing.objects.filter(pk__in=ids):
+                listing_closed.send(sender=Listing, listing=listing)
+
+        self.message_user(request, f"Closed {len(ids)} listing(s).", messages.SUCCESS)
+    close_listings.short_description = "Close selected listings"
+    close_listings.allowed_permissions = ("change",)
+
+
+@admin.register(Bid)
+class BidAdmin(admin.ModelAdmin):
+    """
+    Admin of the bids. The listing and bidder of every row are fetched in the changelist query.
+    """
+    list_display = ["listing", "bidder", "amount"]
+    list_select_related = ["listing", "bidder"]
+    raw_id_fields = ["listing", "bidder"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Comment)
+class CommentAdmin(admin.ModelAdmin):
+    """
+    Admin of the comments with bulk actions for deleting spam.
+    """
+    list_display = ["user", "listing", "date_posted"]
+    list_select_related = ["user", "listing"]
+    raw_id_fields = ["user", "listing"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ["delete_comments", "delete_comments_by_authors"]
+
+    def delete_comments(self, request, queryset):
+        """
+        Deletes the selected comments with a single DELETE, without a confirmation page.
+        """
+        deleted = self.delete_queryset(request, queryset)
+        self.message_user(request, f"Deleted {deleted} comment(s).", messages.SUCCESS)
+    delete_comments.short_description = "Delete selected comments"
+    delete_comments.allowed_permissions = ("delete",)
+
+    def delete_comments_by_authors(self, request, queryset):
+        """
+        Deletes every comment of the authors of the selected comments, e.g. to remove the comments of a spammer.
+        """
+        authors = queryset.values("user")
+        deleted = self.delete_queryset(request, Comment.objects.filter(user__in=authors))
+        self.message_user(request, f"Deleted {deleted} comment(s).", messages.SUCCESS)
+    delete_comments_by_authors.short_description = "Delete all comments by the authors of the selected comments"
+    delete_comments_by_authors.allowed_permissions = ("delete",)
+
+    def delete_queryset(self, request, queryset):
+        """
+        Deletes the comments and returns the number of deleted comments. The comment counts of their listings are
+        recounted by util.recount_comments.
+        """
+        deleted, _ = queryset.delete()
+        return deleted
+
+
+@admin.register(Watchlist)
+class WatchlistAdmin(admin.ModelAdmin):
+    """
+    Admin of the watchlists. Listings are selected by id instead of rendering every listing in a select box.
+    """
+    list_display = ["user"]
+    list_select_related = ["user"]
+    raw_id_fields = ["user", "listings"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Admin of the background jobs with a bulk action for retrying failed jobs.
+    """
+    list_display = ["kind", "status", "attempts", "run_after", "created_on"]
+    list_filter = ["status"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ["retry_jobs"]
+
+    def retry_jobs(self, request, queryset):
+        """
+        Makes the selected jobs due again with a single UPDATE. If some of them share their coalesce key with a job
+        waiting to be claimed, or with each other, the jobs are retried one by one and those jobs are skipped.
+        """
+        values = {"status": Job.PENDING, "attempts": 0, "claim": "", "run_after": timezone.now()}
+        try:
+            with transaction.atomic():
+                retried = queryset.update(**values)
+        except IntegrityError:
+            retried = 0
+            for pk in queryset.values_list("pk", flat=True):
+                try:
+                    with transaction.atomic():
+                        retried += Job.objects.filter(pk=pk).update(**values)
+                except IntegrityError:
+                    pass
+        self.message_user(request, f"Retrying {retried} job(s).", messages.SUCCESS)
+    retry_jobs.short_description = "Retry selected jobs"
+    retry_jobs.allowed_permissions = ("change",)
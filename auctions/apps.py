@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        # Connect the signal receivers and register the job handlers
+        from . import autocomplete, categories, notifications, pagecache, util
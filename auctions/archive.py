@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.db import transaction
+
+from .models import Listing, Bid, Comment, Watchlist, ArchivedListing, ArchivedBid, ArchivedComment, ArchivedWatch
+
+
+def get_archivable_listings(closed_before, batch_size):
+    """
+    Returns the ids of up to batch_size listings closed before closed_before, read from the (closed_on) index.
+    """
+    return list(Listing.objects.filter(active=False, closed_on__lt=closed_before)
+                .order_by("closed_on").values_list("pk", flat=True)[:batch_size])
+
+
+def archive_listings(listing_ids):
+    """
+    Moves the listings with their bids, comments and watchlist entries to the archive tables. Returns the number of
+    archived listings.
+    When the archive is kept in the primary database, the rows are read, copied and deleted in a single transaction,
+    with the listings locked on databases that support it so that no bid, comment or watchlist entry is added to them
+    in the meantime. Otherwise the rows are first copied to the archive and then deleted from the live tables, each in
+    a transaction of its own database. Only the listings whose rows have all been copied are deleted, the others are
+    left for the next run, which replaces their copies in the archive. If the process stops between the two steps the
+    listings exist in both places, and archiving them again also replaces their copies.
+    """
+    if settings.ARCHIVE_DATABASE == "default":
+        with transaction.atomic():
+            copied = copy_listings(listing_ids, lock=True)
+            Listing.objects.filter(pk__in=copied).delete()
+        return len(copied)
+
+    copied = copy_listings(listing_ids)
+    with transaction.atomic():
+        # Lock the listings before comparing their rows, so that no row is added to them before they are deleted
+        locked = list(Listing.objects.select_for_update().filter(pk__in=copied).values_list("pk", flat=True))
+        current = get_row_ids(locked)
+        complete = [listing_id for listing_id in locked if current[listing_id] == copied[listing_id]]
+        # Their bids, comments and watchlist entries are deleted with them
+        Listing.objects.filter(pk__in=complete).delete()
+    return len(complete)
+
+
+def copy_listings(listing_ids, lock=False):
+    """
+    Copies the closed listings among listing_ids with their bids, comments and watchlist entries to the archive tables,
+    replacing the copies left by an earlier run. Returns the ids of the copied rows of each listing, see get_row_ids().
+    If lock is True, the listings are locked until the end of the current transaction.
+    """
+    listings = Listing.objects.filter(pk__in=listing_ids, active=False)
+    if lock:
+        listings = listings.select_for_update()
+    listings = list(listings.values(
+        "pk", "title", "description", "init_bid", "current_bid", "url", "creator_id", "creator__username", "winner_id",
+        "winner__username", "category_id", "category__name", "created_on", "closed_on", "bid_count", "comment_count"))
+    if not listings:
+        return {}
+    listing_ids = [listing["pk"] for listing in listings]
+    copied = {listing_id: set() for listing_id in listing_ids}
+
+    archived_listings = [
+        ArchivedListing(id=listing["pk"], title=listing["title"], description=listing["description"],
+                        init_bid=listing["init_bid"], current_bid=listing["current_bid"], url=listing["url"],
+                        creator_id=listing["creator_id"], creator_username=listing["creator__username"],
+                        winner_id=listing["winner_id"], winner_username=listing["winner__username"] or "",
+                        category_id=listing["category_id"], category_name=listing["category__name"] or "",
+                        created_on=listing["created_on"], closed_on=listing["closed_on"],
+                        bid_count=listing["bid_count"], comment_count=listing["comment_count"])
+        for listing in listings]
+    archived_bids = []
+    for pk, listing_id, amount, bidder_id, username in (
+            Bid.objects.filter(listing__in=listing_ids).order_by("pk")
+            .values_list("pk", "listing_id", "amount", "bidder_id", "bidder__username").iterator()):
+        archived_bids.append(ArchivedBid(listing_id=listing_id, amount=amount, bidder_id=bidder_id,
+                                         bidder_username=username))
+        copied[listing_id].add(("bid", pk))
+    archived_comments = []
+    for pk, listing_id, user_id, username, content, date_posted in (
+            Comment.objects.filter(listing__in=listing_ids).order_by("pk")
+            .values_list("pk", "listing_id", "user_id", "user__username", "content", "date_posted").iterator()):
+        archived_comments.append(ArchivedComment(listing_id=listing_id, user_id=user_id, username=username,
+                                                 content=content, date_posted=date_posted))
+        copied[listing_id].add(("comment", pk))
+    archived_watches = []
+    for pk, listing_id, user_id in (Watchlist.listings.through.objects.filter(listing__in=listing_ids)
+                                    .values_list("pk", "listing_id", "watchlist__user_id").iterator()):
+        archived_watches.append(ArchivedWatch(listing_id=listing_id, user_id=user_id))
+        copied[listing_id].add(("watch", pk))
+
+    with transaction.atomic(using=settings.ARCHIVE_DATABASE):
+        ArchivedListing.objects.filter(pk__in=listing_ids).delete()
+        ArchivedListing.objects.bulk_create(archived_listings)
+        ArchivedBid.objects.bulk_create(archived_bids, batch_size=1000)
+        ArchivedComment.objects.bulk_create(archived_comments, batch_size=1000)
+        ArchivedWatch.objects.bulk_create(archived_watches, batch_size=1000)
+
+    return copied
+
+
+def get_row_ids(listing_ids):
+    """
+    Returns the set of ("bid", id), ("comment", id) and ("watch", id) pairs of the rows of each of the listings.
+    """
+    row_ids = {listing_id: set() for listing_id in listing_ids}
+    for kind, rows in [("bid", Bid.objects), ("comment", Comment.objects),
+                       ("watch", Watchlist.listings.through.objects)]:
+        for pk, listing_id in rows.filter(listing__in=listing_ids).values_list("pk", "listing_id").iterator():
+            row_ids[listing_id].add((kind, pk))
+    return row_ids
@@ -0,0 +1,218 @@
+"""
+In-memory prefix index of the titles of the active listings, used to suggest listings as the user types.
+
+The titles are held per process in a sorted array, in which the titles starting with a prefix are found with a binary
+search. The index is built from the database on first use, updated right away when this process creates, closes or
+deletes a listing, and catches up with the listings changed by the other processes every AUTOCOMPLETE_SYNC_INTERVAL
+seconds. Listings deleted by the other processes leave no row to catch up from, so each sync also checks the next
+AUTOCOMPLETE_VERIFY_BATCH titles held against the database, going through all of them in turn. At most
+AUTOCOMPLETE_MAX_TITLES titles are held. Once the index is full, the titles added first make room for the new ones.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Listing
+from .signals import listing_closed, listing_created
+
+# Separates the normalized title from the listing id in the keys of the index. Sorts before any printable character so
+# that a title sorts before the longer titles it is a prefix of.
+SEPARATOR = "\x00"
+
+
+def normalize(title):
+    """
+    Returns the title as it is compared to the prefixes: case folded, with the runs of whitespace replaced by a single
+    space.
+    """
+    return " ".join(title.casefold().split())
+
+
+class PrefixIndex:
+    """
+    Sorted array of "normalized title, separator, listing id" keys, along with the titles by listing id from the oldest
+    to the newest listing. Once max_titles titles are held, adding a title removes the oldest one.
+    """
+    def __init__(self, max_titles):
+        self.max_titles = max_titles
+        self.keys = []
+        self.titles = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.titles)
+
+    def load(self, rows):
+        """
+        Replaces the titles with the (listing id, title) rows, given from the oldest to the newest listing.
+        """
+        titles = {}
+        for listing_id, title in rows:
+            titles[listing_id] = title
+        # Keep the most recent listings
+        for listing_id in list(titles)[:max(0, len(titles) - self.max_titles)]:
+            del titles[listing_id]
+        keys = sorted(f"{normalize(title)}{SEPARATOR}{listing_id}" for listing_id, title in titles.items())
+        with self.lock:
+            self.keys, self.titles = keys, titles
+
+    def add(self, listing_id, title):
+        """
+        Adds the title of the listing, replacing its previous title.
+        """
+        with self.lock:
+            if self.titles.get(listing_id) == title:
+                return
+            self.discard(listing_id)
+            insort(self.keys, f"{normalize(title)}{SEPARATOR}{listing_id}")
+            self.titles[listing_id] = title
+            while len(self.titles) > self.max_titles:
+                self.discard(next(iter(self.titles)))
+
+    def remove(self, listing_id):
+        """
+        Removes the title of the listing, if held.
+        """
+        with self.lock:
+            self.discard(listing_id)
+
+    def discard(self, listing_id):
+        """
+        Removes the title of the listing, if held. Must be called while holding the lock.
+        """
+        title = self.titles.pop(listing_id, None)
+        if title is not None:
+            key = f"{normalize(title)}{SEPARATOR}{listing_id}"
+            index = bisect_left(self.keys, key)
+            if index < len(self.keys) and self.keys[index] == key:
+                del self.keys[index]
+
+    def get_ids(self, after, limit):
+        """
+        Returns the smallest limit listing ids held that are greater than after, in ascending order.
+        """
+        with self.lock:
+            return heapq.nsmallest(limit, (listing_id for listing_id in self.titles if listing_id > after))
+
+    def search(self, prefix, limit):
+        """
+        Returns the (listing id, title) of up to limit listings whose normalized title starts with the normalized
+        prefix, in the order of their normalized titles.
+        """
+        # Keep a trailing space so that "red " does not suggest "redwood"
+        trailing = " " if prefix[-1:].isspace() else ""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        prefix += trailing
+
+        results = []
+        with self.lock:
+            index = bisect_left(self.keys, prefix)
+            while len(results) < limit and index < len(self.keys) and self.keys[index].startswith(prefix):
+                listing_id = int(self.keys[index].rpartition(SEPARATOR)[2])
+                results.append((listing_id, self.titles[listing_id]))
+                index += 1
+        return results
+
+
+# Index of this process, the time it has been synced with the database at and the monotonic time of the last sync
+_index = None
+_synced_at = None
+_checked = None
+# Listing id after which the next sync checks the titles held against the database
+_verified_up_to = 0
+# Guards the building and syncing of the index
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Returns the index of the process, building it from the active listings on first use and bringing it up to date
+    with the database every AUTOCOMPLETE_SYNC_INTERVAL seconds.
+    """
+    global _index, _synced_at, _checked, _verified_up_to
+    if _index is not None and time.monotonic() - _checked < settings.AUTOCOMPLETE_SYNC_INTERVAL:
+        return _index
+
+    with _lock:
+        if _index is None:
+            index = PrefixIndex(settings.AUTOCOMPLETE_MAX_TITLES)
+            # Listings changed while the index is loaded are updated by the next sync
+            synced_at = timezone.now()
+            rows = list(Listing.objects.filter(active=True).order_by("-pk")
+                        .values_list("pk", "title")[:settings.AUTOCOMPLETE_MAX_TITLES])
+            rows.reverse()
+            index.load(rows)
+            _index, _synced_at, _checked = index, synced_at, time.monotonic()
+        elif time.monotonic() - _checked >= settings.AUTOCOMPLETE_SYNC_INTERVAL:
+            synced_at = timezone.now()
+            # Read the listings created, closed or bid on since the last sync from the modified_on index. Go back one
+            # more interval so that the changes committed after the last sync, but made before it, are not missed.
+            since = _synced_at - timedelta(seconds=settings.AUTOCOMPLETE_SYNC_INTERVAL)
+            for listing_id, title, active in (Listing.objects.filter(modified_on__gte=since)
+                                              .values_list("pk", "title", "active")):
+                if active:
+                    _index.add(listing_id, title)
+                else:
+                    _index.remove(listing_id)
+            _verified_up_to = verify(_index, _verified_up_to)
+            _synced_at, _checked = synced_at, time.monotonic()
+    return _index
+
+
+def verify(index, after):
+    """
+    Removes the titles of the listings that are no longer active or have been deleted, out of the
+    AUTOCOMPLETE_VERIFY_BATCH listings held that follow the listing id after. Returns the listing id to continue from on
+    the next sync, or 0 to start over once every listing has been checked.
+    """
+    listing_ids = index.get_ids(after, settings.AUTOCOMPLETE_VERIFY_BATCH)
+    if not listing_ids:
+        return 0
+    # The listings are held from the newest ones down, so the range holds few listings that are not held
+    active = set(Listing.objects.filter(pk__gte=listing_ids[0], pk__lte=listing_ids[-1], active=True)
+                 .values_list("pk", flat=True))
+    for listing_id in listing_ids:
+        if listing_id not in active:
+            index.remove(listing_id)
+    return listing_ids[-1] if len(listing_ids) == settings.AUTOCOMPLETE_VERIFY_BATCH else 0
+
+
+def suggest(prefix):
+    """
+    Returns the (listing id, title) of up to AUTOCOMPLETE_LIMIT active listings whose title starts with the prefix,
+    ignoring case. Prefixes shorter than AUTOCOMPLETE_MIN_LENGTH characters get no suggestions.
+    """
+    prefix = prefix[:Listing._meta.get_field("title").max_length]
+    if len(prefix.strip()) < settings.AUTOCOMPLETE_MIN_LENGTH:
+        return []
+    return get_index().search(prefix, settings.AUTOCOMPLETE_LIMIT)
+
+
+@receiver(listing_created)
+def add_listing(sender, listing, **kwargs):
+    """
+    Adds the title of the new listing to the index of this process once the listing has been committed.
+    """
+    if _index is not None:
+        transaction.on_commit(lambda: _index.add(listing.pk, listing.title))
+
+
+@receiver(listing_closed)
+@receiver(post_delete, sender=Listing)
+def remove_listing(sender, **kwargs):
+    """
+    Removes the title of the closed or deleted listing from the index of this process.
+    """
+    listing = kwargs.get("listing") or kwargs["instance"]
+    if _index is not None:
+        _index.remove(listing.pk)
@@ -0,0 +1,92 @@
+import hashlib
+import threading
+
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category
+
+# Cache key of the version of the categories, a hash of their choices. The key is deleted whenever a category is saved
+# or deleted and expires after CATEGORIES_VERSION_TIMEOUT seconds, which lets every process know that its copy of the
+# categories is stale, even when the cache is not shared between processes.
+VERSION_KEY = "categories:version"
+
+# Categories held by this process: the version they were read at, their (id, name) choices and the memoized markup of
+# the rendered selects
+_lock = threading.Lock()
+_version = None
+_choices = []
+_rendered = {}
+
+
+class CategorySelect(forms.Select):
+    """
+    Select widget of the categories. The markup of a select without a selected category is rendered once per process
+    and version of the categories, and then reused by every form.
+    """
+    # Version of the categories the choices were read at, set by set_choices()
+    version = None
+
+    def render(self, name, value, attrs=None, renderer=None):
+        if value not in (None, "") or self.version is None:
+            return super().render(name, value, attrs, renderer)
+
+        key = (self.version, name, tuple(sorted(self.build_attrs(self.attrs, attrs).items())),
+               tuple(self.choices[:1]))
+        markup = _rendered.get(key)
+        if markup is None:
+            markup = super().render(name, value, attrs, renderer)
+            with _lock:
+                if self.version == _version:
+                    _rendered[key] = markup
+        return markup
+
+
+def get_choices():
+    """
+    Returns the version of the categories and their (id, name) choices. The categories are only read from the database
+    when the version is not in the cache, and the choices are only replaced when they have changed.
+    """
+    global _version, _choices, _rendered
+    version = cache.get(VERSION_KEY)
+    choices = None
+    if version is None:
+        choices = list(Category.objects.order_by("pk").values_list("pk", "name"))
+        # Every process computes the same version for the same categories
+        version = hashlib.md5(repr(choices).encode()).hexdigest()
+        cache.set(VERSION_KEY, version, settings.CATEGORIES_VERSION_TIMEOUT)
+
+    with _lock:
+        if version != _version:
+            if choices is None:
+                choices = list(Category.objects.order_by("pk").values_list("pk", "name"))
+            _choices = choices
+            _rendered = {}
+            _version = version
+        return _version, _choices
+
+
+def set_choices(field):
+    """
+    Sets the choices of a category ModelChoiceField from the categories held by the process, so that rendering the
+    field does not query the database.
+    """
+    version, choices = get_choices()
+    if field.empty_label is not None:
+        choices = [("", field.empty_label)] + choices
+    field.choices = choices
+    field.widget.version = version
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate(sender, **kwargs):
+    """
+    Makes the processes sharing the cache read the categories again once the current transaction has been committed.
+    The other processes read them again when their version expires.
+    """
+    transaction.on_commit(lambda: cache.delete(VERSION_KEY))
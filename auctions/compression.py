@@ -0,0 +1,93 @@
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    # Responses are compressed with gzip only
+    brotli = None
+
+# Content types worth compressing. Images and archives are already compressed.
+COMPRESSIBLE_TYPES = re.compile(r"^(text/|application/(json|javascript|xml|x-ndjson)|image/svg\+xml)")
+
+
+def get_encoding(request):
+    """
+    Returns the best encoding accepted by the client, "br" or "gzip", or None if the client accepts neither.
+    """
+    accepted = {}
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=lambda encoding: accepted.get(encoding, accepted.get("*", 0)))
+    return best if accepted.get(best, accepted.get("*", 0)) > 0 else None
+
+
+def compress(response, encoding):
+    """
+    Compresses the content of the response with the encoding, in place. Streaming responses are compressed chunk by
+    chunk as they are sent. Small and incompressible responses are left as they are.
+    """
+    if response.has_header("Content-Encoding") or not COMPRESSIBLE_TYPES.match(response.get("Content-Type", "")):
+        return response
+    # Caches must store the compressed and uncompressed responses separately
+    patch_vary_headers(response, ["Accept-Encoding"])
+
+    if response.streaming:
+        response.streaming_content = compress_stream(response.streaming_content, encoding)
+        # The length of the compressed stream is not known in advance
+        del response["Content-Length"]
+    else:
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if encoding == "br":
+            content = brotli.compress(response.content, quality=settings.BROTLI_QUALITY)
+        else:
+            content = gzip.compress(response.content, compresslevel=settings.GZIP_LEVEL)
+        # Keep the uncompressed content if compressing does not pay off
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response["Content-Length"] = str(len(content))
+
+    # The compressed body is no longer byte for byte identical to the one the ETag was computed for
+    etag = response.get("ETag")
+    if etag and etag.startswith('"'):
+        response["ETag"] = "W/" + etag
+    response["Content-Encoding"] = encoding
+    return response
+
+
+def compress_stream(chunks, encoding):
+    """
+    Yields the chunks compressed with the encoding. Each chunk is flushed so that the client receives the data as soon
+    as it is produced.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=settings.BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(settings.GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Bid, EventCursor, Watchlist
+
+
+def read_events(name, batch_size):
+    """
+    Returns the cursor of the worker with the given name, and up to batch_size of the bids and of the watchlist entries
+    created since the worker last advanced it. Bids are returned as (id, listing_id, bidder_id) and watchlist entries
+    as (id, listing_id, user_id), in the order of their ids.
+    The cursor row is locked until the end of the transaction on databases that support it, so run this inside the
+    transaction that processes the events and calls advance().
+    Ids are assigned when the rows are inserted but become visible when their transaction commits, which on databases
+    with concurrent writers, such as PostgreSQL, can be after rows with larger ids have been read. The ids skipped by
+    the cursor are therefore kept as gaps and read again along with the new events for EVENT_GAP_TIMEOUT seconds.
+    """
+    cursor, _ = EventCursor.objects.select_for_update().get_or_create(name=name)
+    bids = list(Bid.objects.filter(Q(pk__gt=cursor.last_bid_id) | Q(pk__in=get_gap_ids(cursor.bid_gaps)))
+                .order_by("pk").values_list("pk", "listing_id", "bidder_id")[:batch_size])
+    watches = list(Watchlist.listings.through.objects
+                   .filter(Q(pk__gt=cursor.last_watch_id) | Q(pk__in=get_gap_ids(cursor.watch_gaps)))
+                   .order_by("pk").values_list("pk", "listing_id", "watchlist__user_id")[:batch_size])
+    return cursor, bids, watches
+
+
+def advance(cursor, bids, watches):
+    """
+    Moves the cursor past the events returned by read_events(), and records the ids it skips as gaps.
+    """
+    now = time.time()
+    cursor.last_bid_id, cursor.bid_gaps = move(cursor.last_bid_id, cursor.bid_gaps, bids, now)
+    cursor.last_watch_id, cursor.watch_gaps = move(cursor.last_watch_id, cursor.watch_gaps, watches, now)
+    cursor.save()
+
+
+def move(last_id, gaps, events, now):
+    """
+    Returns the position and the gaps of a cursor at last_id with the given gaps, once it has read the events. The gaps
+    are [id, time] pairs of the ids that were missing at that time. Gaps older than EVENT_GAP_TIMEOUT seconds are
+    dropped, since the transactions that would have created them have been rolled back, and so are the oldest gaps
+    beyond EVENT_MAX_GAPS, left by rows deleted before they were read.
+    """
+    read = {event[0] for event in events}
+    gaps = [[pk, since] for pk, since in gaps if pk not in read and since > now - settings.EVENT_GAP_TIMEOUT]
+    if events and events[-1][0] > last_id:
+        # A new cursor has nothing to wait for, every row committed so far has been read
+        if last_id:
+            start = max(last_id + 1, events[-1][0] - settings.EVENT_MAX_GAPS)
+            gaps += [[pk, now] for pk in range(start, events[-1][0]) if pk not in read]
+        last_id = events[-1][0]
+    return last_id, gaps[-settings.EVENT_MAX_GAPS:]
+
+
+def get_gap_ids(gaps):
+    """
+    Returns the ids of the gaps of a cursor that have not expired.
+    """
+    expired = time.time() - settings.EVENT_GAP_TIMEOUT
+    return [pk for pk, since in gaps if since > expired]
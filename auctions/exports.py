@@ -0,0 +1,91 @@
+import csv
+import json
+
+from django.conf import settings
+
+from .models import Bid, Watchlist
+
+# Columns of each export
+COLUMNS = {
+    "bids": ["bid_id", "listing_id", "listing_title", "bidder", "amount"],
+    "watchlists": ["listing_id", "listing_title", "user"],
+}
+
+# Formats of the exports and their content types
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+# First characters that make spreadsheets read a CSV cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@")
+
+
+def get_rows(kind, seller=None, user=None, listing_id=None):
+    """
+    Returns an iterator over the rows of the export as tuples in the order of COLUMNS[kind]. The rows are fetched with
+    a single query in chunks of EXPORT_CHUNK_SIZE, projected to the exported columns, so that no model instances are
+    built and only one chunk is held in memory at a time.
+    Bids can be limited to the listings of a seller and watchlist entries to the watchlist of a user, and both to a
+    single listing.
+    """
+    if kind == "bids":
+        rows = Bid.objects.order_by("pk")
+        if seller is not None:
+            rows = rows.filter(listing__creator=seller)
+        rows = rows.values_list("pk", "listing_id", "listing__title", "bidder__username", "amount")
+    else:
+        rows = Watchlist.listings.through.objects.order_by("pk")
+        if user is not None:
+            rows = rows.filter(watchlist__user=user)
+        rows = rows.values_list("listing_id", "listing__title", "watchlist__user__username")
+
+    if listing_id is not None:
+        rows = rows.filter(listing_id=listing_id)
+    return rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def render(kind, rows, fmt):
+    """
+    Yields the rows as chunks of CSV or JSON Lines text, with a header row for CSV. Each chunk holds up to
+    EXPORT_CHUNK_SIZE rows.
+    """
+    columns = COLUMNS[kind]
+    if fmt == "csv":
+        # The writer writes to the buffer, which returns the line instead of storing it
+        writer = csv.writer(Echo())
+
+        def format_row(row):
+            return writer.writerow([escape_formula(value) for value in row])
+
+        yield format_row(columns)
+    else:
+        def format_row(row):
+            return json.dumps(dict(zip(columns, row)), default=str) + "\n"
+
+    chunk = []
+    for row in rows:
+        chunk.append(format_row(row))
+        if len(chunk) >= settings.EXPORT_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def escape_formula(value):
+    """
+    Prefixes the text values that a spreadsheet would read as a formula, such as titles and usernames chosen by users,
+    with a single quote so that they are shown as text.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, for streaming the output of csv.writer.
+    """
+    def write(self, value):
+        return value
@@ -0,0 +1,364 @@
+"""
+In-memory state of the listings that are being bid on ("hot" listings).
+
+When HOT_LISTINGS_ENABLED is set, bids are validated against the price held in memory under a per-listing lock, and
+accepted bids are written to the Bid table in batches instead of one by one. Every accepted bid is appended to a
+journal file and synced to disk before it is acknowledged, so bids that have not been written to the database yet are
+recovered from the journal after a crash.
+
+The state is held per process, so every bid of a listing must be handled by the same process, e.g. by running a single
+worker process with multiple threads.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Bid, Listing
+from .signals import bid_placed
+
+logger = logging.getLogger(__name__)
+
+
+class HotListing:
+    """
+    Current price, top bidder and bid count of a single listing. The fields are only changed while holding the lock.
+    """
+    def __init__(self, listing, bid_count, top_bidder_id):
+        # Listing the state was loaded from. Only its fields that do not change while it is bid on, such as the initial
+        # bid, are read from it.
+        self.listing = listing
+        self.current_bid = listing.current_bid
+        self.top_bidder_id = top_bidder_id
+        self.bid_count = bid_count
+        self.active = listing.active
+        self.lock = threading.Lock()
+
+    def min_required_bid(self):
+        """
+        Returns the minimum bid accepted by the listing, following the same rule as util.get_listing_data.
+        """
+        if self.bid_count > 1:
+            return round(self.current_bid + Decimal(0.01), 2)
+        return round(self.listing.init_bid, 2)
+
+
+# Hot listings by id, least recently used first
+_listings = OrderedDict()
+# Accepted bids that have not been written to the database yet, as (listing_id, bidder_id, amount, previous_bidder_id)
+_pending = []
+# Time the oldest pending bid was accepted
+_oldest_pending = None
+# Guards _listings, _pending and the journal file
+_lock = threading.RLock()
+# Serializes the flushes so that the bids of a listing are written in the order they were accepted
+_flush_lock = threading.Lock()
+_journal = None
+# Journals moved aside by flushes that have not been written to the database yet
+_flushing = []
+# Ids of the listings whose bids are being written by a flush. They are not evicted until the bids are committed, since
+# reloading them from the database would lose the bids.
+_in_flight = set()
+_recovered = False
+_flusher = None
+
+
+def enabled():
+    """
+    Returns True if bids are handled in memory.
+    """
+    return settings.HOT_LISTINGS_ENABLED
+
+
+def get(listing_id):
+    """
+    Returns the HotListing of the listing, loading it from the database if it is not held in memory.
+    """
+    with _lock:
+        recover()
+        state = _listings.get(listing_id)
+        if state is not None:
+            _listings.move_to_end(listing_id)
+            return state
+
+    # Load the listing outside the lock so that a slow query does not block the other listings
+    listing = Listing.objects.get(pk=listing_id)
+    top_bid = listing.bids.last()
+    state = HotListing(listing, listing.bid_count, top_bid.bidder_id if top_bid else None)
+
+    with _lock:
+        # Another thread may have loaded the listing in the meantime
+        state = _listings.setdefault(listing_id, state)
+        _listings.move_to_end(listing_id)
+        evict()
+    return state
+
+
+def peek(listing_id):
+    """
+    Returns the HotListing of the listing if it is held in memory, otherwise None.
+    """
+    if not enabled():
+        return None
+    with _lock:
+        return _listings.get(listing_id)
+
+
+def place_bid(listing_id, bidder, amount):
+    """
+    Accepts the bid if the listing is active and the amount is at least the minimum required bid. Returns True if the
+    bid has been accepted. An accepted bid is durable once this function returns.
+    """
+    global _oldest_pending
+    # Store the amount with the precision of the database column
+    amount = round(amount, 2)
+    state = get(listing_id)
+    with state.lock:
+        if not state.active or amount < state.min_required_bid():
+            return False
+
+        with _lock:
+            append_to_journal(listing_id, bidder.pk, amount, state.top_bidder_id)
+            _pending.append((listing_id, bidder.pk, amount, state.top_bidder_id))
+            _oldest_pending = _oldest_pending or time.monotonic()
+            batch_full = len(_pending) >= settings.HOT_BID_BATCH_SIZE
+
+        state.current_bid = amount
+        state.top_bidder_id = bidder.pk
+        state.bid_count += 1
+
+    if batch_full:
+        flush()
+    start_flusher()
+    return True
+
+
+def deactivate(listing_id):
+    """
+    Stops accepting bids on the listing and writes its pending bids to the database. Must be called before a listing is
+    closed so that the winner is determined from every accepted bid.
+    """
+    state = peek(listing_id)
+    if state is not None:
+        with state.lock:
+            state.active = False
+    flush()
+
+
+def apply(listing):
+    """
+    Overwrites the current bid, the bid count and the active flag of the listing with the ones held in memory, which may
+    not have been written to the database yet. The bids left in the journal by a previous process are written to the
+    database first, and the listing is read again if there were any.
+    """
+    if enabled() and not _recovered:
+        recover()
+        listing.refresh_from_db(fields=["current_bid", "bid_count", "active", "modified_on"])
+    state = peek(listing.pk)
+    if state is not None:
+        with state.lock:
+            listing.current_bid = state.current_bid
+            listing.bid_count = state.bid_count
+            listing.active = listing.active and state.active
+
+
+def get_bid_count(listing):
+    """
+    Returns the number of bids on the listing, including the accepted bids that have not been written to the database.
+    """
+    state = peek(listing.pk)
+    if state is not None:
+        return state.bid_count
+    return listing.bid_count
+
+
+def flush():
+    """
+    Writes the pending bids to the database in a single transaction and updates the current bid of their listings.
+    """
+    global _oldest_pending
+    # Bids left in the journal by a previous process must be written before a listing is closed
+    recover()
+    with _flush_lock:
+        with _lock:
+            if not _pending:
+                return
+            batch = _pending[:]
+            _pending.clear()
+            _oldest_pending = None
+            _in_flight.update(listing_id for listing_id, _, _, _ in batch)
+            # Move the journal aside so that bids accepted during the flush go to a new journal
+            path = rotate_journal()
+            if path is not None:
+                _flushing.append(path)
+            paths = _flushing[:]
+
+        try:
+            persist(batch)
+        except Exception:
+            # Put the bids back so that they are written by the next flush
+            with _lock:
+                _pending[:0] = batch
+                _oldest_pending = time.monotonic()
+            raise
+        finally:
+            with _lock:
+                _in_flight.clear()
+
+        for path in paths:
+            os.remove(path)
+            _flushing.remove(path)
+
+
+def persist(batch, skip_existing=False):
+    """
+    Writes the bids of the batch to the database and sends bid_placed for each of them. If skip_existing is True, bids
+    that are already in the database are skipped. This is used when replaying a journal, since a crash may have happened
+    after the batch was committed but before its journal was removed.
+    """
+    listings = Listing.objects.in_bulk({listing_id for listing_id, _, _, _ in batch})
+    bids = []
+    for listing_id, bidder_id, amount, previous_bidder_id in batch:
+        # Skip the bids of listings that have been deleted or closed. A closed listing already has its winner.
+        if listing_id not in listings or not listings[listing_id].active:
+            if listing_id in listings:
+                logger.warning("Dropping a bid of %s on the closed listing %d", amount, listing_id)
+            continue
+        # A bidder never bids the same amount twice on a listing since every accepted bid is higher than the last
+        if skip_existing and Bid.objects.filter(listing_id=listing_id, bidder_id=bidder_id, amount=amount).exists():
+            continue
+        bid = Bid(listing=listings[listing_id], bidder_id=bidder_id, amount=amount)
+        previous_bid = Bid(listing=listings[listing_id], bidder_id=previous_bidder_id) if previous_bidder_id else None
+        bids.append((bid, previous_bid))
+
+    with transaction.atomic():
+        Bid.objects.bulk_create([bid for bid, _ in bids])
+
+        # Update the current bid and the bid count of each listing once, with the highest bid of the batch
+        highest, counts = {}, Counter()
+        for bid, _ in bids:
+            highest[bid.listing_id] = max(bid.amount, highest.get(bid.listing_id, bid.amount))
+            counts[bid.listing_id] += 1
+        for listing_id, amount in highest.items():
+            Listing.objects.filter(pk=listing_id).update(current_bid=Greatest("current_bid", Value(amount)),
+                                                         bid_count=F("bid_count") + counts[listing_id],
+                                                         modified_on=timezone.now())
+
+        for bid, previous_bid in bids:
+            bid_placed.send(sender=Bid, bid=bid, previous_bid=previous_bid)
+
+
+def recover():
+    """
+    Writes the bids left in the journal files by a previous process to the database. Runs once per process, at the
+    latest on the first use of the hot listings, or on start up as part of the warm-up, see warmup.py.
+    """
+    global _recovered
+    with _lock:
+        if _recovered:
+            return
+
+        paths = sorted(glob.glob(f"{settings.HOT_BID_JOURNAL}.*")) + [settings.HOT_BID_JOURNAL]
+        batch = []
+        for path in paths:
+            if os.path.exists(path):
+                with open(path) as journal:
+                    for line in journal:
+                        # Ignore a partially written last line. Its bid was never acknowledged.
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        batch.append((entry["listing"], entry["bidder"], Decimal(entry["amount"]),
+                                      entry.get("previous")))
+
+        if batch:
+            logger.warning("Recovering %d bid(s) from the hot listing journal", len(batch))
+            persist(batch, skip_existing=True)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        _recovered = True
+
+
+def append_to_journal(listing_id, bidder_id, amount, previous_bidder_id):
+    """
+    Appends an accepted bid, along with the bidder it outbids, to the journal and syncs it to disk. Must be called while
+    holding _lock.
+    """
+    global _journal
+    if _journal is None:
+        _journal = open(settings.HOT_BID_JOURNAL, "a")
+    _journal.write(json.dumps({"listing": listing_id, "bidder": bidder_id, "amount": str(amount),
+                               "previous": previous_bidder_id}) + "\n")
+    _journal.flush()
+    os.fsync(_journal.fileno())
+
+
+def rotate_journal():
+    """
+    Renames the journal so that new bids are appended to a new journal and returns the new path of the old journal, or
+    None if there is no journal. Must be called while holding _lock.
+    """
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+    if not os.path.exists(settings.HOT_BID_JOURNAL):
+        return None
+    path = f"{settings.HOT_BID_JOURNAL}.{time.time_ns()}"
+    os.rename(settings.HOT_BID_JOURNAL, path)
+    return path
+
+
+def evict():
+    """
+    Removes the least recently used listings that have no pending or in-flight bids once more than HOT_LISTINGS_MAX
+    listings are held.
+    Must be called while holding _lock.
+    """
+    pending_ids = {listing_id for listing_id, _, _, _ in _pending} | _in_flight
+    for listing_id in list(_listings):
+        if len(_listings) <= settings.HOT_LISTINGS_MAX:
+            break
+        if listing_id not in pending_ids:
+            del _listings[listing_id]
+
+
+def start_flusher():
+    """
+    Starts the background thread that writes the pending bids once the oldest of them is older than
+    HOT_BID_FLUSH_INTERVAL seconds.
+    """
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=run_flusher, name="hot-bid-flusher", daemon=True)
+            _flusher.start()
+
+
+def run_flusher():
+    """
+    Body of the background flush thread.
+    """
+    while True:
+        time.sleep(settings.HOT_BID_FLUSH_INTERVAL / 2)
+        oldest = _oldest_pending
+        if oldest is not None and time.monotonic() - oldest >= settings.HOT_BID_FLUSH_INTERVAL:
+            try:
+                flush()
+            except Exception:
+                # The bids are still in the journal and are recovered on the next start
+                logger.exception("Failed to write the pending bids")
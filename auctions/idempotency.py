@@ -0,0 +1,72 @@
+import time
+from functools import wraps
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseRedirect
+
+# Name of the hidden form field holding the idempotency key of a submission
+KEY_FIELD = "idempotency_key"
+
+# Cache value of a key whose submission is still being processed
+IN_PROGRESS = "in-progress"
+
+# Seconds between two checks of a submission that is being processed by another request
+POLL_INTERVAL = 0.05
+
+
+def idempotent(view):
+    """
+    Decorator for views that handle form submissions carrying an idempotency key. The first POST with a key claims it
+    and runs the view. If the view redirects, i.e. the submission was accepted, the redirect is stored under the key
+    for IDEMPOTENCY_KEY_TIMEOUT seconds and retries of the submission, e.g. double clicks and resubmitted forms, are
+    redirected to the same page without running the view again. Submissions that are rejected release the key so that
+    the corrected form can be submitted again.
+    A retry that arrives while the first submission is being processed waits up to IDEMPOTENCY_WAIT seconds for its
+    outcome.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = get_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+
+        # Keys are only unique per user and view
+        cache_key = f"idempotency:{view.__name__}:{request.user.pk}:{key}"
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        while not cache.add(cache_key, IN_PROGRESS, settings.IDEMPOTENCY_KEY_TIMEOUT):
+            outcome = cache.get(cache_key)
+            if outcome is not None and outcome != IN_PROGRESS:
+                # The submission has already been accepted
+                return HttpResponseRedirect(outcome)
+            if outcome == IN_PROGRESS:
+                if time.monotonic() >= deadline:
+                    return HttpResponse("This form is already being submitted.", status=409)
+                time.sleep(POLL_INTERVAL)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        if isinstance(response, HttpResponseRedirect):
+            # Remember the outcome of the accepted submission
+            cache.set(cache_key, response.url, settings.IDEMPOTENCY_KEY_TIMEOUT)
+        else:
+            cache.delete(cache_key)
+        return response
+    return wrapper
+
+
+def get_key(request):
+    """
+    Returns the idempotency key of a POST request, or None if the request has no valid key.
+    """
+    if request.method != "POST":
+        return None
+    try:
+        return UUID(request.POST.get(KEY_FIELD, ""))
+    except ValueError:
+        return None
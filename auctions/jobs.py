@@ -0,0 +1,124 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Handlers of the job kinds, populated by the register decorator
+handlers = {}
+
+
+def register(kind):
+    """
+    Decorator that registers a handler for the given job kind. The handler is called with the list of payloads of a
+    batch of jobs of that kind and yields, for each payload in order, None once the job is done or the exception it
+    failed with. Each job is deleted or retried as soon as its result is yielded, so that the jobs done before a failure
+    are not run again. If the handler raises an exception, the jobs without a result are retried.
+    """
+    def decorator(func):
+        handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload, coalesce_key="", delay=0):
+    """
+    Creates a job that becomes due after delay seconds. If coalesce_key is given and a job with the same key is still
+    waiting to be claimed, that job's payload is replaced instead and no new job is created. Since the waiting job keeps
+    its original due time, every job enqueued with the same key within the delay is delivered as a single job.
+    """
+    if coalesce_key:
+        # The unique constraint on the key of the waiting jobs makes a concurrent enqueue fail to create a second job,
+        # in which case it merges into the job created by the other one
+        while True:
+            try:
+                with transaction.atomic():
+                    if Job.objects.filter(coalesce_key=coalesce_key, status=Job.PENDING, claim="").update(
+                            payload=payload):
+                        return
+                    Job.objects.create(kind=kind, payload=payload, coalesce_key=coalesce_key,
+                                       run_after=timezone.now() + timedelta(seconds=delay))
+                    return
+            except IntegrityError:
+                continue
+    else:
+        Job.objects.create(kind=kind, payload=payload, run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def claim_jobs(batch_size):
+    """
+    Claims up to batch_size due jobs and returns them. The claim is done with a single conditional UPDATE, so jobs
+    claimed concurrently by another worker are skipped. Claimed jobs are leased for JOB_LEASE seconds, after which they
+    become due again if they have not been completed.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+    ids = list(due.order_by("run_after").values_list("pk", flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    due.filter(pk__in=ids).update(claim=token, attempts=F("attempts") + 1,
+                                  run_after=now + timedelta(seconds=settings.JOB_LEASE))
+    return list(Job.objects.filter(claim=token))
+
+
+def run_pending(batch_size=None):
+    """
+    Claims a batch of due jobs and runs them grouped by kind. Completed jobs are deleted one by one as the handler
+    completes them. Failed jobs are retried with an exponential backoff until they reach JOB_MAX_ATTEMPTS, at which
+    point they are marked as failed. Returns the number of jobs claimed.
+    """
+    jobs = claim_jobs(batch_size or settings.JOB_BATCH_SIZE)
+
+    # Group the jobs by kind so that each handler is called once per batch
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job.kind, []).append(job)
+
+    for kind, group in groups.items():
+        done = 0
+        try:
+            if kind not in handlers:
+                raise LookupError(f"No handler registered for job kind '{kind}'")
+            for job, error in zip(group, handlers[kind]([job.payload for job in group])):
+                done += 1
+                if error is None:
+                    job.delete()
+                else:
+                    logger.error("Job %s of kind '%s' failed: %r", job.pk, kind, error)
+                    retry(job, error)
+            if done < len(group):
+                raise RuntimeError(f"The handler of job kind '{kind}' returned {done} results for {len(group)} jobs")
+        except Exception as e:
+            logger.exception("Job batch of kind '%s' failed", kind)
+            for job in group[done:]:
+                retry(job, e)
+
+    return len(jobs)
+
+
+def retry(job, error):
+    """
+    Releases a failed job so that it is claimed again after the backoff, or marks it as failed if it has run out of
+    attempts.
+    """
+    job.claim = ""
+    job.last_error = repr(error)
+    if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+        job.status = Job.FAILED
+    else:
+        job.run_after = timezone.now() + timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+    try:
+        with transaction.atomic():
+            job.save(update_fields=["claim", "last_error", "status", "run_after"])
+    except IntegrityError:
+        # A job with the same coalesce key has been enqueued while this one was claimed, and replaces it
+        job.delete()
@@ -0,0 +1,45 @@
+import re
+
+from django.template.loaders.app_directories import Loader
+
+# Elements whose content is kept as written since whitespace is significant in them
+PRESERVED = re.compile(r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.IGNORECASE | re.DOTALL)
+
+
+class MinifyingLoader(Loader):
+    """
+    Template loader that loads the templates of the installed apps like the app_directories loader and strips the
+    indentation and blank lines of the HTML templates before they are compiled. The whitespace is removed once per
+    compiled template instead of from every response, and the compiled templates are cached by the cached loader.
+    """
+    def get_contents(self, origin):
+        contents = super().get_contents(origin)
+        if origin.name.endswith(".html"):
+            return minify(contents)
+        return contents
+
+
+def minify(source):
+    """
+    Returns the HTML source without leading and trailing whitespace on its lines and without blank lines. Line breaks
+    are kept, so whitespace between inline elements still renders as a space. The content of pre, textarea, script and
+    style elements is left untouched.
+    """
+    parts = PRESERVED.split(source)
+    minified = []
+    # split() returns the text between the preserved elements, each preserved element and its tag name in turn
+    for i in range(0, len(parts), 3):
+        lines = (line.strip() for line in parts[i].splitlines())
+        text = "\n".join(line for line in lines if line)
+        # Keep a line break next to the preserved elements if there was whitespace
+        if text and parts[i][:1].isspace() and i > 0:
+            text = "\n" + text
+        if text and parts[i][-1:].isspace() and i + 1 < len(parts):
+            text += "\n"
+        # Whitespace between two preserved elements renders as a space as well
+        if not text and parts[i] and 0 < i < len(parts) - 1:
+            text = "\n"
+        minified.append(text)
+        if i + 1 < len(parts):
+            minified.append(parts[i + 1])
+    return "".join(minified)
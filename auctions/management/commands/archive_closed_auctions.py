@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions import archive
+
+
+class Command(BaseCommand):
+    """
+    Moves the listings closed longer than --days ago, along with their bids, comments and watchlist entries, to the
+    archive tables. Each batch of listings is moved in its own transactions so that the live tables are only locked
+    briefly. The archived listings are still displayed on their listing pages. Run it periodically, e.g. from cron.
+    """
+    help = "Moves the listings closed longer than the given number of days ago to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="Archive the listings closed longer than this ago.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of listings moved per transaction.")
+
+    def handle(self, *args, **options):
+        closed_before = timezone.now() - timedelta(days=options["days"])
+        archived = 0
+        while True:
+            listing_ids = archive.get_archivable_listings(closed_before, options["batch_size"])
+            if not listing_ids:
+                break
+            batch = archive.archive_listings(listing_ids)
+            # The listings that changed while they were copied are left for the next run
+            if not batch:
+                break
+            archived += batch
+            self.stdout.write(f"Archived {archived} listings")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, archived {archived} listings"))
@@ -0,0 +1,92 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auctions.autocomplete import PrefixIndex
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    """
+    Measures the autocomplete index on --titles generated titles: the time and memory it takes to build it, the latency
+    of looking up prefixes of 2 to 6 characters and of adding and removing titles. With --database, also measures the
+    title__istartswith query the index replaces, on the listings of the database.
+    """
+    help = "Measures the build time, memory and lookup latency of the autocomplete index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--titles", type=int, default=1000000, help="Number of generated titles.")
+        parser.add_argument("--lookups", type=int, default=10000, help="Number of lookups per prefix length.")
+        parser.add_argument("--database", action="store_true",
+                            help="Also measure the title__istartswith query on the listings of the database.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random titles.")
+
+    def handle(self, *args, **options):
+        generator = random.Random(options["seed"])
+        # Titles of 2 to 5 words from a vocabulary of made up words, which makes most short prefixes very common
+        vocabulary = ["".join(generator.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(generator.randint(3, 9)))
+                      for _ in range(20000)]
+        titles = [" ".join(generator.choices(vocabulary, k=generator.randint(2, 5))).capitalize()
+                  for _ in range(options["titles"])]
+
+        start = time.perf_counter()
+        index = PrefixIndex(options["titles"])
+        index.load(enumerate(titles, 1))
+        elapsed = time.perf_counter() - start
+        # Build it again to measure its memory, since tracing the allocations slows the build down. Copy the titles so
+        # that they are counted, as the titles read from the database are only referenced by the index.
+        tracemalloc.start()
+        index = PrefixIndex(options["titles"])
+        index.load((listing_id, title.encode().decode()) for listing_id, title in enumerate(titles, 1))
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"Built the index of {len(index)} titles in {elapsed:.2f} s, "
+                          f"{size / 1e6:.0f} MB ({size / len(index):.0f} bytes per title)")
+
+        self.stdout.write(f"{'prefix':>8} {'results':>8} {'p50 us':>8} {'p99 us':>8}")
+        for length in range(2, 7):
+            prefixes = [generator.choice(titles)[:length] for _ in range(options["lookups"])]
+            times, results = measure(lambda prefix: index.search(prefix, settings.AUTOCOMPLETE_LIMIT), prefixes)
+            self.stdout.write(f"{length:8} {statistics.mean(map(len, results)):8.1f} {percentile(times, 50):8.1f} "
+                              f"{percentile(times, 99):8.1f}")
+
+        # New listings are added to and closed listings removed from the middle of the sorted array
+        new_ids = range(len(titles) + 1, len(titles) + 1 + min(1000, options["lookups"]))
+        times, _ = measure(lambda listing_id: index.add(listing_id, generator.choice(titles) + " new"), new_ids)
+        self.stdout.write(f"add:    p50 {percentile(times, 50):.1f} us, p99 {percentile(times, 99):.1f} us")
+        times, _ = measure(index.remove, new_ids)
+        self.stdout.write(f"remove: p50 {percentile(times, 50):.1f} us, p99 {percentile(times, 99):.1f} us")
+
+        if options["database"]:
+            listings = Listing.objects.filter(active=True)
+            prefixes = [title[:3] for title in listings.values_list("title", flat=True)[:100]]
+            times, _ = measure(lambda prefix: list(listings.filter(title__istartswith=prefix).order_by("title")
+                                                  .values_list("pk", "title")[:settings.AUTOCOMPLETE_LIMIT]),
+                               prefixes)
+            self.stdout.write(f"title__istartswith on {listings.count()} listings: p50 {percentile(times, 50):.1f} us, "
+                              f"p99 {percentile(times, 99):.1f} us")
+
+
+def measure(function, arguments):
+    """
+    Calls the function with each of the arguments. Returns the microseconds each call took and the results.
+    """
+    times, results = [], []
+    for argument in arguments:
+        start = time.perf_counter()
+        result = function(argument)
+        times.append((time.perf_counter() - start) * 1e6)
+        results.append(result)
+    return times, results
+
+
+def percentile(values, percent):
+    """
+    Returns the given percentile of the values.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
@@ -0,0 +1,81 @@
+import itertools
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Avg, Count
+from django.test import RequestFactory
+
+from auctions import util, views
+from auctions.models import Category, Listing
+
+
+class Command(BaseCommand):
+    """
+    Renders the browse page for every supported filter and sort combination and reports the median time along with the
+    query plan of the listings and facet queries. Seed the database first, see seed_auctions.
+    """
+    help = "Measures the browse page for every filter and sort combination."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Number of renders per combination.")
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        category = Category.objects.first()
+        # Use a price range around the average price so that the filter is selective
+        average = Listing.objects.aggregate(average=Avg("current_bid"))["average"] or 0
+        price_range = (round(average * 9 / 10, 2), round(average * 11 / 10, 2))
+
+        self.stdout.write(f"{Listing.objects.count()} listings")
+        combinations = itertools.product(util.LISTING_ORDERINGS, [None, category], [None, price_range], [False, True])
+        for sort, filter_category, prices, has_image in combinations:
+            params = {"sort": sort}
+            if filter_category is not None:
+                params["category"] = filter_category.pk
+            if prices is not None:
+                params["min_price"], params["max_price"] = prices
+            if has_image:
+                params["has_image"] = "on"
+
+            # Render the page for a logged out user, bypassing the page cache
+            request = factory.get("/", params)
+            request.user = AnonymousUser()
+            times = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                views.render_listings(request, "Active Listings", Listing.objects.filter(active=True))
+                times.append(time.perf_counter() - start)
+
+            # Build the same queries as the view to explain them
+            form = views.ListingFilterForm(params)
+            form.is_valid()
+            listings = util.filter_listings(Listing.objects.filter(active=True), form.cleaned_data)
+            facets = listings.order_by().values("category").annotate(total=Count("pk"))
+            if filter_category is not None:
+                listings = listings.filter(category=filter_category)
+
+            label = " ".join(f"{key}={value}" for key, value in params.items())
+            self.stdout.write(f"{label:60} {statistics.median(times) * 1000:8.1f} ms  "
+                              f"listings: {summarize_plan(listings[:util.LISTINGS_PER_PAGE].explain())}  "
+                              f"facets: {summarize_plan(facets.explain())}")
+
+
+def summarize_plan(plan):
+    """
+    Returns the index used by a query plan, or FULL SCAN if the plan reads the whole listings table.
+    """
+    table = Listing._meta.db_table
+    if connection.vendor == "sqlite":
+        summary = "FULL SCAN"
+        for line in plan.splitlines():
+            if table in line and "USING" in line:
+                summary = line.split("USING", 1)[1].split("(")[0].replace("COVERING", "").replace("INDEX", "").strip()
+        if "TEMP B-TREE" in plan:
+            summary += " + sort"
+        return summary
+    elif connection.vendor == "postgresql" and f"Seq Scan on {table}" in plan:
+        return "FULL SCAN"
+    return plan.splitlines()[0].strip()
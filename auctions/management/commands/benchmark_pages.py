@@ -0,0 +1,88 @@
+import gzip
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from auctions import compression
+from auctions.models import Comment, Listing, User
+
+
+class Command(BaseCommand):
+    """
+    Measures the size and render time of the largest pages with and without the template minification, the size and
+    time of compressing them with gzip and brotli, and the time to send each variant at --bandwidth. Pages are
+    requested as a logged in user so that they are rendered rather than served from the page cache. Seed the database
+    first, see seed_auctions.
+    """
+    help = "Measures the byte and latency savings of the template minification and the response compression."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Number of requests per page.")
+        parser.add_argument("--bandwidth", type=float, default=2.0,
+                            help="Bandwidth in Mbit/s used to estimate the transfer time of the pages.")
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by("pk").first()
+        # The listing with the most comments has the largest listing page
+        listing = Listing.objects.order_by("-comment_count").first()
+        if user is None or listing is None:
+            self.stderr.write("Seed the database first, see seed_auctions")
+            return
+        pages = ["/", "/?sort=price_asc", f"/category/{listing.category_id}" if listing.category_id else "/categories",
+                 f"/item/{listing.pk}"]
+        self.stdout.write(f"Listing {listing.pk} has {Comment.objects.filter(listing=listing).count()} comments")
+
+        plain_loaders = ["django.template.loaders.app_directories.Loader"]
+        minifying_loaders = ["auctions.loaders.MinifyingLoader"]
+        # Milliseconds to transfer a byte at the given bandwidth
+        transfer = 8 / (options["bandwidth"] * 1e6) * 1000
+        self.stdout.write(f"{'page':30} {'template':9} {'bytes':>8} {'render ms':>10} {'send ms':>8} {'gzip':>8} "
+                          f"{'gzip ms':>8} {'send ms':>8} {'br':>8} {'br ms':>8} {'send ms':>8}")
+        for page in pages:
+            for label, loaders in [("plain", plain_loaders), ("minified", minifying_loaders)]:
+                # Use the cached loader so that the templates are compiled once, as in production
+                templates = [{**settings.TEMPLATES[0],
+                              "OPTIONS": {**settings.TEMPLATES[0]["OPTIONS"],
+                                          "loaders": [("django.template.loaders.cached.Loader", loaders)]}}]
+                # The test client sends its requests to the host "testserver"
+                with override_settings(TEMPLATES=templates, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                    client = Client()
+                    client.force_login(user)
+                    # Warm up the template cache
+                    response = client.get(page)
+                    if response.status_code != 200:
+                        self.stderr.write(f"{page} returned {response.status_code}")
+                        return
+                    content = response.content
+                    times = []
+                    for _ in range(options["repeat"]):
+                        start = time.perf_counter()
+                        client.get(page)
+                        times.append(time.perf_counter() - start)
+
+                gzipped, gzip_time = measure(lambda: gzip.compress(content, compresslevel=settings.GZIP_LEVEL))
+                row = (f"{page:30} {label:9} {len(content):8} {statistics.median(times) * 1000:10.2f} "
+                       f"{len(content) * transfer:8.1f} {len(gzipped):8} {gzip_time * 1000:8.2f} "
+                       f"{len(gzipped) * transfer:8.1f}")
+                if compression.brotli is not None:
+                    compressed, brotli_time = measure(
+                        lambda: compression.brotli.compress(content, quality=settings.BROTLI_QUALITY))
+                    row += f" {len(compressed):8} {brotli_time * 1000:8.2f} {len(compressed) * transfer:8.1f}"
+                else:
+                    row += f" {'n/a':>8} {'n/a':>8} {'n/a':>8}"
+                self.stdout.write(row)
+
+
+def measure(function, repeat=20):
+    """
+    Returns the result of the function and the median seconds it takes.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
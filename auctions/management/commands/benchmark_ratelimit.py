@@ -0,0 +1,54 @@
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from auctions import ratelimit
+
+
+class Command(BaseCommand):
+    """
+    Measures the time the rate limiter adds to each request, for every backend. A view that does nothing is requested
+    with and without the rate_limit decorator, by --users distinct users from --addresses distinct addresses, so that
+    the limits are not reached and every request does the full work of an accepted request.
+    """
+    help = "Measures the per-request overhead of the rate limiter."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100000, help="Number of requests per backend.")
+        parser.add_argument("--users", type=int, default=1000, help="Number of distinct users.")
+        parser.add_argument("--addresses", type=int, default=1000, help="Number of distinct client addresses.")
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        requests = []
+        for i in range(options["requests"]):
+            request = factory.post("/", REMOTE_ADDR=f"10.0.{i % options['addresses'] // 256}.{i % 256}")
+            # The rate limiter only reads the primary key of the user
+            request.user = SimpleNamespace(pk=i % options["users"], is_authenticated=True)
+            requests.append(request)
+
+        def view(request, listing_id):
+            return HttpResponse()
+
+        # Limits that are never reached
+        limits = {"view": {scope: (options["requests"] + 1, 60) for scope in ["user", "ip", "listing"]}}
+        baseline = measure(view, requests)
+        self.stdout.write(f"{'no rate limit':50} {baseline * 1e6:8.2f} us/request")
+        for backend in ["auctions.ratelimit.MemoryBackend", "auctions.ratelimit.CacheBackend"]:
+            with override_settings(RATE_LIMITS=limits, RATE_LIMIT_BACKEND=backend):
+                elapsed = measure(ratelimit.rate_limit(view), requests)
+            self.stdout.write(f"{backend:50} {elapsed * 1e6:8.2f} us/request "
+                              f"(+{(elapsed - baseline) * 1e6:.2f} us)")
+
+
+def measure(view, requests):
+    """
+    Returns the average seconds per request of the view over the requests.
+    """
+    start = time.perf_counter()
+    for i, request in enumerate(requests):
+        view(request, listing_id=i % 100)
+    return (time.perf_counter() - start) / len(requests)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions import similarity
+
+
+class Command(BaseCommand):
+    """
+    Worker that keeps the similar listings up to date. Each update adds the bid and watch events since the previous
+    update to the similarities, see auctions/similarity.py.
+    """
+    help = "Builds the similar listings from the new bid and watch events."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Update once and exit.")
+        parser.add_argument("--rebuild", action="store_true", help="Rebuild the similarities from every event.")
+        parser.add_argument("--batch-size", type=int, help="Maximum number of events read at a time.")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between two updates.")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            similarity.rebuild()
+        while True:
+            processed = similarity.update(options["batch_size"])
+            if processed:
+                self.stdout.write(f"Processed {processed} event(s)")
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
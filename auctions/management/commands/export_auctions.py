@@ -0,0 +1,80 @@
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions import exports
+from auctions.models import User
+
+
+class Command(BaseCommand):
+    """
+    Writes an export of the bids or the watchlist entries as CSV or JSON Lines, streamed from the database in chunks.
+    With --measure, reports the throughput and the peak memory of the process. --trace-memory also reports the peak
+    memory allocated by the export itself, measured with tracemalloc, which slows the export down several times.
+    """
+    help = "Exports the bids or the watchlist entries as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(exports.COLUMNS), help="What to export.")
+        parser.add_argument("--format", choices=list(exports.CONTENT_TYPES), default="csv", help="Output format.")
+        parser.add_argument("--output", help="File to write to. Defaults to the standard output.")
+        parser.add_argument("--user", help="Only export the bids on the listings or the watchlist of this user.")
+        parser.add_argument("--listing", type=int, help="Only export the rows of this listing.")
+        parser.add_argument("--measure", action="store_true",
+                            help="Report the rows per second and the peak memory on the standard error.")
+        parser.add_argument("--trace-memory", action="store_true",
+                            help="Also report the peak memory allocated by the export. Slows the export down.")
+
+    def handle(self, *args, **options):
+        scope = {}
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+            scope = {"seller": user, "user": user}
+
+        if options["trace_memory"]:
+            tracemalloc.start()
+        start = time.perf_counter()
+
+        # Count the rows as they pass through
+        counter = {"rows": 0}
+
+        def count(rows):
+            for row in rows:
+                counter["rows"] += 1
+                yield row
+
+        rows = count(exports.get_rows(options["kind"], listing_id=options["listing"], **scope))
+        output = open(options["output"], "w", newline="") if options["output"] else sys.stdout
+        written = 0
+        try:
+            for chunk in exports.render(options["kind"], rows, options["format"]):
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+
+        if options["measure"] or options["trace_memory"]:
+            elapsed = time.perf_counter() - start
+            report = (f"{counter['rows']} rows, {written / 1e6:.1f} MB in {elapsed:.2f} s, "
+                      f"{counter['rows'] / elapsed:.0f} rows/s")
+            if resource is not None:
+                # Kilobytes on Linux, bytes on macOS
+                max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                report += f", peak process memory {max_rss / (1e6 if sys.platform == 'darwin' else 1e3):.1f} MB"
+            if options["trace_memory"]:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                report += f", peak allocated by the export {peak / 1e6:.2f} MB"
+            self.stderr.write(report)
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions import jobs
+
+
+class Command(BaseCommand):
+    """
+    Worker that processes the background jobs, such as outbid and auction won notifications.
+    """
+    help = "Processes due background jobs in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process the due jobs and exit.")
+        parser.add_argument("--batch-size", type=int, help="Maximum number of jobs claimed at a time.")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds to sleep when there are no due jobs.")
+
+    def handle(self, *args, **options):
+        while True:
+            # Keep claiming batches while there are due jobs
+            processed = jobs.run_pending(options["batch_size"])
+            if processed:
+                self.stdout.write(f"Processed {processed} job(s)")
+                continue
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,85 @@
+import os
+import pstats
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auctions import profiling
+
+
+class Command(BaseCommand):
+    """
+    Summarises the request profiles written by ProfilingMiddleware. For each view, prints the functions with the most
+    time across all of its profiles and the stacks that spent the most time on SQL queries. Times are averaged per
+    profiled request.
+    """
+    help = "Summarises the hottest functions and SQL queries per view across the collected request profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=settings.PROFILE_DIR, help="Directory holding the profiles.")
+        parser.add_argument("--view", help="Only summarise the profiles of this view.")
+        parser.add_argument("--limit", type=int, default=15, help="Number of functions and queries per view.")
+        parser.add_argument("--sort", choices=["tottime", "cumtime"], default="tottime",
+                            help="Rank the functions by their own time or including the functions they call.")
+
+    def handle(self, *args, **options):
+        # Group the profiles by view
+        profiles = defaultdict(list)
+        if os.path.isdir(options["dir"]):
+            for filename in sorted(os.listdir(options["dir"])):
+                if filename.endswith(profiling.STATS_EXTENSION):
+                    name = filename[:-len(profiling.STATS_EXTENSION)]
+                    view_name = profiling.parse_name(name)
+                    if options["view"] is None or options["view"] == view_name:
+                        profiles[view_name].append(os.path.join(options["dir"], name))
+        if not profiles:
+            self.stdout.write(f"No profiles found in {options['dir']}")
+            return
+
+        for view_name, paths in sorted(profiles.items()):
+            count = len(paths)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{view_name} ({count} profiles)"))
+
+            # Merge the cProfile stats of the view. Each entry is (primitive calls, calls, own time, cumulative time).
+            stats = pstats.Stats(*(path + profiling.STATS_EXTENSION for path in paths))
+            column = 2 if options["sort"] == "tottime" else 3
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:options["limit"]]
+            self.stdout.write(f"  {'calls':>10} {'tottime ms':>11} {'cumtime ms':>11}  function")
+            for (filename, line, function), (_, calls, tottime, cumtime, _) in rows:
+                self.stdout.write(f"  {calls / count:10.1f} {tottime * 1000 / count:11.2f} "
+                                  f"{cumtime * 1000 / count:11.2f}  {short_path(filename)}:{line}({function})")
+
+            # Add up the time of the SQL queries per calling stack
+            queries = Counter()
+            for path in paths:
+                queries.update(read_stacks(path + profiling.SQL_EXTENSION))
+            if queries:
+                self.stdout.write(f"  {'SQL ms':>10}  stack")
+                for stack, micros in queries.most_common(options["limit"]):
+                    self.stdout.write(f"  {micros / 1000 / count:10.2f}  {stack}")
+
+
+def read_stacks(path):
+    """
+    Returns the counts of the stacks in a collapsed stack file.
+    """
+    stacks = Counter()
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                stacks[stack] += int(count)
+    return stacks
+
+
+def short_path(filename):
+    """
+    Returns the path of a source file relative to BASE_DIR or to site-packages, whichever it is in.
+    """
+    filename = str(filename)
+    if filename.startswith(str(settings.BASE_DIR)):
+        return os.path.relpath(filename, settings.BASE_DIR)
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[1]
+    return filename
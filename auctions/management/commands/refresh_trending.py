@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions import trending
+
+
+class Command(BaseCommand):
+    """
+    Worker that keeps the trending scores of the listings up to date. Each refresh adds the bid and watch events since
+    the previous refresh to the scores and prunes the scores of closed and inactive listings.
+    """
+    help = "Refreshes the trending listings from the new bid and watch events."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Refresh once and exit.")
+        parser.add_argument("--batch-size", type=int, help="Maximum number of events read at a time.")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between two refreshes.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = trending.refresh(options["batch_size"])
+            pruned = trending.prune()
+            if processed or pruned:
+                self.stdout.write(f"Processed {processed} event(s), pruned {pruned} score(s)")
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
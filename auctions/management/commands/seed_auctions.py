@@ -0,0 +1,109 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from auctions.models import User, Category, Listing, Bid, Comment, Watchlist
+
+
+class Command(BaseCommand):
+    """
+    Fills the database with generated users, categories, listings, bids, comments and watchlists for benchmarks. Run
+    it against a scratch database, e.g. by pointing DATABASES to a copy of db.sqlite3.
+    """
+    help = "Seeds the database with generated auction data for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=100000, help="Number of listings.")
+        parser.add_argument("--users", type=int, default=1000, help="Number of users.")
+        parser.add_argument("--categories", type=int, default=20, help="Number of categories.")
+        parser.add_argument("--bids", type=int, default=5, help="Maximum number of bids per listing.")
+        parser.add_argument("--comments", type=int, default=3, help="Maximum number of comments per listing.")
+        parser.add_argument("--watches", type=int, default=10, help="Maximum number of watched listings per user.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Number of rows inserted per query.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random number generator.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        now = timezone.now()
+
+        with transaction.atomic():
+            # Users share a single password hash since hashing is slow
+            password = User(username="seed")
+            password.set_password("password")
+            first_user = User.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+            User.objects.bulk_create(
+                [User(username=f"seed{first_user + i}", email=f"seed{first_user + i}@example.com",
+                      password=password.password) for i in range(options["users"])], batch_size=batch_size)
+            users = list(User.objects.filter(username__startswith="seed").values_list("pk", flat=True))
+
+            Category.objects.bulk_create([Category(name=f"Category {i}") for i in range(options["categories"])])
+            categories = list(Category.objects.values_list("pk", flat=True))
+
+            # Create the listings in batches along with their bids and comments
+            created = 0
+            while created < options["listings"]:
+                count = min(batch_size, options["listings"] - created)
+                listings = []
+                for i in range(count):
+                    init_bid = Decimal(rng.randint(100, 100000)) / 100
+                    listings.append(Listing(
+                        title=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {created + i}",
+                        description=" ".join(rng.choice(NOUNS) for _ in range(30)),
+                        init_bid=init_bid, current_bid=init_bid,
+                        url=f"https://example.com/{created + i}.jpg" if rng.random() < 0.5 else "",
+                        active=rng.random() < 0.9, creator_id=rng.choice(users),
+                        category_id=rng.choice(categories) if rng.random() < 0.9 else None,
+                        created_on=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))))
+                listings = Listing.objects.bulk_create(listings)
+                # bulk_create only sets the primary keys on some databases
+                if listings[0].pk is None:
+                    listings = list(Listing.objects.order_by("-pk")[:count])[::-1]
+
+                bids, comments = [], []
+                for listing in listings:
+                    bids.append(Bid(listing=listing, amount=listing.init_bid, bidder_id=listing.creator_id))
+                    listing.bid_count = 1
+                    for _ in range(rng.randint(0, options["bids"])):
+                        listing.current_bid += Decimal(rng.randint(1, 1000)) / 100
+                        bids.append(Bid(listing=listing, amount=listing.current_bid, bidder_id=rng.choice(users)))
+                        listing.bid_count += 1
+                    listing.comment_count = rng.randint(0, options["comments"])
+                    for _ in range(listing.comment_count):
+                        comments.append(Comment(listing=listing, user_id=rng.choice(users),
+                                                content=" ".join(rng.choice(NOUNS) for _ in range(20))))
+                    if not listing.active:
+                        listing.winner_id = bids[-1].bidder_id
+
+                Bid.objects.bulk_create(bids, batch_size=batch_size)
+                Comment.objects.bulk_create(comments, batch_size=batch_size)
+                Listing.objects.bulk_update(listings, ["current_bid", "bid_count", "comment_count", "winner"],
+                                            batch_size=batch_size)
+                created += count
+                self.stdout.write(f"Created {created} listings")
+
+            # Give each user a watchlist of random listings
+            listing_ids = list(Listing.objects.values_list("pk", flat=True))
+            with_watchlist = set(Watchlist.objects.values_list("user_id", flat=True))
+            Watchlist.objects.bulk_create([Watchlist(user_id=user) for user in users if user not in with_watchlist])
+            watchlists = Watchlist.objects.filter(user_id__in=users)
+            Watchlist.listings.through.objects.bulk_create(
+                [Watchlist.listings.through(watchlist_id=watchlist.pk, listing_id=listing_id)
+                 for watchlist in watchlists
+                 for listing_id in set(rng.sample(listing_ids, min(len(listing_ids),
+                                                                   rng.randint(0, options["watches"]))))],
+                batch_size=batch_size, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+
+ADJECTIVES = ["Vintage", "Antique", "Rare", "New", "Used", "Handmade", "Signed", "Limited", "Classic", "Modern",
+              "Wooden", "Silver", "Golden", "Leather", "Ceramic", "Electric", "Retro", "Mint", "Large", "Small"]
+
+NOUNS = ["watch", "camera", "guitar", "lamp", "chair", "table", "book", "poster", "vase", "ring", "bicycle", "radio",
+         "painting", "mirror", "clock", "jacket", "record", "sculpture", "telescope", "typewriter", "keyboard", "rug",
+         "teapot", "globe", "coin", "stamp", "doll", "helmet", "compass", "lantern"]
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from auctions import warmup
+from auctions.models import Listing, User
+
+
+class Command(BaseCommand):
+    """
+    Runs the warm-up of auctions/warmup.py and prints the duration of each phase. With --requests, then measures the
+    first two requests to the main pages as a logged in user, so that running it with and without --skip shows what the
+    warm-up saves the first requests of a worker.
+    """
+    help = "Warms up the process and prints the duration of each phase."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--phase", action="append", choices=list(warmup.PHASES),
+                            help="Phase to run. Can be repeated. Defaults to every phase.")
+        parser.add_argument("--skip", action="store_true", help="Skip the warm-up, e.g. to measure cold requests.")
+        parser.add_argument("--requests", action="store_true", help="Measure the first requests to the main pages.")
+
+    def handle(self, *args, **options):
+        if not options["skip"]:
+            timings = warmup.run(options["phase"])
+            for name, seconds in timings:
+                self.stdout.write(f"{name:12} {seconds * 1000:8.1f} ms")
+            self.stdout.write(f"{'total':12} {sum(seconds for _, seconds in timings) * 1000:8.1f} ms")
+
+        if options["requests"]:
+            user = User.objects.order_by("pk").first()
+            listing = Listing.objects.filter(active=True).order_by("-pk").first()
+            if user is None or listing is None:
+                self.stderr.write("Seed the database first, see seed_auctions")
+                return
+            pages = ["/", f"/item/{listing.pk}", "/createlisting", "/categories", "/autocomplete?q=ab"]
+            # The test client sends its requests to the host "testserver"
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                client = Client()
+                # Logged in users are not served from the page cache
+                client.force_login(user)
+                self.stdout.write(f"{'page':24} {'first ms':>9} {'second ms':>9}")
+                for page in pages:
+                    times = []
+                    for _ in range(2):
+                        start = time.perf_counter()
+                        client.get(page)
+                        times.append((time.perf_counter() - start) * 1000)
+                    self.stdout.write(f"{page:24} {times[0]:9.1f} {times[1]:9.1f}")
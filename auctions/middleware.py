@@ -0,0 +1,91 @@
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import compression, profiling, routers
+
+# Name of the cookie that pins a browser session to the primary database
+PRIMARY_PIN_COOKIE = "pin_primary"
+
+
+class PrimaryPinMiddleware:
+    """
+    Middleware that gives read-your-writes consistency when reads are routed to replicas. After a request writes to the
+    primary, the browser is given a short-lived cookie, and every request made while the cookie is present reads from
+    the primary. The cookie expires after PRIMARY_PIN_SECONDS, by which time the replicas are expected to have caught
+    up.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset_writes()
+
+        # Read from the primary if the session has written recently
+        pinned = PRIMARY_PIN_COOKIE in request.COOKIES
+        with routers.pin_primary() if pinned else nullcontext():
+            response = self.get_response(request)
+
+        # Pin the session to the primary if this request has written
+        if routers.has_written():
+            response.set_cookie(PRIMARY_PIN_COOKIE, "1", max_age=settings.PRIMARY_PIN_SECONDS, httponly=True,
+                                samesite="Lax")
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Middleware that profiles requests on demand. Staff users profile a request by sending the X-Profile header or adding
+    the profile query parameter, and a fraction PROFILE_SAMPLE_RATE of the other requests is profiled as well. The
+    cProfile stats, the sampled stacks and the SQL queries of each profiled request are written to PROFILE_DIR, see
+    the profile_summary command.
+    It is the outermost middleware so that the whole request is profiled, including the other middleware and the
+    streaming of the response. Since the user is not known yet when the request comes in, requests asking to be
+    profiled are profiled first and the profile is dropped if the user turns out not to be staff.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = profiling.is_sampled()
+        if not sampled and not profiling.is_asked(request):
+            return self.get_response(request)
+
+        profile = profiling.RequestProfile()
+        with profile:
+            response = self.get_response(request)
+        requested = profiling.is_requested(request)
+        if not sampled and not requested:
+            return response
+
+        name = profiling.get_name(getattr(request.resolver_match, "view_name", None) or "unresolved")
+        if response.streaming:
+            # The content of a streaming response is produced as it is sent
+            response.streaming_content = profile.stream(response.streaming_content, name)
+        else:
+            profile.save(name)
+
+        # Tell the staff user which files hold the profile
+        if requested:
+            response["X-Profile"] = name
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Middleware that compresses the responses with brotli, if the brotli package is installed, or gzip, depending on
+    the encodings the client accepts. Responses smaller than COMPRESSION_MIN_SIZE bytes are sent uncompressed, and
+    streaming responses are compressed as they are streamed.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        encoding = compression.get_encoding(request)
+        if encoding is None:
+            # Caches must not serve a compressed response to this client either
+            patch_vary_headers(response, ["Accept-Encoding"])
+            return response
+        return compression.compress(response, encoding)
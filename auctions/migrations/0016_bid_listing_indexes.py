@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_auto_20210307_2024'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder', 'listing', 'amount'], name='bid_bidder_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['winner', 'active'], name='listing_winner_active_idx'),
+        ),
+    ]
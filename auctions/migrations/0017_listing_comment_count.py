@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def populate_comment_count(apps, schema_editor):
+    """
+    Sets the comment count of the existing listings.
+    """
+    Listing = apps.get_model("auctions", "Listing")
+    Comment = apps.get_model("auctions", "Comment")
+    counts = Comment.objects.filter(listing=OuterRef("pk")).order_by().values("listing").annotate(
+        total=Count("pk")).values("total")
+    Listing.objects.filter(pk__in=Comment.objects.values("listing")).update(comment_count=Subquery(counts))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_bid_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', '-date_posted'], name='comment_listing_date_idx'),
+        ),
+        migrations.RunPython(populate_comment_count, migrations.RunPython.noop),
+    ]
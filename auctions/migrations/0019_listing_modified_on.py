@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0018_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='modified_on',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
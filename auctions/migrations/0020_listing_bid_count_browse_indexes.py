@@ -0,0 +1,55 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def populate_bid_count(apps, schema_editor):
+    """
+    Sets the bid count of the existing listings.
+    """
+    Listing = apps.get_model("auctions", "Listing")
+    Bid = apps.get_model("auctions", "Bid")
+    counts = Bid.objects.filter(listing=OuterRef("pk")).order_by().values("listing").annotate(
+        total=Count("pk")).values("total")
+    Listing.objects.filter(pk__in=Bid.objects.values("listing")).update(bid_count=Subquery(counts))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0019_listing_modified_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_bid_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['-created_on'], name='listing_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['current_bid'], name='listing_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['-bid_count'], name='listing_active_bids_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['category', '-created_on'], name='listing_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['category', 'current_bid'], name='listing_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['category', '-bid_count'], name='listing_cat_bids_idx'),
+        ),
+    ]
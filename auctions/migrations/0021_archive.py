@@ -0,0 +1,101 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:21
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def populate_closed_on(apps, schema_editor):
+    """
+    Sets the closing time of the existing closed listings to the time of their last change.
+    """
+    Listing = apps.get_model("auctions", "Listing")
+    Listing.objects.filter(active=False, closed_on__isnull=True).update(closed_on=F("modified_on"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0020_listing_bid_count_browse_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('bidder_id', models.IntegerField()),
+                ('bidder_username', models.CharField(max_length=150)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+                ('username', models.CharField(max_length=150)),
+                ('content', models.TextField()),
+                ('date_posted', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=128)),
+                ('description', models.TextField()),
+                ('init_bid', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('current_bid', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('url', models.URLField(blank=True)),
+                ('creator_id', models.IntegerField()),
+                ('creator_username', models.CharField(max_length=150)),
+                ('winner_id', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('winner_username', models.CharField(blank=True, max_length=150)),
+                ('category_id', models.IntegerField(blank=True, null=True)),
+                ('category_name', models.CharField(blank=True, max_length=128)),
+                ('created_on', models.DateTimeField()),
+                ('closed_on', models.DateTimeField(blank=True, null=True)),
+                ('archived_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedWatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='closed_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_closed_on, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=False), fields=['closed_on'], name='listing_closed_on_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedwatch',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watches', to='auctions.archivedlisting'),
+        ),
+        migrations.AddField(
+            model_name='archivedcomment',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='auctions.archivedlisting'),
+        ),
+        migrations.AddField(
+            model_name='archivedbid',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bids', to='auctions.archivedlisting'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(fields=['listing', '-date_posted'], name='archivedcomment_listing_idx'),
+        ),
+    ]
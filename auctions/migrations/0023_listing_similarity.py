@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0022_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSimilarity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='auctions.listing')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.listing')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listingsimilarity',
+            index=models.Index(fields=['listing', '-score'], name='similarity_listing_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='listingsimilarity',
+            constraint=models.UniqueConstraint(fields=('listing', 'similar'), name='unique_listing_similarity'),
+        ),
+    ]
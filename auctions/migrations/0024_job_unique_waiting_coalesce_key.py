@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-19 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0023_listing_similarity'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_coalesce_key_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('claim', ''), ('status', 'pending'), models.Q(_negated=True, coalesce_key='')), fields=('coalesce_key',), name='unique_waiting_coalesce_key'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-19 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_listing_watchers(apps, schema_editor):
+    """
+    Records the watchlist entries already counted by the trending rankings.
+    """
+    EventCursor = apps.get_model("auctions", "EventCursor")
+    ListingWatcher = apps.get_model("auctions", "ListingWatcher")
+    Watchlist = apps.get_model("auctions", "Watchlist")
+    cursor = EventCursor.objects.filter(name="trending").first()
+    if cursor is None:
+        return
+    entries = (Watchlist.listings.through.objects.filter(pk__lte=cursor.last_watch_id)
+               .values_list("listing_id", "watchlist__user_id").distinct())
+    ListingWatcher.objects.bulk_create([ListingWatcher(listing_id=listing_id, user_id=user_id)
+                                        for listing_id, user_id in entries.iterator()], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0024_job_unique_waiting_coalesce_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventcursor',
+            name='bid_gaps',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='eventcursor',
+            name='watch_gaps',
+            field=models.JSONField(default=list),
+        ),
+        migrations.CreateModel(
+            name='ListingWatcher',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.listing')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='listingwatcher',
+            constraint=models.UniqueConstraint(fields=('listing', 'user'), name='unique_listing_watcher'),
+        ),
+        migrations.RunPython(populate_listing_watchers, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
 
@@ -48,6 +49,16 @@ class Listing(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="listings", blank=True, null=True)
     # Creation time of the listing
     created_on = models.DateTimeField(default=timezone.now)
+    # Closing time of the listing. Closed listings are moved to the archive tables some time after they are closed.
+    closed_on = models.DateTimeField(blank=True, null=True)
+    # Time of the last change of the listing, e.g. a new bid or closing the listing. Used to validate the cached pages.
+    modified_on = models.DateTimeField(auto_now=True, db_index=True)
+    # Number of bids on the listing, including the initial bid. Maintained incrementally when a bid is placed so that
+    # the listings can be sorted by the number of bids.
+    bid_count = models.PositiveIntegerField(default=0)
+    # Number of comments on the listing. Maintained incrementally when a comment is created so that the listing page
+    # does not need to count the comments.
+    comment_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.title}"
@@ -56,6 +67,20 @@ class Listing(models.Model):
         # Sort listings by created_on when queried so that listings created recently will appear first. The minus sign
         # is used to sort the listings in descending order.
         ordering = ["-created_on"]
+        indexes = [
+            # Serves the "auctions won" page, which looks up closed listings by their winner
+            models.Index(fields=["winner", "active"], name="listing_winner_active_idx"),
+            # Serve the sort options of the browse pages, with and without a category. The price range filter is served
+            # by the price indexes. Only active listings are browsed, so closed listings are left out of the indexes.
+            models.Index(fields=["-created_on"], condition=Q(active=True), name="listing_active_created_idx"),
+            models.Index(fields=["current_bid"], condition=Q(active=True), name="listing_active_price_idx"),
+            models.Index(fields=["-bid_count"], condition=Q(active=True), name="listing_active_bids_idx"),
+            models.Index(fields=["category", "-created_on"], condition=Q(active=True), name="listing_cat_created_idx"),
+            models.Index(fields=["category", "current_bid"], condition=Q(active=True), name="listing_cat_price_idx"),
+            models.Index(fields=["category", "-bid_count"], condition=Q(active=True), name="listing_cat_bids_idx"),
+            # Serves the archive_closed_auctions command, which looks up the listings closed before a given time
+            models.Index(fields=["closed_on"], condition=Q(active=False), name="listing_closed_on_idx"),
+        ]
 
 
 class Bid(models.Model):
@@ -69,6 +94,13 @@ class Bid(models.Model):
     def __str__(self):
         return f"Listing: {self.listing.title}, Bid: {self.amount}, Bidder: {self.bidder.username}"
 
+    class Meta:
+        indexes = [
+            # Serves the "my bids" page. The amount is part of the index so that the highest bid of a user on a listing
+            # can be read from the index alone.
+            models.Index(fields=["bidder", "listing", "amount"], name="bid_bidder_listing_idx"),
+        ]
+
 
 class Watchlist(models.Model):
     """
@@ -94,6 +126,209 @@ class Comment(models.Model):
         # Sort comments by date_posted when queried so that comments made recently will appear first. The minus sign
         # is used to sort the comments in descending order.
         ordering = ["-date_posted"]
+        indexes = [
+            # Serves the paginated comment thread of a listing, newest first
+            models.Index(fields=["listing", "-date_posted"], name="comment_listing_date_idx"),
+        ]
 
     def __str__(self):
         return f"User: {self.user.username}, Listing: {self.listing.title}, Date: {self.date_posted}"
+
+
+class Job(models.Model):
+    """
+    Job model that stores a single unit of background work, processed by the process_jobs management command
+    """
+    PENDING = "pending"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (FAILED, "Failed")]
+
+    # Name of the handler that processes the job
+    kind = models.CharField(max_length=64)
+    # Arguments of the handler
+    payload = models.JSONField(default=dict)
+    # Pending jobs with the same non-empty key are merged into a single job
+    coalesce_key = models.CharField(max_length=128, blank=True)
+    # Failed jobs are kept for inspection after they run out of attempts. Completed jobs are deleted.
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    # Number of times the job has been claimed by a worker
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # The job is not claimed before this time. It is also used as the lease of a claimed job so that the job is retried
+    # if the worker processing it dies.
+    run_after = models.DateTimeField(default=timezone.now)
+    # Token of the worker batch that claimed the job. Empty if the job has not been claimed.
+    claim = models.CharField(max_length=32, blank=True)
+    # Error message of the last failed attempt
+    last_error = models.TextField(blank=True)
+    created_on = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Job: {self.kind}, Status: {self.status}, Attempts: {self.attempts}"
+
+    class Meta:
+        indexes = [
+            # Serves the workers looking for due jobs
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+        constraints = [
+            # At most one job per key waits to be claimed, so that concurrent enqueues merge into it. Also serves the
+            # lookup of the job to merge into.
+            models.UniqueConstraint(fields=["coalesce_key"], name="unique_waiting_coalesce_key",
+                                    condition=models.Q(status="pending", claim="") & ~models.Q(coalesce_key="")),
+        ]
+
+
+class EventCursor(models.Model):
+    """
+    EventCursor model that stores how far a worker has read the bid and watchlist events. Bids and watchlist entries
+    are read in the order of their ids, so the largest id read, along with the ids skipped below it, is enough to
+    resume.
+    """
+    # Name of the worker reading the events
+    name = models.CharField(max_length=64, primary_key=True)
+    last_bid_id = models.BigIntegerField(default=0)
+    last_watch_id = models.BigIntegerField(default=0)
+    # Ids below the last ids that were missing when the cursor moved past them, as [id, time] pairs. They are read again
+    # in case the transactions that created them commit late, see events.read_events().
+    bid_gaps = models.JSONField(default=list)
+    watch_gaps = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.name}: bid {self.last_bid_id}, watch {self.last_watch_id}"
+
+
+class ListingRank(models.Model):
+    """
+    ListingRank model that stores the trending score of a listing, maintained by the refresh_trending command.
+    The score is the logarithm of the sum of the weights of the bid and watch events of the listing, each scaled by
+    exp(decay * time of the event). Since every score decays at the same rate, the scores are never rewritten as time
+    passes and only the listings with new events are updated.
+    """
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name="rank")
+    score = models.FloatField()
+
+    def __str__(self):
+        return f"Listing: {self.listing_id}, Score: {self.score}"
+
+    class Meta:
+        indexes = [
+            # Serves the top trending listings on the home page and the pruning of the lowest scores
+            models.Index(fields=["-score"], name="listingrank_score_idx"),
+        ]
+
+
+class ListingWatcher(models.Model):
+    """
+    ListingWatcher model that records that a user has added a listing to their watchlist, maintained by the
+    refresh_trending command. Unlike the watchlist entries it is kept when the listing is removed from the watchlist,
+    so that the trending scores count a single watch per user and listing.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="+")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+
+    def __str__(self):
+        return f"Listing: {self.listing_id}, User: {self.user_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "user"], name="unique_listing_watcher"),
+        ]
+
+
+class ListingSimilarity(models.Model):
+    """
+    ListingSimilarity model that stores how often a listing was watched or bid on by the same users as another listing,
+    maintained by the build_similar_listings command. Only the SIMILAR_LISTINGS_KEPT most similar listings of each
+    listing are kept.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="similarities")
+    similar = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    def __str__(self):
+        return f"Listing: {self.listing_id}, Similar: {self.similar_id}, Score: {self.score}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "similar"], name="unique_listing_similarity"),
+        ]
+        indexes = [
+            # Serves the similar listings of the listing page
+            models.Index(fields=["listing", "-score"], name="similarity_listing_score_idx"),
+        ]
+
+
+class ArchivedListing(models.Model):
+    """
+    ArchivedListing model that stores a closed listing moved out of the Listing table by the archive_closed_auctions
+    command. The archive may be kept in a separate database, so users and categories are stored by id along with their
+    names instead of as foreign keys.
+    """
+    # Same id as the original listing so that links to the listing keep working
+    id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=128)
+    description = models.TextField()
+    init_bid = models.DecimalField(max_digits=9, decimal_places=2)
+    current_bid = models.DecimalField(max_digits=9, decimal_places=2)
+    url = models.URLField(blank=True)
+    creator_id = models.IntegerField()
+    creator_username = models.CharField(max_length=150)
+    winner_id = models.IntegerField(blank=True, null=True, db_index=True)
+    winner_username = models.CharField(max_length=150, blank=True)
+    category_id = models.IntegerField(blank=True, null=True)
+    category_name = models.CharField(max_length=128, blank=True)
+    created_on = models.DateTimeField()
+    closed_on = models.DateTimeField(blank=True, null=True)
+    # Time the listing was archived
+    archived_on = models.DateTimeField(default=timezone.now)
+    bid_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    # Archived listings are never active
+    active = False
+
+    def __str__(self):
+        return f"{self.title}"
+
+
+class ArchivedBid(models.Model):
+    """
+    ArchivedBid model that stores a bid of an archived listing
+    """
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name="bids")
+    amount = models.DecimalField(max_digits=9, decimal_places=2)
+    bidder_id = models.IntegerField()
+    bidder_username = models.CharField(max_length=150)
+
+    def __str__(self):
+        return f"Listing: {self.listing_id}, Bid: {self.amount}, Bidder: {self.bidder_username}"
+
+
+class ArchivedComment(models.Model):
+    """
+    ArchivedComment model that stores a comment of an archived listing
+    """
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name="comments")
+    user_id = models.IntegerField()
+    username = models.CharField(max_length=150)
+    content = models.TextField()
+    date_posted = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "-date_posted"], name="archivedcomment_listing_idx"),
+        ]
+
+    def __str__(self):
+        return f"User: {self.username}, Listing: {self.listing_id}, Date: {self.date_posted}"
+
+
+class ArchivedWatch(models.Model):
+    """
+    ArchivedWatch model that stores that an archived listing was in the watchlist of a user
+    """
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name="watches")
+    user_id = models.IntegerField()
+
+    def __str__(self):
+        return f"User: {self.user_id}, Listing: {self.listing_id}"
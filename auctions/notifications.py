@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import OuterRef, Subquery
+from django.dispatch import receiver
+from django.urls import reverse
+
+from . import jobs
+from .models import Bid, Listing, User
+from .signals import bid_placed, listing_closed
+
+
+@receiver(bid_placed)
+def notify_outbid(sender, bid, previous_bid, **kwargs):
+    """
+    Enqueues an outbid notification for the previous highest bidder. Outbids of the same bidder on the same listing
+    within OUTBID_NOTIFICATION_WINDOW seconds are coalesced into a single notification.
+    """
+    # The initial bid of a listing is placed by its creator and does not need a notification
+    if previous_bid is None or previous_bid.bidder_id in (bid.bidder_id, bid.listing.creator_id):
+        return
+
+    jobs.enqueue("outbid", {"listing_id": bid.listing_id, "user_id": previous_bid.bidder_id},
+                 coalesce_key=f"outbid:{bid.listing_id}:{previous_bid.bidder_id}",
+                 delay=settings.OUTBID_NOTIFICATION_WINDOW)
+
+
+@receiver(listing_closed)
+def notify_winner(sender, listing, **kwargs):
+    """
+    Enqueues an auction won notification for the winner of the listing.
+    """
+    # If nobody has placed a bid the creator is the winner and does not need a notification
+    if listing.winner_id is None or listing.winner_id == listing.creator_id:
+        return
+
+    jobs.enqueue("auction_won", {"listing_id": listing.pk, "user_id": listing.winner_id})
+
+
+@jobs.register("outbid")
+def send_outbid_emails(payloads):
+    """
+    Sends an email to each bidder that is still outbid on the listing.
+    """
+    messages = []
+    for listing, user in get_recipients(payloads):
+        # Skip bidders that have placed a higher bid since the notification was enqueued
+        if listing is not None and user is not None and listing.top_bidder_id != user.pk and listing.active:
+            messages.append(build_email(
+                user, f"You have been outbid on {listing.title}",
+                f"The current bid on {listing.title} is ${listing.current_bid}.", listing))
+        else:
+            messages.append(None)
+
+    return send_emails(messages)
+
+
+@jobs.register("auction_won")
+def send_auction_won_emails(payloads):
+    """
+    Sends an email to the winner of each listing.
+    """
+    messages = []
+    for listing, user in get_recipients(payloads):
+        if listing is not None and user is not None:
+            messages.append(build_email(
+                user, f"You won the auction for {listing.title}",
+                f"Your bid of ${listing.current_bid} won the auction for {listing.title}.", listing))
+        else:
+            messages.append(None)
+
+    return send_emails(messages)
+
+
+def get_recipients(payloads):
+    """
+    Returns the listing and the user to be notified of each payload, None for those that no longer exist. The listings
+    have a top_bidder_id attribute holding the bidder of the last (highest) bid. Users without an email address are
+    left out.
+    """
+    top_bidder = Bid.objects.filter(listing=OuterRef("pk")).order_by("-pk").values("bidder")[:1]
+    listings = Listing.objects.annotate(top_bidder_id=Subquery(top_bidder)).in_bulk(
+        {payload["listing_id"] for payload in payloads})
+    users = User.objects.filter(pk__in={payload["user_id"] for payload in payloads}).exclude(email="").in_bulk()
+    return [(listings.get(payload["listing_id"]), users.get(payload["user_id"])) for payload in payloads]
+
+
+def send_emails(messages):
+    """
+    Sends the messages over a single connection, one at a time, and yields for each of them None once it has been sent
+    or skipped, or the exception sending it failed with. None messages are skipped.
+    """
+    with get_connection() as connection:
+        for message in messages:
+            try:
+                if message is not None:
+                    connection.send_messages([message])
+            except Exception as e:
+                yield e
+            else:
+                yield None
+
+
+def build_email(user, subject, body, listing):
+    """
+    Returns an EmailMessage to the user with a link to the listing appended to the body.
+    """
+    link = reverse("listing", args=(listing.pk,))
+    return EmailMessage(subject, f"{body}\n\nView the listing: {settings.SITE_URL}{link}", to=[user.email])
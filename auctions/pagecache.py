@@ -0,0 +1,96 @@
+import datetime
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import categories
+from .models import EventCursor, Listing
+from .signals import bid_placed, listing_closed, listing_created
+
+# Cache key of the time of the last change to the listings and of the position of the trending cursor. The key is
+# deleted whenever a listing or the trending rankings change, and expires after LAST_MODIFIED_TIMEOUT seconds so that
+# the processes that do not share the cache of the process that made the change read them from the database again.
+LAST_MODIFIED_KEY = "pagecache:last_modified"
+# Time of the last change when there are no listings
+EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def anonymous_cache_page(view):
+    """
+    Decorator for the browse pages. Logged out users all get the same page, so their pages are cached and validated
+    with an ETag and a Last-Modified date derived from the last change to the listings. Conditional requests that match
+    are answered with 304 without calling the view. Logged in users always get a freshly rendered page, since the layout
+    shows their username.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+            response = view(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            patch_vary_headers(response, ("Cookie",))
+            return response
+
+        last_modified, trending_position = get_last_modified()
+        # The pages also show the categories and the trending listings, which change without changing the listings
+        categories_version, _ = categories.get_choices()
+        version = f"{request.get_full_path()}:{last_modified.isoformat()}:{trending_position}:{categories_version}"
+        etag = quote_etag(hashlib.md5(version.encode()).hexdigest())
+        timestamp = timegm(last_modified.utctimetuple())
+
+        # Answer with 304 if the client's copy is still valid
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            key = f"pagecache:page:{etag}"
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, (response.content, response["Content-Type"]),
+                              settings.ANONYMOUS_PAGE_CACHE_TIMEOUT)
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(timestamp)
+        patch_cache_control(response, public=True, max_age=settings.ANONYMOUS_PAGE_MAX_AGE, must_revalidate=True)
+        patch_vary_headers(response, ("Cookie",))
+        return response
+    return wrapper
+
+
+def get_last_modified():
+    """
+    Returns the time of the last change to the listings and the position of the trending cursor, which moves whenever
+    the trending rankings are refreshed. They are kept in the cache for LAST_MODIFIED_TIMEOUT seconds and read from the
+    modified_on index and the cursor when the cache does not have them.
+    """
+    last_modified = cache.get(LAST_MODIFIED_KEY)
+    if last_modified is None:
+        # Imported here since trending invalidates the pages through this module
+        from .trending import CURSOR_NAME
+        bid_id, watch_id = (EventCursor.objects.filter(name=CURSOR_NAME).values_list("last_bid_id", "last_watch_id")
+                            .first() or (0, 0))
+        last_modified = (Listing.objects.aggregate(last=Max("modified_on"))["last"] or EPOCH, f"{bid_id}-{watch_id}")
+        cache.set(LAST_MODIFIED_KEY, last_modified, settings.LAST_MODIFIED_TIMEOUT)
+    return last_modified
+
+
+@receiver(listing_created)
+@receiver(bid_placed)
+@receiver(listing_closed)
+def invalidate(sender, **kwargs):
+    """
+    Invalidates the cached pages once the current transaction has been committed. The cached pages are keyed by the
+    time of the last change, so they are invalidated by reading it from the database again.
+    """
+    transaction.on_commit(lambda: cache.delete(LAST_MODIFIED_KEY))
@@ -0,0 +1,172 @@
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+# Extensions of the files written for each profiled request: the cProfile stats, the sampled stacks and the SQL queries
+# with the stacks that ran them. The stack files are in the collapsed format read by flamegraph.pl and speedscope.
+STATS_EXTENSION = ".prof"
+STACKS_EXTENSION = ".folded"
+SQL_EXTENSION = ".sql.folded"
+
+
+def is_sampled():
+    """
+    Returns True if the request is one of the fraction PROFILE_SAMPLE_RATE of all requests that are profiled.
+    """
+    return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def is_asked(request):
+    """
+    Returns True if the request asks to be profiled with the X-Profile header or the profile query parameter. Only
+    requests with a session cookie can come from a staff user.
+    """
+    return (settings.SESSION_COOKIE_NAME in request.COOKIES
+            and ("HTTP_X_PROFILE" in request.META or "profile" in request.GET))
+
+
+def is_requested(request):
+    """
+    Returns True if a staff user has asked for the request to be profiled. The user is only known once the
+    authentication middleware has run.
+    """
+    user = getattr(request, "user", None)
+    return is_asked(request) and user is not None and user.is_staff
+
+
+class RequestProfile:
+    """
+    Context manager that profiles the code run inside it with cProfile, samples its stack from another thread every
+    PROFILE_SAMPLE_INTERVAL seconds and records the time and calling stack of every SQL query. It may be entered
+    several times, e.g. once for the view and once for each chunk of a streaming response, and adds up the profiles.
+    """
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        # Number of samples per collapsed stack
+        self.stacks = Counter()
+        # Microseconds spent on the SQL queries per collapsed stack, with the query as the last frame
+        self.queries = Counter()
+        self.sampler = None
+        self.exit_stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self.exit_stack.enter_context(connection.execute_wrapper(self.record_query))
+        self.sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL, self.stacks)
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.exit_stack.close()
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper that records the time of the query under the stack of the project code that ran it.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = int((time.perf_counter() - start) * 1e6)
+            query = " ".join(sql.split())[:120].replace(";", ",")
+            stack = collapse(sys._getframe(1), project_only=True)
+            self.queries[f"{stack};SQL {query}" if stack else f"SQL {query}"] += elapsed
+
+    def stream(self, chunks, name):
+        """
+        Yields the chunks of a streaming response, profiling the code that produces each of them, and saves the
+        profile under the name once the chunks are exhausted.
+        """
+        try:
+            chunks = iter(chunks)
+            while True:
+                with self:
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.save(name)
+
+    def save(self, name):
+        """
+        Writes the profile of the request to PROFILE_DIR, as files sharing the name.
+        """
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILE_DIR, name)
+        self.profiler.dump_stats(path + STATS_EXTENSION)
+        write_stacks(path + STACKS_EXTENSION, self.stacks)
+        write_stacks(path + SQL_EXTENSION, self.queries)
+
+
+def get_name(view_name):
+    """
+    Returns a name for the files of a new profile of the view.
+    """
+    view_name = re.sub(r"[^\w.]", "_", view_name)
+    return f"{view_name}-{time.strftime('%Y%m%d%H%M%S')}{time.time_ns() % 1000000000:09d}-{os.getpid()}"
+
+
+class StackSampler(threading.Thread):
+    """
+    Thread that counts the stacks of another thread, sampled at a fixed interval.
+    """
+    def __init__(self, thread_id, interval, stacks):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = stacks
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def collapse(frame, project_only=False):
+    """
+    Returns the stack ending at the frame as a single line of "module.function" names separated by semicolons,
+    outermost first. If project_only is True, only the frames of the code in BASE_DIR are included.
+    """
+    names = []
+    base_dir = str(settings.BASE_DIR)
+    while frame is not None:
+        code = frame.f_code
+        if not project_only or (code.co_filename.startswith(base_dir) and "site-packages" not in code.co_filename):
+            names.append(f"{frame.f_globals.get('__name__', '?')}.{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def write_stacks(path, stacks):
+    """
+    Writes the counted stacks to a file in the collapsed stack format, one "stack count" line per stack.
+    """
+    with open(path, "w") as file:
+        for stack, count in stacks.most_common():
+            file.write(f"{stack} {count}\n")
+
+
+def parse_name(name):
+    """
+    Returns the view name of a profile from the name of its files.
+    """
+    return name.rsplit("-", 2)[0]
@@ -0,0 +1,141 @@
+import math
+import threading
+import time
+from collections import deque
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+
+class MemoryBackend:
+    """
+    Sliding window log held in the memory of the process. Exact, but the limits apply per process.
+    """
+    # Number of hits between two sweeps of the keys that have not been hit for a whole window
+    SWEEP_INTERVAL = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Times of the accepted hits of each key, oldest first, along with the window of the key
+        self.hits = {}
+        self.until_sweep = self.SWEEP_INTERVAL
+
+    def hit(self, key, limit, window):
+        """
+        Records a hit of the key if fewer than limit hits were accepted in the last window seconds. Returns 0 if the
+        hit was accepted, otherwise the number of seconds until it would be.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.until_sweep -= 1
+            if self.until_sweep <= 0:
+                self.sweep(now)
+
+            times, _ = self.hits.setdefault(key, (deque(), window))
+            # Forget the hits that have left the window
+            while times and times[0] <= now - window:
+                times.popleft()
+            if len(times) >= limit:
+                return times[len(times) - limit] + window - now
+            times.append(now)
+            return 0
+
+    def sweep(self, now):
+        """
+        Removes the keys without hits in their window so that the memory does not grow with every user and address
+        ever seen. Must be called while holding the lock.
+        """
+        self.hits = {key: (times, window) for key, (times, window) in self.hits.items()
+                     if times and times[-1] > now - window}
+        self.until_sweep = self.SWEEP_INTERVAL
+
+
+class CacheBackend:
+    """
+    Sliding window counter kept in the Django cache, so that the limits are shared by every process using the same
+    cache. The number of hits in the last window is estimated from the counters of the current and the previous fixed
+    window, weighted by how much of the previous window still overlaps the sliding window.
+    """
+    def hit(self, key, limit, window):
+        """
+        Records a hit of the key if fewer than limit hits were accepted in the last window seconds. Returns 0 if the
+        hit was accepted, otherwise the number of seconds until it would be.
+        """
+        now = time.time()
+        index, elapsed = divmod(now, window)
+        current_key, previous_key = f"ratelimit:{key}:{int(index)}", f"ratelimit:{key}:{int(index) - 1}"
+        counts = cache.get_many([current_key, previous_key])
+        current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+
+        weight = 1 - elapsed / window
+        if previous * weight + current >= limit:
+            if current >= limit or not previous:
+                # Wait for the current window to end
+                return window - elapsed
+            # Wait until enough of the previous window has left the sliding window
+            return max(window * (1 - (limit - current) / previous) - elapsed, 0.001)
+
+        # The counters outlive their window by another window since they are read as the previous window
+        if not cache.add(current_key, 1, math.ceil(window * 2)):
+            try:
+                cache.incr(current_key)
+            except ValueError:
+                # The counter expired in between
+                cache.add(current_key, 1, math.ceil(window * 2))
+        return 0
+
+
+@lru_cache(maxsize=None)
+def get_backend(path):
+    """
+    Returns the rate limit backend with the given import path. Each backend is created once per process.
+    """
+    return import_string(path)()
+
+
+def rate_limit(view):
+    """
+    Decorator that limits how often the view can be requested, per user, per client address and per listing, as
+    configured for the view in RATE_LIMITS. Requests over a limit are answered with a 429 response whose Retry-After
+    header tells the client when to try again.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        limits = settings.RATE_LIMITS.get(view.__name__, {})
+        backend = get_backend(settings.RATE_LIMIT_BACKEND)
+        for scope, identity in get_identities(request, kwargs):
+            if scope not in limits or identity is None:
+                continue
+            limit, window = limits[scope]
+            retry_after = backend.hit(f"{view.__name__}:{scope}:{identity}", limit, window)
+            if retry_after:
+                response = HttpResponse("Too many requests. Please try again later.", status=429)
+                response["Retry-After"] = str(math.ceil(retry_after))
+                return response
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def get_identities(request, kwargs):
+    """
+    Returns the (scope, identity) pairs of the request that are rate limited. The identity is None if the request has
+    none for the scope.
+    """
+    return [("user", request.user.pk if request.user.is_authenticated else None),
+            ("ip", get_client_address(request)),
+            ("listing", kwargs.get("listing_id"))]
+
+
+def get_client_address(request):
+    """
+    Returns the address of the client, read from the request META key RATE_LIMIT_CLIENT_ADDRESS, or None if it is not
+    configured or missing. Of a comma separated list of addresses, such as X-Forwarded-For, the last one is returned
+    since it is the one added by the proxy in front of the application.
+    """
+    if not settings.RATE_LIMIT_CLIENT_ADDRESS:
+        return None
+    address = request.META.get(settings.RATE_LIMIT_CLIENT_ADDRESS, "").rpartition(",")[2].strip()
+    return address or None
@@ -0,0 +1,142 @@
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.local import Local
+from django.conf import settings
+
+# Per request state of the router. Local is safe to use from both threads and coroutines.
+_state = Local()
+
+# Apps whose reads always go to the primary. Sessions are written on almost every request and must be read back
+# immediately, so they are never read from a replica that may lag behind.
+PRIMARY_APPS = {"sessions"}
+
+# Models stored in the ARCHIVE_DATABASE, see archive_closed_auctions
+ARCHIVE_MODELS = {"archivedlisting", "archivedbid", "archivedcomment", "archivedwatch"}
+
+
+class ArchiveRouter:
+    """
+    Database router that keeps the archived listings in the ARCHIVE_DATABASE, which may be a separate database file.
+    Other models are left to the next router.
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.model_name in ARCHIVE_MODELS:
+            return settings.ARCHIVE_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.model_name in ARCHIVE_MODELS:
+            return settings.ARCHIVE_DATABASE
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name in ARCHIVE_MODELS:
+            return db == settings.ARCHIVE_DATABASE
+        return None
+
+
+class ReplicaRouter:
+    """
+    Database router that sends writes and reads to the primary ("default") database, except for the reads of the views
+    opted into the replicas with use_replica(), which are spread over the replicas listed in DATABASE_REPLICAS. Reads
+    go to the primary while the request is pinned to it, see pin_primary(). Management commands and background threads
+    always read from the primary.
+    """
+    def db_for_read(self, model, **hints):
+        if (not settings.DATABASE_REPLICAS or not uses_replica() or is_pinned()
+                or model._meta.app_label in PRIMARY_APPS):
+            return "default"
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        # Remember that the request has written so that its session is pinned to the primary for a while
+        _state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == "default"
+
+
+def uses_replica():
+    """
+    Returns True if reads of the current request may go to a replica.
+    """
+    return getattr(_state, "replica", False)
+
+
+def is_pinned():
+    """
+    Returns True if reads of the current request must go to the primary.
+    """
+    return getattr(_state, "pinned", False)
+
+
+def has_written():
+    """
+    Returns True if the current request has written to the primary.
+    """
+    return getattr(_state, "wrote", False)
+
+
+def reset_writes():
+    """
+    Resets the write tracking at the start of a request.
+    """
+    _state.wrote = False
+
+
+@contextmanager
+def pin_primary():
+    """
+    Context manager that sends every read inside it to the primary.
+    """
+    previous = is_pinned()
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+def use_primary(view):
+    """
+    Decorator for views that write. Every read of the view goes to the primary so that the view validates against the
+    latest data, e.g. a bid is compared with the latest current bid.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with pin_primary():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def read_replica():
+    """
+    Context manager that lets the reads inside it go to a replica, unless the request is pinned to the primary.
+    """
+    previous = uses_replica()
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def use_replica(view):
+    """
+    Decorator for the read-only browse views. Their reads may go to a replica, which can lag slightly behind the
+    primary.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with read_replica():
+            return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# Sent after a listing has been created. Arguments: listing
+listing_created = Signal()
+
+# Sent after a bid has been accepted. Arguments: bid, previous_bid (the highest bid before this one)
+bid_placed = Signal()
+
+# Sent after a listing has been closed. Arguments: listing
+listing_closed = Signal()
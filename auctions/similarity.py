@@ -0,0 +1,143 @@
+import math
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from . import events
+from .models import Bid, EventCursor, Listing, ListingSimilarity, Watchlist
+
+# Name of the event cursor of the similar listings
+CURSOR_NAME = "similar_listings"
+
+
+def get_similar_listings(listing_id):
+    """
+    Returns the SIMILAR_LISTINGS active listings most similar to the listing, read from the (listing, -score) index.
+    """
+    similarities = (ListingSimilarity.objects.filter(listing_id=listing_id, similar__active=True)
+                    .select_related("similar").order_by("-score")[:settings.SIMILAR_LISTINGS])
+    return [similarity.similar for similarity in similarities]
+
+
+def update(batch_size=None):
+    """
+    Adds the bid and watch events since the last update to the similarities of the listings. Two listings become more
+    similar each time a user bids on or watches a listing for the first time, with each of the SIMILAR_RECENT_LISTINGS
+    listings the user interacted with last. Each user adds 1 / log2(2 + number of listings of the user) per pair, so
+    that users interacting with many listings count less, and users with more than SIMILAR_MAX_USER_LISTINGS listings
+    are ignored.
+    The events are read in batches, each processed in its own transaction, so the work done is proportional to the
+    number of new events. Returns the number of events processed.
+    """
+    batch_size = batch_size or settings.SIMILAR_BATCH_SIZE
+    processed = 0
+    while True:
+        with transaction.atomic():
+            cursor, bids, watches = events.read_events(CURSOR_NAME, batch_size)
+            if not bids and not watches:
+                break
+
+            # Listings of each user before this batch
+            users = {user_id for _, _, user_id in bids} | {user_id for _, _, user_id in watches}
+            known = get_user_listings(users, cursor)
+
+            # The initial bid of a listing is placed by its creator and says nothing about similarity
+            creators = dict(Listing.objects.filter(pk__in={listing_id for _, listing_id, _ in bids})
+                            .values_list("pk", "creator"))
+            interactions = [(listing_id, user_id) for _, listing_id, user_id in bids
+                            if creators.get(listing_id) != user_id]
+            interactions += [(listing_id, user_id) for _, listing_id, user_id in watches]
+
+            # Pair the first interaction of a user with a listing with the listings the user interacted with last
+            increments = defaultdict(float)
+            for listing_id, user_id in interactions:
+                listings = known[user_id]
+                if listing_id in listings:
+                    continue
+                if len(listings) < settings.SIMILAR_MAX_USER_LISTINGS:
+                    weight = 1 / math.log2(2 + len(listings))
+                    for other_id in islice(reversed(listings), settings.SIMILAR_RECENT_LISTINGS):
+                        increments[listing_id, other_id] += weight
+                        increments[other_id, listing_id] += weight
+                listings[listing_id] = None
+
+            add_scores(increments)
+            events.advance(cursor, bids, watches)
+            processed += len(bids) + len(watches)
+    return processed
+
+
+def get_user_listings(users, cursor):
+    """
+    Returns the ids of the listings each of the users has bid on or watched, up to the bid and watchlist entry the
+    cursor has read except for its gaps, as dicts ordered from the oldest to the newest bid, then watchlist entry. The
+    initial bids of the users on their own listings are left out.
+    Only the last SIMILAR_MAX_USER_LISTINGS + 1 bids and watchlist entries of each user are read, with two queries per
+    user, so that the work does not grow with the history of the users. Users with a longer history may miss their
+    oldest listings, which only matters as long as they have no more than SIMILAR_MAX_USER_LISTINGS listings.
+    """
+    limit = settings.SIMILAR_MAX_USER_LISTINGS + 1
+    bids = (Bid.objects.filter(pk__lte=cursor.last_bid_id).exclude(pk__in=events.get_gap_ids(cursor.bid_gaps))
+            .exclude(listing__creator=F("bidder")).order_by("-pk"))
+    watches = (Watchlist.listings.through.objects.filter(pk__lte=cursor.last_watch_id)
+               .exclude(pk__in=events.get_gap_ids(cursor.watch_gaps)).order_by("-pk"))
+
+    listings = {}
+    for user_id in users:
+        # Newest first
+        recent = list(watches.filter(watchlist__user=user_id).values_list("listing", flat=True)[:limit])
+        recent += bids.filter(bidder=user_id).values_list("listing", flat=True)[:limit]
+        listings[user_id] = dict.fromkeys(reversed(list(dict.fromkeys(recent))))
+    return listings
+
+
+def add_scores(increments):
+    """
+    Adds the increments, keyed by (listing id, similar listing id), to the similarities and keeps the
+    SIMILAR_LISTINGS_KEPT most similar listings of each listing.
+    """
+    if not increments:
+        return
+    # Skip the listings that have been deleted in the meantime
+    listing_ids = {listing_id for pair in increments for listing_id in pair}
+    existing = set(Listing.objects.filter(pk__in=listing_ids).values_list("pk", flat=True))
+
+    # Merge the increments into the current scores of the listings
+    scores = defaultdict(dict)
+    rows = defaultdict(dict)
+    changed = {listing_id for listing_id, _ in increments if listing_id in existing}
+    for pk, listing_id, similar_id, score in (ListingSimilarity.objects.filter(listing__in=changed)
+                                              .values_list("pk", "listing", "similar", "score").iterator()):
+        scores[listing_id][similar_id] = score
+        rows[listing_id][similar_id] = pk
+    for (listing_id, similar_id), increment in increments.items():
+        if listing_id in existing and similar_id in existing:
+            scores[listing_id][similar_id] = scores[listing_id].get(similar_id, 0) + increment
+
+    # Only rewrite the similarities whose score changed and delete the ones that dropped out of the top scores
+    deleted = []
+    created = []
+    for listing_id, similar in scores.items():
+        top = sorted(similar.items(), key=lambda item: item[1], reverse=True)[:settings.SIMILAR_LISTINGS_KEPT]
+        kept = {similar_id for similar_id, _ in top}
+        deleted += [pk for similar_id, pk in rows[listing_id].items() if similar_id not in kept]
+        for similar_id, score in top:
+            if (listing_id, similar_id) in increments:
+                if similar_id in rows[listing_id]:
+                    deleted.append(rows[listing_id][similar_id])
+                created.append(ListingSimilarity(listing_id=listing_id, similar_id=similar_id, score=score))
+    for start in range(0, len(deleted), 1000):
+        ListingSimilarity.objects.filter(pk__in=deleted[start:start + 1000]).delete()
+    ListingSimilarity.objects.bulk_create(created, batch_size=1000)
+
+
+def rebuild():
+    """
+    Deletes the similarities so that the next update() rebuilds them from every event.
+    """
+    with transaction.atomic():
+        ListingSimilarity.objects.all().delete()
+        EventCursor.objects.filter(name=CURSOR_NAME).delete()
@@ -0,0 +1,48 @@
+// Suggests the titles of the active listings as the user types in the search field, and opens the listing whose
+// title is picked, or typed in full followed by Enter
+document.addEventListener("DOMContentLoaded", () => {
+    const input = document.querySelector("#search");
+    const datalist = document.querySelector("#search-suggestions");
+    // Listing URLs by title of the current suggestions
+    let urls = new Map();
+    let timer = null;
+    let controller = null;
+
+    function open() {
+        const url = urls.get(input.value);
+        if (url) {
+            window.location = url;
+        }
+    }
+
+    input.addEventListener("input", event => {
+        // Picking a suggestion replaces the value of the field without typing
+        if (!event.inputType || event.inputType === "insertReplacementText") {
+            open();
+            return;
+        }
+        // Wait for a pause in the typing and cancel the request of the previous prefix
+        clearTimeout(timer);
+        timer = setTimeout(async () => {
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            try {
+                const response = await fetch(`${input.dataset.url}?q=${encodeURIComponent(input.value)}`,
+                                             {signal: controller.signal});
+                const data = await response.json();
+                urls = new Map(data.suggestions.map(suggestion => [suggestion.title, suggestion.url]));
+                datalist.replaceChildren(...data.suggestions.map(suggestion => new Option(suggestion.title)));
+            } catch (error) {
+                // Aborted by a newer prefix
+            }
+        }, 150);
+    });
+
+    input.addEventListener("keydown", event => {
+        if (event.key === "Enter") {
+            open();
+        }
+    });
+});
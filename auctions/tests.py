@@ -1,3 +1,1289 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipIf
+from uuid import uuid4
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.db.models.signals import pre_save
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (archive, autocomplete, categories, compression, hot, jobs, loaders, middleware, pagecache, ratelimit,
+               similarity, trending, util, warmup)
+from .models import (ArchivedComment, ArchivedListing, Bid, Category, Comment, EventCursor, Job, Listing, ListingRank,
+                     ListingSimilarity, User, Watchlist)
+from .signals import listing_created
+
+
+def reset_hot_listings():
+    """
+    Forgets the hot listings, pending bids and journal of the process, as if it had just been started.
+    """
+    with hot._lock:
+        if hot._journal is not None:
+            hot._journal.close()
+        hot._journal = None
+        hot._listings.clear()
+        hot._pending.clear()
+        hot._flushing.clear()
+        hot._in_flight.clear()
+        hot._oldest_pending = None
+        hot._recovered = False
+
+
+def add_sqlite_database(test, alias):
+    """
+    Adds a database with the given alias, held in a temporary SQLite file, for the duration of the test. Returns its
+    connection.
+    """
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    connections.databases[alias] = {"ENGINE": "django.db.backends.sqlite3",
+                                    "NAME": os.path.join(directory, f"{alias}.sqlite3")}
+    connections.ensure_defaults(alias)
+    connections.prepare_test_settings(alias)
+
+    def remove():
+        connections[alias].close()
+        del connections.databases[alias]
+        delattr(connections._connections, alias)
+    test.addCleanup(remove)
+    return connections[alias]
+
+
+class HotListingTestMixin:
+    """
+    Enables the hot listings with a journal in a temporary directory, and a batch size and flush interval large enough
+    that bids are only written to the database when the tests flush them.
+    """
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.journal = os.path.join(directory, "hot_bids.journal")
+        settings_override = override_settings(HOT_LISTINGS_ENABLED=True, HOT_BID_JOURNAL=self.journal,
+                                              HOT_BID_BATCH_SIZE=10000, HOT_BID_FLUSH_INTERVAL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_hot_listings()
+        self.addCleanup(reset_hot_listings)
+
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.seller, bid_count=1)
+        Bid.objects.create(listing=self.listing, bidder=self.seller, amount=1)
+
+    def write_journal(self, *amounts):
+        """
+        Writes bids of the bidder on the listing to the journal, as if a previous process had accepted them and crashed.
+        """
+        with open(self.journal, "w") as journal:
+            for amount in amounts:
+                journal.write(json.dumps({"listing": self.listing.pk, "bidder": self.bidder.pk,
+                                          "amount": str(amount)}) + "\n")
+
+
+class HotListingRecoveryTests(HotListingTestMixin, TestCase):
+    """
+    Recovery of the bids left in the journal by a process that crashed before writing them to the database.
+    """
+    def test_journal_is_replayed_before_closing(self):
+        self.write_journal("50.00")
+        self.client.force_login(self.seller)
+        self.client.get(reverse("close_listing", args=(self.listing.pk,)))
+
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.active)
+        self.assertEqual(self.listing.current_bid, Decimal("50.00"))
+        self.assertEqual(self.listing.winner, self.bidder)
+        self.assertFalse(os.path.exists(self.journal))
+
+    def test_bids_on_closed_listings_are_not_replayed(self):
+        Listing.objects.filter(pk=self.listing.pk).update(active=False, winner=self.seller)
+        self.write_journal("50.00")
+        hot.recover()
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid, Decimal("1.00"))
+        self.assertEqual(self.listing.winner, self.seller)
+        self.assertEqual(self.listing.bids.count(), 1)
+
+    def test_replay_skips_bids_already_written(self):
+        # The process crashed after committing the first bid but before removing its journal
+        Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=Decimal("5.00"))
+        Listing.objects.filter(pk=self.listing.pk).update(current_bid=Decimal("5.00"), bid_count=2)
+        self.write_journal("5.00", "7.50")
+        hot.recover()
+
+        self.listing.refresh_from_db()
+        self.assertEqual(list(self.listing.bids.values_list("amount", flat=True)),
+                         [Decimal("1.00"), Decimal("5.00"), Decimal("7.50")])
+        self.assertEqual(self.listing.current_bid, Decimal("7.50"))
+        self.assertEqual(self.listing.bid_count, 3)
+
+    def test_listing_page_shows_the_replayed_bids_after_a_restart(self):
+        self.write_journal("5.00", "7.50")
+        response = self.client.get(reverse("listing", args=(self.listing.pk,)))
+
+        self.assertEqual(response.context["listing"].current_bid, Decimal("7.50"))
+        self.assertEqual(response.context["min_required_bid"], Decimal("7.51"))
+        self.assertFalse(os.path.exists(self.journal))
+
+    def test_replayed_bids_notify_the_outbid_bidder(self):
+        other = User.objects.create_user("other", "other@example.com", "password")
+        self.assertTrue(hot.place_bid(self.listing.pk, other, Decimal("3.00")))
+        self.assertTrue(hot.place_bid(self.listing.pk, self.bidder, Decimal("5.00")))
+        # The process crashes before writing the bids
+        reset_hot_listings()
+        hot.recover()
+
+        self.assertEqual([job.payload["user_id"] for job in Job.objects.filter(kind="outbid")], [other.pk])
+
+    def test_torn_last_line_is_ignored(self):
+        self.write_journal("5.00")
+        with open(self.journal, "a") as journal:
+            journal.write('{"listing": %d, "bidder": %d, "amo' % (self.listing.pk, self.bidder.pk))
+        hot.recover()
+
+        self.assertEqual(list(self.listing.bids.values_list("amount", flat=True)), [Decimal("1.00"), Decimal("5.00")])
+
+    def test_listing_page_shows_new_comments_of_a_hot_listing(self):
+        self.assertTrue(hot.place_bid(self.listing.pk, self.bidder, Decimal("3.00")))
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("create_comment", args=(self.listing.pk,)), {"content": "Still available?"})
+
+        response = self.client.get(reverse("listing", args=(self.listing.pk,)))
+        self.assertContains(response, "Still available?")
+        self.assertEqual(response.context["listing"].current_bid, Decimal("3.00"))
+
+    def test_listings_being_flushed_are_not_evicted(self):
+        hot.get(self.listing.pk)
+        with override_settings(HOT_LISTINGS_MAX=0), hot._lock:
+            hot._in_flight.add(self.listing.pk)
+            hot.evict()
+            self.assertIn(self.listing.pk, hot._listings)
+            hot._in_flight.clear()
+            hot.evict()
+            self.assertNotIn(self.listing.pk, hot._listings)
+
+
+class HotListingConcurrencyTests(HotListingTestMixin, TransactionTestCase):
+    """
+    Bids placed on a hot listing by several threads at once.
+    """
+    def test_concurrent_bids(self):
+        bidders = [User.objects.create_user(f"bidder{i}", f"bidder{i}@example.com", "password") for i in range(8)]
+        # Load the listing before the threads start
+        hot.get(self.listing.pk)
+        accepted = []
+        barrier = threading.Barrier(len(bidders))
+
+        def bid(bidder, offset):
+            barrier.wait()
+            for step in range(20):
+                amount = Decimal(2 + step * len(bidders) + offset)
+                if hot.place_bid(self.listing.pk, bidder, amount):
+                    accepted.append(amount)
+
+        threads = [threading.Thread(target=bid, args=(bidder, offset)) for offset, bidder in enumerate(bidders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        hot.flush()
+
+        # Every accepted bid is written, in the order it was accepted, and was higher than the one before
+        amounts = list(self.listing.bids.order_by("pk").values_list("amount", flat=True))[1:]
+        self.assertEqual(sorted(amounts), sorted(accepted))
+        self.assertEqual(amounts, sorted(amounts))
+        self.assertEqual(len(set(amounts)), len(amounts))
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid, max(accepted))
+        self.assertEqual(self.listing.bid_count, len(accepted) + 1)
+        self.assertEqual(hot.get(self.listing.pk).bid_count, len(accepted) + 1)
+
+
+class AdminActionPermissionTests(TestCase):
+    """
+    Bulk actions of the admin require the permission of the change they make.
+    """
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", "staff@example.com", "password", is_staff=True)
+        self.staff.user_permissions.set(Permission.objects.filter(codename__in=["view_comment", "view_listing"]))
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.staff, bid_count=1)
+        Bid.objects.create(listing=self.listing, bidder=self.staff, amount=1)
+        self.comment = Comment.objects.create(user=self.staff, listing=self.listing, content="Nice lamp")
+        self.client.force_login(self.staff)
+
+    def test_view_permission_does_not_allow_deleting_comments(self):
+        for action in ["delete_comments", "delete_comments_by_authors"]:
+            self.client.post(reverse("admin:auctions_comment_changelist"),
+                             {"action": action, "_selected_action": [self.comment.pk]})
+        self.assertTrue(Comment.objects.filter(pk=self.comment.pk).exists())
+
+    def test_view_permission_does_not_allow_closing_listings(self):
+        self.client.post(reverse("admin:auctions_listing_changelist"),
+                         {"action": "close_listings", "_selected_action": [self.listing.pk]})
+        self.listing.refresh_from_db()
+        self.assertTrue(self.listing.active)
+
+
+class IdempotentSubmissionTests(TransactionTestCase):
+    """
+    Submissions replayed concurrently with the same idempotency key are only accepted once.
+    """
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.seller, bid_count=1)
+        Bid.objects.create(listing=self.listing, bidder=self.seller, amount=1)
+
+    def replay(self, url, data, times=5):
+        """
+        Posts the data to the url from several threads at once and returns the responses.
+        """
+        clients = []
+        for _ in range(times):
+            client = self.client_class()
+            client.force_login(self.bidder)
+            clients.append(client)
+        responses = [None] * times
+        barrier = threading.Barrier(times)
+
+        def post(index):
+            try:
+                barrier.wait()
+                responses[index] = clients[index].post(url, data)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post, args=(index,)) for index in range(times)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def assert_same_redirect(self, responses):
+        self.assertEqual({(response.status_code, response["Location"]) for response in responses},
+                         {(302, reverse("listing", args=(self.listing.pk,)))})
+
+    def test_bid_is_placed_once(self):
+        responses = self.replay(reverse("update_price", args=(self.listing.pk,)),
+                                {"amount": "5.00", "idempotency_key": uuid4()})
+        self.assert_same_redirect(responses)
+        self.assertEqual(Bid.objects.filter(listing=self.listing, bidder=self.bidder).count(), 1)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 2)
+
+    def test_comment_is_posted_once(self):
+        responses = self.replay(reverse("create_comment", args=(self.listing.pk,)),
+                                {"content": "Still available?", "idempotency_key": uuid4()})
+        self.assert_same_redirect(responses)
+        self.assertEqual(Comment.objects.filter(listing=self.listing).count(), 1)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.comment_count, 1)
+
+
+class ListingCounterTests(TestCase):
+    """
+    Bids and closing a listing do not overwrite the counters incremented by concurrent requests.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.seller, bid_count=1)
+        Bid.objects.create(listing=self.listing, bidder=self.seller, amount=1)
+
+    def increment_counters(self, sender, **kwargs):
+        """
+        Increments the counters of the listing in the database, as a concurrent request would, after the view has read
+        the listing.
+        """
+        Listing.objects.filter(pk=self.listing.pk).update(comment_count=F("comment_count") + 1,
+                                                          bid_count=F("bid_count") + 1)
+
+    def test_bid_keeps_concurrent_comment_count(self):
+        pre_save.connect(self.increment_counters, sender=Bid)
+        self.addCleanup(pre_save.disconnect, self.increment_counters, sender=Bid)
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("update_price", args=(self.listing.pk,)), {"amount": "5.00"})
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid, Decimal("5.00"))
+        self.assertEqual((self.listing.bid_count, self.listing.comment_count), (3, 1))
+
+    def test_close_keeps_concurrent_counts(self):
+        pre_save.connect(self.increment_counters, sender=Listing)
+        self.addCleanup(pre_save.disconnect, self.increment_counters, sender=Listing)
+        self.client.force_login(self.seller)
+        self.client.get(reverse("close_listing", args=(self.listing.pk,)))
+
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.active)
+        self.assertEqual((self.listing.bid_count, self.listing.comment_count), (2, 1))
+
+
+class BidListingTests(TestCase):
+    """
+    Listings the user has bid on and listings the user has won.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.other = User.objects.create_user("other", "other@example.com", "password")
+
+    def create_listing(self, bids, creator=None, **fields):
+        """
+        Creates a listing with the (bidder, amount) bids, the last one being the current bid.
+        """
+        creator = creator or self.seller
+        listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=bids[-1][1],
+                                         creator=creator, **fields)
+        Bid.objects.create(listing=listing, bidder=creator, amount=1)
+        for bidder, amount in bids:
+            Bid.objects.create(listing=listing, bidder=bidder, amount=amount)
+        return listing
+
+    def test_bid_listings_are_flagged_as_winning_or_outbid(self):
+        winning = self.create_listing([(self.bidder, 2), (self.other, 3), (self.bidder, 4)])
+        outbid = self.create_listing([(self.bidder, 2), (self.bidder, 3), (self.other, 5)])
+        # Closed listings and the initial bid on the user's own listings are left out
+        self.create_listing([(self.bidder, 2)], active=False)
+        self.create_listing([(self.other, 2)], creator=self.bidder)
+
+        with self.assertNumQueries(1):
+            listings = {listing.pk: listing for listing in util.get_bid_listings(self.bidder)}
+        self.assertEqual(set(listings), {winning.pk, outbid.pk})
+        self.assertEqual((listings[winning.pk].my_bid, listings[winning.pk].is_winning), (4, True))
+        self.assertEqual((listings[outbid.pk].my_bid, listings[outbid.pk].is_winning), (3, False))
+
+    def test_bid_listings_are_read_with_a_single_query(self):
+        for amount in range(2, 12):
+            self.create_listing([(self.bidder, amount), (self.other, amount + 1)])
+        with self.assertNumQueries(1):
+            listings = list(util.get_bid_listings(self.bidder))
+        self.assertEqual([listing.is_winning for listing in listings], [False] * 10)
+
+    def test_won_listings(self):
+        won = self.create_listing([(self.bidder, 2)], active=False, winner=self.bidder)
+        # Listings still open and listings won by other users are left out
+        self.create_listing([(self.bidder, 2)], winner=self.bidder)
+        self.create_listing([(self.bidder, 2), (self.other, 3)], active=False, winner=self.other)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(list(util.get_won_listings(self.bidder)), [won])
+
+    def test_my_bids_page(self):
+        self.create_listing([(self.bidder, 2)])
+        self.create_listing([(self.bidder, 2), (self.other, 3)])
+        self.client.force_login(self.bidder)
+        response = self.client.get(reverse("display_my_bids"))
+        self.assertContains(response, "You are the highest bidder.", count=1)
+        self.assertContains(response, "You have been outbid.", count=1)
+
+
+class CommentPageTests(TestCase):
+    """
+    Comment threads paginated by (date_posted, id) cursors.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.seller)
+
+    def create_comments(self, count, date_posted=None):
+        date_posted = date_posted or timezone.now()
+        Comment.objects.bulk_create([Comment(user=self.seller, listing=self.listing, content=f"Comment {i}",
+                                             date_posted=date_posted) for i in range(count)])
+
+    def read_pages(self):
+        pages, before = [], None
+        while True:
+            comments, before = util.get_comment_page(Comment.objects.filter(listing=self.listing), before)
+            pages.append([comment.pk for comment in comments])
+            if before is None:
+                return pages
+
+    def test_comments_posted_at_the_same_time_are_each_shown_once(self):
+        self.create_comments(util.COMMENTS_PER_PAGE * 2 + 5)
+        pages = self.read_pages()
+        self.assertEqual([len(page) for page in pages], [util.COMMENTS_PER_PAGE, util.COMMENTS_PER_PAGE, 5])
+        self.assertEqual(sum(pages, []), sorted(Comment.objects.values_list("pk", flat=True), reverse=True))
+
+    def test_pages_are_ordered_by_date_posted(self):
+        now = timezone.now()
+        self.create_comments(util.COMMENTS_PER_PAGE, now)
+        self.create_comments(util.COMMENTS_PER_PAGE, now - timedelta(days=1))
+        self.create_comments(1, now + timedelta(days=1))
+        dates = [Comment.objects.get(pk=pk).date_posted for page in self.read_pages() for pk in page]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(len(dates), util.COMMENTS_PER_PAGE * 2 + 1)
+
+    def test_a_full_last_page_has_no_next_page(self):
+        self.create_comments(util.COMMENTS_PER_PAGE * 2)
+        self.assertEqual([len(page) for page in self.read_pages()], [util.COMMENTS_PER_PAGE] * 2)
+
+        Comment.objects.all().delete()
+        self.assertEqual(self.read_pages(), [[]])
+
+    def test_malformed_cursors_show_the_newest_comments(self):
+        self.create_comments(util.COMMENTS_PER_PAGE + 1)
+        newest, before = util.get_comment_page(Comment.objects.all())
+        for cursor in (None, "", "abc", "1-2-3", "-1-2", "1-x", "99999999999999999999-1"):
+            self.assertIsNone(util.parse_comment_cursor(cursor))
+            self.assertEqual(util.get_comment_page(Comment.objects.all(), cursor), (newest, before))
+
+        Listing.objects.filter(pk=self.listing.pk).update(comment_count=util.COMMENTS_PER_PAGE + 1)
+        response = self.client.get(reverse("listing", args=(self.listing.pk,)), {"before": "abc"})
+        self.assertEqual(response.status_code, 200)
+
+
+class ListingBrowseTests(TestCase):
+    """
+    Filters, sort orders, category counts and pagination of the browse pages.
+    """
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.books, self.toys = Category.objects.create(name="Books"), Category.objects.create(name="Toys")
+        now = timezone.now()
+        # (title, price, number of bids, category, has an image), oldest first
+        self.listings = {title: Listing.objects.create(
+            title=title, description=title, init_bid=1, current_bid=price, bid_count=bids, category=category,
+            url="http://example.com/image.png" if image else "", creator=self.seller,
+            created_on=now - timedelta(hours=10 - i)) for i, (title, price, bids, category, image) in enumerate([
+                ("Atlas", 5, 3, self.books, True),
+                ("Ball", 30, 1, self.toys, False),
+                ("Chess", 20, 7, self.toys, True),
+                ("Dictionary", 10, 2, self.books, False),
+                ("Easel", 40, 4, None, True),
+            ])}
+        Listing.objects.create(title="Closed", description="Closed", init_bid=1, current_bid=15, category=self.books,
+                               creator=self.seller, active=False)
+
+    def browse(self, url=None, **params):
+        response = self.client.get(url or reverse("index"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def get_titles(self, context):
+        return [listing.title for listing in context["listings"]]
+
+    def test_filters(self):
+        context = self.browse(min_price=10, max_price=30)
+        self.assertEqual(self.get_titles(context), ["Dictionary", "Chess", "Ball"])
+        self.assertEqual((context["total"], context["with_image"]), (3, 1))
+
+        context = self.browse(has_image="on")
+        self.assertEqual(self.get_titles(context), ["Easel", "Chess", "Atlas"])
+        self.assertEqual((context["total"], context["with_image"]), (3, 3))
+
+    def test_invalid_filters_are_ignored(self):
+        context = self.browse(min_price="cheap", sort="random")
+        self.assertEqual(self.get_titles(context), ["Easel", "Dictionary", "Chess", "Ball", "Atlas"])
+
+    def test_sorts(self):
+        self.assertEqual(self.get_titles(self.browse(sort="price_asc")),
+                         ["Atlas", "Dictionary", "Chess", "Ball", "Easel"])
+        self.assertEqual(self.get_titles(self.browse(sort="price_desc")),
+                         ["Easel", "Ball", "Chess", "Dictionary", "Atlas"])
+        self.assertEqual(self.get_titles(self.browse(sort="bids")), ["Chess", "Easel", "Atlas", "Dictionary", "Ball"])
+
+    def test_category_counts_ignore_the_category_filter(self):
+        context = self.browse(category=self.toys.pk, max_price=25)
+        self.assertEqual(self.get_titles(context), ["Chess"])
+        self.assertEqual((context["total"], context["with_image"]), (1, 1))
+        # The other categories are counted with the other filters, and their links keep them
+        facets = {category.name: (count, query) for category, count, query in context["category_facets"]}
+        self.assertEqual({name: count for name, (count, _) in facets.items()}, {"Books": 2, "Toys": 1})
+        self.assertEqual(facets["Books"][1], f"category={self.books.pk}&max_price=25")
+
+    def test_category_page(self):
+        context = self.browse(reverse("display_single_category", args=(self.books.pk,)), sort="price_desc")
+        self.assertEqual(self.get_titles(context), ["Dictionary", "Atlas"])
+        self.assertEqual((context["total"], context["with_image"]), (2, 1))
+        self.assertNotIn("category", context["filter_form"].fields)
+        self.assertEqual(context["category_facets"], [])
+
+    def test_pages_are_not_counted_again(self):
+        Listing.objects.bulk_create([Listing(title=f"Lamp {i}", description="A lamp", init_bid=1, current_bid=1,
+                                             creator=self.seller) for i in range(util.LISTINGS_PER_PAGE)])
+        total = util.LISTINGS_PER_PAGE + 5
+        with CaptureQueriesContext(connection) as queries:
+            context = self.browse(page=2)
+        self.assertEqual(len(context["listings"]), 5)
+        self.assertEqual((context["total"], context["listings"].paginator.num_pages), (total, 2))
+        # The only count is the one of the category facets
+        self.assertEqual(len([query for query in queries if "COUNT(" in query["sql"]]), 1)
+
+
+class MinifyTests(TestCase):
+    """
+    Whitespace stripped from the HTML templates when they are loaded.
+    """
+    def test_indentation_and_blank_lines_are_removed(self):
+        self.assertEqual(loaders.minify("<div>\n    <a>Link</a>  \n\n    <span>Text</span>\n</div>\n"),
+                         "<div>\n<a>Link</a>\n<span>Text</span>\n</div>")
+
+    def test_preserved_elements_are_kept_as_written(self):
+        source = ("<form>\n  <textarea>\n  Line\n\n  </textarea>\n  <TEXTAREA rows=2> x </TEXTAREA>\n</form>\n"
+                  "<pre>\n    code\n</pre>\n<script>\n  if (a) {\n    b();\n  }\n</script>")
+        self.assertEqual(loaders.minify(source),
+                         "<form>\n<textarea>\n  Line\n\n  </textarea>\n<TEXTAREA rows=2> x </TEXTAREA>\n</form>\n"
+                         "<pre>\n    code\n</pre>\n<script>\n  if (a) {\n    b();\n  }\n</script>")
+
+    def test_templates_are_minified(self):
+        self.client.force_login(User.objects.create_user("user", "user@example.com", "password"))
+        self.assertNotIn(b"\n    ", self.client.get(reverse("create_listing")).content)
+
+
+def compressed_response(accept_encoding, response):
+    """
+    Returns the response as returned by CompressionMiddleware for a request accepting the encodings.
+    """
+    request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+    return middleware.CompressionMiddleware(lambda request: response)(request)
+
+
+class CompressionTests(TestCase):
+    """
+    Responses compressed by CompressionMiddleware.
+    """
+    content = b"<p>Lamp</p>\n" * 100
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_encoding_is_negotiated(self):
+        for accept_encoding, encoding in [("gzip, deflate, br", "br"), ("gzip", "gzip"), ("br;q=0.5, gzip", "gzip"),
+                                          ("br;q=0, gzip", "gzip"), ("gzip;q=0", None), ("*", "br"),
+                                          ("*;q=0.1, br;q=0", "gzip"), ("identity", None), ("", None),
+                                          ("gzip;q=1.0.0", None)]:
+            request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(compression.get_encoding(request), encoding, accept_encoding)
+
+    def test_gzip_is_used_without_brotli(self):
+        with mock.patch.object(compression, "brotli", None):
+            for accept_encoding, encoding in [("gzip, br", "gzip"), ("br", None), ("*", "gzip")]:
+                request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertEqual(compression.get_encoding(request), encoding, accept_encoding)
+
+    def test_responses_are_compressed(self):
+        response = compressed_response("gzip", HttpResponse(self.content))
+        self.assertEqual((response["Content-Encoding"], response["Vary"]), ("gzip", "Accept-Encoding"))
+        self.assertEqual(gzip.decompress(response.content), self.content)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_responses_are_compressed_with_brotli(self):
+        response = compressed_response("gzip, br", HttpResponse(self.content))
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(response.content), self.content)
+
+    def test_small_and_incompressible_responses_are_not_compressed(self):
+        for response in [HttpResponse(b"<p>Lamp</p>" * 20), HttpResponse(self.content, content_type="image/png"),
+                         HttpResponse(os.urandom(1024), content_type="text/plain")]:
+            response = compressed_response("gzip, br", response)
+            self.assertFalse(response.has_header("Content-Encoding"))
+
+        with override_settings(COMPRESSION_MIN_SIZE=8):
+            self.assertEqual(compressed_response("gzip", HttpResponse(b"<p>Lamp</p>" * 20))["Content-Encoding"], "gzip")
+
+    def test_uncompressed_responses_vary_on_the_encoding(self):
+        response = compressed_response("identity", HttpResponse(self.content))
+        self.assertEqual((response.content, response["Vary"]), (self.content, "Accept-Encoding"))
+
+    def assert_streamed(self, encoding, decompress):
+        chunks = [b"<p>Lamp</p>\n" * 10, b"", b"<p>Chair</p>\n" * 10]
+        response = compressed_response(encoding, StreamingHttpResponse(iter(chunks)))
+        self.assertEqual(response["Content-Encoding"], encoding)
+        self.assertFalse(response.has_header("Content-Length"))
+        # Each chunk is flushed as soon as it is produced
+        stream = iter(response.streaming_content)
+        first = next(stream)
+        self.assertLess(len(first), len(chunks[0]))
+        self.assertEqual(decompress(first + b"".join(stream)), b"".join(chunks))
+
+    def test_streaming_responses_are_compressed_as_they_are_streamed(self):
+        self.assert_streamed("gzip", gzip.decompress)
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_streaming_responses_are_compressed_with_brotli(self):
+        self.assert_streamed("br", compression.brotli.decompress)
+
+    def test_etags_become_weak(self):
+        response = HttpResponse(self.content)
+        response["ETag"] = '"lamp"'
+        self.assertEqual(compressed_response("gzip", response)["ETag"], 'W/"lamp"')
+
+        response = HttpResponse(self.content)
+        response["ETag"] = 'W/"lamp"'
+        self.assertEqual(compressed_response("gzip", response)["ETag"], 'W/"lamp"')
+
+
+class AutocompleteTests(TestCase):
+    """
+    Listing titles suggested from the prefix index of each process.
+    """
+    def setUp(self):
+        patcher = mock.patch.multiple(autocomplete, _index=None, _synced_at=None, _checked=None, _verified_up_to=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def create_listing(self, title, **fields):
+        return Listing.objects.create(title=title, description=title, init_bid=1, current_bid=1, creator=self.seller,
+                                      **fields)
+
+    def get_titles(self, prefix):
+        return [title for _, title in autocomplete.suggest(prefix)]
+
+    def test_prefix_search(self):
+        index = autocomplete.PrefixIndex(10)
+        index.load([(1, "Red  Lamp"), (2, "redwood table"), (3, "Blue lamp"), (4, "Red")])
+        self.assertEqual(index.search("RED", 10), [(4, "Red"), (1, "Red  Lamp"), (2, "redwood table")])
+        self.assertEqual(index.search("red ", 10), [(1, "Red  Lamp")])
+        self.assertEqual(index.search("red   l", 10), [(1, "Red  Lamp")])
+        self.assertEqual(index.search("red", 2), [(4, "Red"), (1, "Red  Lamp")])
+        self.assertEqual(index.search("green", 10), [])
+        self.assertEqual(index.search("  ", 10), [])
+
+    def test_oldest_titles_are_evicted(self):
+        index = autocomplete.PrefixIndex(2)
+        index.load([(1, "Lamp one"), (2, "Lamp two"), (3, "Lamp three")])
+        self.assertEqual(index.search("lamp", 10), [(3, "Lamp three"), (2, "Lamp two")])
+
+        index.add(4, "Lamp four")
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search("lamp", 10), [(4, "Lamp four"), (3, "Lamp three")])
+
+        # A new title replaces the previous title of the listing
+        index.add(3, "Chair")
+        self.assertEqual(index.search("lamp", 10), [(4, "Lamp four")])
+        self.assertEqual(index.search("ch", 10), [(3, "Chair")])
+
+    def test_listings_of_this_process_are_updated_right_away(self):
+        lamp = self.create_listing("Lamp")
+        self.assertEqual(self.get_titles("la"), ["Lamp"])
+
+        lantern = self.create_listing("Lantern")
+        # Test cases never commit, so run the callback right away
+        with mock.patch.object(transaction, "on_commit", lambda func: func()):
+            listing_created.send(sender=Listing, listing=lantern)
+        self.assertEqual(self.get_titles("la"), ["Lamp", "Lantern"])
+        lamp.delete()
+        self.assertEqual(self.get_titles("la"), ["Lantern"])
+
+    @override_settings(AUTOCOMPLETE_SYNC_INTERVAL=0)
+    def test_listings_changed_by_other_processes_are_synced(self):
+        lamp = self.create_listing("Lamp")
+        self.assertEqual(self.get_titles("la"), ["Lamp"])
+
+        # Other processes create and close listings
+        self.create_listing("Lantern")
+        Listing.objects.filter(pk=lamp.pk).update(active=False, modified_on=timezone.now())
+        self.assertEqual(self.get_titles("la"), ["Lantern"])
+
+    @override_settings(AUTOCOMPLETE_SYNC_INTERVAL=0, AUTOCOMPLETE_VERIFY_BATCH=2)
+    def test_listings_deleted_by_other_processes_are_removed(self):
+        listings = [self.create_listing(f"Lamp {i}") for i in range(5)]
+        listing_ids = [listing.pk for listing in listings]
+        self.assertEqual(len(self.get_titles("lamp")), 5)
+
+        # Another process deletes listings, which leaves no row to sync from
+        with mock.patch.object(autocomplete, "_index", None):
+            listings[0].delete()
+            listings[3].delete()
+        # Each sync checks the next two titles
+        self.assertEqual(self.get_titles("lamp"), ["Lamp 1", "Lamp 2", "Lamp 3", "Lamp 4"])
+        self.assertEqual(self.get_titles("lamp"), ["Lamp 1", "Lamp 2", "Lamp 4"])
+        self.assertEqual(autocomplete._verified_up_to, listing_ids[3])
+        self.get_titles("lamp")
+        self.assertEqual(autocomplete._verified_up_to, 0)
+
+
+class WarmupTests(TestCase):
+    """
+    Warm-up of a freshly started process.
+    """
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.multiple(autocomplete, _index=None, _synced_at=None, _checked=None, _verified_up_to=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_phase_is_run(self):
+        Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                               creator=User.objects.create_user("seller", "seller@example.com", "password"))
+        with mock.patch.object(hot, "enabled", return_value=True), mock.patch.object(hot, "recover") as recover:
+            timings = warmup.run(setup=0.5)
+        self.assertEqual([name for name, _ in timings], ["setup", "urls", "templates", "connections", "caches", "hot",
+                                                         "forms"])
+        self.assertTrue(all(seconds >= 0 for _, seconds in timings))
+        self.assertEqual(warmup.describe().split(", ")[0], "setup 500.0 ms")
+        # The caches held by the process are loaded and the journal of the hot listings is replayed
+        self.assertEqual(autocomplete._index.search("la", 10), [(Listing.objects.get().pk, "Lamp")])
+        recover.assert_called_once_with()
+
+    def test_given_phases_are_run(self):
+        self.assertEqual([name for name, _ in warmup.run(["urls", "forms"])], ["urls", "forms"])
+
+    def load_application(self, module_name):
+        """
+        Imports the application module again with the warm-up turned on and returns the phases it has run.
+        """
+        sys.modules.pop(module_name, None)
+        self.addCleanup(sys.modules.pop, module_name, None)
+        with override_settings(WARMUP=True), mock.patch.object(warmup, "run") as run:
+            importlib.import_module(module_name)
+        run.assert_called_once()
+        phases = run.call_args[0][0] if run.call_args[0] else None
+        return list(warmup.PHASES) if phases is None else phases
+
+    def test_asgi_application_skips_the_connections(self):
+        self.assertEqual(self.load_application("commerce.asgi"), ["urls", "templates", "caches", "hot", "forms"])
+
+    def test_wsgi_application_runs_every_phase(self):
+        self.assertEqual(self.load_application("commerce.wsgi"), list(warmup.PHASES))
+
+
+class CategoryChoicesTests(TestCase):
+    """
+    Categories held in memory by each process.
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_categories_changed_by_another_process_appear_once_the_version_expires(self):
+        Category.objects.create(name="Books")
+        version, choices = categories.get_choices()
+        self.assertEqual([name for _, name in choices], ["Books"])
+
+        # Another process, which does not share the cache, adds a category
+        Category.objects.bulk_create([Category(name="Toys")])
+        self.assertEqual(categories.get_choices(), (version, choices))
+
+        # The version expires after CATEGORIES_VERSION_TIMEOUT seconds
+        cache.delete(categories.VERSION_KEY)
+        new_version, choices = categories.get_choices()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual([name for _, name in choices], ["Books", "Toys"])
+
+    def test_every_process_computes_the_same_version(self):
+        Category.objects.create(name="Books")
+        version, _ = categories.get_choices()
+        cache.delete(categories.VERSION_KEY)
+        self.assertEqual(categories.get_choices()[0], version)
+
+
+class PageCacheTests(TestCase):
+    """
+    Pages cached for logged out users, in processes that do not share their cache.
+    """
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.seller)
+
+    def get_etag(self):
+        return self.client.get(reverse("index"))["ETag"]
+
+    def test_listing_changed_by_another_process_appears_once_the_time_expires(self):
+        etag = self.get_etag()
+
+        # Another process, which does not share the cache, closes the listing
+        Listing.objects.filter(pk=self.listing.pk).update(active=False, modified_on=self.listing.modified_on +
+                                                          timedelta(seconds=1))
+        self.assertEqual(self.get_etag(), etag)
+
+        # The time of the last change expires after LAST_MODIFIED_TIMEOUT seconds
+        cache.delete(pagecache.LAST_MODIFIED_KEY)
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_trending_refresh_changes_the_pages(self):
+        etag = self.get_etag()
+        Watchlist.objects.create(user=self.seller).listings.add(self.listing)
+        trending.refresh()
+        cache.delete(pagecache.LAST_MODIFIED_KEY)
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_category_change_changes_the_pages(self):
+        etag = self.get_etag()
+        Category.objects.bulk_create([Category(name="Toys")])
+        cache.delete(categories.VERSION_KEY)
+        self.assertNotEqual(self.get_etag(), etag)
+
+
+class ExportTests(TestCase):
+    """
+    Exports of the bids and watchlist entries.
+    """
+    def test_csv_cells_are_not_read_as_formulas(self):
+        seller = User.objects.create_user("seller", "seller@example.com", "password")
+        bidder = User.objects.create_user("@bidder", "bidder@example.com", "password")
+        listing = Listing.objects.create(title='=HYPERLINK("http://example.com")', description="A lamp", init_bid=1,
+                                         current_bid=2, creator=seller)
+        Bid.objects.create(listing=listing, bidder=bidder, amount=2)
+        self.client.force_login(seller)
+
+        response = self.client.get(reverse("export", args=("bids",)), {"format": "csv"})
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[1][2:], ["'=HYPERLINK(\"http://example.com\")", "'@bidder", "2.00"])
+
+
+class FailingEmailBackend(EmailBackend):
+    """
+    Email backend that fails to send the messages to the addresses of the failing domain.
+    """
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].endswith("@failing.example.com"):
+                raise ConnectionError(f"Could not send to {message.to[0]}")
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="auctions.tests.FailingEmailBackend")
+class JobTests(TestCase):
+    """
+    Background jobs and the notifications they send.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.seller)
+
+    def test_jobs_sent_before_a_failure_are_not_sent_again(self):
+        winners = [User.objects.create_user("winner", "winner@example.com", "password"),
+                   User.objects.create_user("failing", "winner@failing.example.com", "password")]
+        for winner in winners:
+            jobs.enqueue("auction_won", {"listing_id": self.listing.pk, "user_id": winner.pk})
+
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [["winner@example.com"]])
+        job = Job.objects.get()
+        self.assertEqual((job.payload["user_id"], job.attempts, job.claim), (winners[1].pk, 1, ""))
+        self.assertIn("ConnectionError", job.last_error)
+
+        # Only the failed job is retried
+        Job.objects.update(run_after=job.created_on)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_waiting_jobs_with_the_same_key_are_merged(self):
+        jobs.enqueue("outbid", {"listing_id": self.listing.pk, "user_id": 1}, coalesce_key="outbid:1")
+        jobs.enqueue("outbid", {"listing_id": self.listing.pk, "user_id": 2}, coalesce_key="outbid:1")
+        self.assertEqual(list(Job.objects.values_list("payload", flat=True)),
+                         [{"listing_id": self.listing.pk, "user_id": 2}])
+
+        # A concurrent enqueue that did not see the waiting job cannot create a second one
+        with self.assertRaises(IntegrityError):
+            Job.objects.create(kind="outbid", coalesce_key="outbid:1")
+
+    def test_failed_job_is_replaced_by_a_waiting_job_with_the_same_key(self):
+        failing = User.objects.create_user("failing", "bidder@failing.example.com", "password")
+        jobs.enqueue("auction_won", {"listing_id": self.listing.pk, "user_id": failing.pk}, coalesce_key="won")
+        claimed = jobs.claim_jobs(10)
+        # Enqueued while the first job is running
+        jobs.enqueue("auction_won", {"listing_id": self.listing.pk, "user_id": failing.pk}, coalesce_key="won")
+
+        jobs.retry(claimed[0], ConnectionError())
+        self.assertEqual(list(Job.objects.values_list("attempts", flat=True)), [0])
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Reads routed to a replica held in a second SQLite file, a copy of the primary that does not receive its later
+    writes.
+    """
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1, creator=self.seller)
+
+        # Copy the primary to the replica file
+        replica = add_sqlite_database(self, "replica")
+        connection.ensure_connection()
+        replica.ensure_connection()
+        connection.connection.backup(replica.connection)
+
+        # Only the primary has the second listing
+        Listing.objects.create(title="Vase", description="A vase", init_bid=1, current_bid=1, creator=self.seller)
+
+    def test_browse_pages_read_from_the_replica(self):
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "Lamp")
+        self.assertNotContains(response, "Vase")
+
+    def test_session_that_has_written_reads_from_the_primary(self):
+        self.client.cookies[middleware.PRIMARY_PIN_COOKIE] = "1"
+        self.assertContains(self.client.get(reverse("index")), "Vase")
+
+    def test_other_reads_go_to_the_primary(self):
+        self.assertEqual(Listing.objects.count(), 2)
+        # The claimed jobs are read back after the claim
+        jobs.enqueue("auction_won", {"listing_id": 0, "user_id": 0})
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(Job.objects.exists())
+
+
+def add_archive_database(test):
+    """
+    Adds the separate archive database for the duration of the test, with the archive tables.
+    """
+    add_sqlite_database(test, "archive")
+    call_command("migrate", "auctions", database="archive", verbosity=0)
+
+
+class ArchiveTests(TestCase):
+    """
+    Archiving of the listings closed long ago and the pages of the archived listings.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=5,
+                                              creator=self.seller, winner=self.bidder, active=False,
+                                              closed_on=timezone.now() - timedelta(days=100), comment_count=1)
+        Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=5)
+        Comment.objects.create(listing=self.listing, user=self.bidder, content="Nice lamp")
+        Watchlist.objects.create(user=self.bidder).listings.add(self.listing)
+
+    def archive(self):
+        output = StringIO()
+        call_command("archive_closed_auctions", stdout=output)
+        return output.getvalue()
+
+    def assert_archived(self):
+        self.assertFalse(Listing.objects.filter(pk=self.listing.pk).exists())
+        archived = ArchivedListing.objects.get(pk=self.listing.pk)
+        self.assertEqual((archived.bids.count(), archived.watches.count()), (1, 1))
+        self.assertEqual([comment.content for comment in archived.comments.all()], ["Nice lamp"])
+
+        # The listing page shows the archived listing
+        self.client.force_login(self.bidder)
+        response = self.client.get(reverse("listing", args=(self.listing.pk,)))
+        self.assertContains(response, "You won this auction.")
+        self.assertContains(response, "Nice lamp")
+
+    def test_listings_closed_long_ago_are_archived(self):
+        recent = Listing.objects.create(title="Vase", description="A vase", init_bid=1, current_bid=1,
+                                        creator=self.seller, active=False, closed_on=timezone.now())
+        self.assertIn("Done, archived 1 listings", self.archive())
+        self.assert_archived()
+        self.assertTrue(Listing.objects.filter(pk=recent.pk).exists())
+
+    @override_settings(ARCHIVE_DATABASE="archive")
+    def test_listings_are_archived_to_a_separate_database(self):
+        add_archive_database(self)
+        self.assertIn("Done, archived 1 listings", self.archive())
+        self.assert_archived()
+
+    @override_settings(ARCHIVE_DATABASE="archive")
+    def test_listing_commented_while_it_is_copied_is_left_for_the_next_run(self):
+        add_archive_database(self)
+        copy_listings = archive.copy_listings
+
+        def copy_then_comment(*args, **kwargs):
+            copied = copy_listings(*args, **kwargs)
+            Comment.objects.create(listing=self.listing, user=self.seller, content="Late comment")
+            return copied
+
+        with mock.patch.object(archive, "copy_listings", copy_then_comment):
+            self.assertIn("Done, archived 0 listings", self.archive())
+        self.assertEqual(Comment.objects.filter(listing=self.listing).count(), 2)
+
+        self.assertIn("Done, archived 1 listings", self.archive())
+        self.assertEqual(ArchivedComment.objects.filter(listing=self.listing.pk).count(), 2)
+
+
+class CloseListingTests(TestCase):
+    """
+    Closing a listing.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=5,
+                                              creator=self.seller, bid_count=2)
+        Bid.objects.create(listing=self.listing, bidder=self.seller, amount=1)
+        Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=5)
+
+    def test_only_the_creator_can_close_the_listing(self):
+        url = reverse("close_listing", args=(self.listing.pk,))
+        self.assertRedirects(self.client.get(url), f"{reverse('login')}?next={url}", fetch_redirect_response=False)
+        self.client.force_login(self.bidder)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertTrue(Listing.objects.get(pk=self.listing.pk).active)
+
+    def test_closing_twice_notifies_the_winner_once(self):
+        self.client.force_login(self.seller)
+        self.client.get(reverse("close_listing", args=(self.listing.pk,)))
+        closed_on = Listing.objects.get(pk=self.listing.pk).closed_on
+        self.client.get(reverse("close_listing", args=(self.listing.pk,)))
+
+        self.assertEqual(list(Job.objects.values_list("kind", flat=True)), ["auction_won"])
+        listing = Listing.objects.get(pk=self.listing.pk)
+        self.assertEqual((listing.active, listing.winner, listing.closed_on), (False, self.bidder, closed_on))
+
+
+@ratelimit.rate_limit
+def limited(request, listing_id):
+    return HttpResponse("OK")
+
+
+@override_settings(RATE_LIMITS={"limited": {"user": (2, 60), "ip": (3, 60), "listing": (4, 60)}})
+class RateLimitTests(TestCase):
+    """
+    Rate limits of the views, with both backends.
+    """
+    BACKENDS = ["auctions.ratelimit.CacheBackend", "auctions.ratelimit.MemoryBackend"]
+
+    def setUp(self):
+        cache.clear()
+        ratelimit.get_backend.cache_clear()
+        self.addCleanup(ratelimit.get_backend.cache_clear)
+        self.users = [User.objects.create_user(f"user{i}", f"user{i}@example.com", "password") for i in range(4)]
+
+    def request(self, user=None, listing_id=1, **headers):
+        request = RequestFactory().post("/", **headers)
+        request.user = user or AnonymousUser()
+        return limited(request, listing_id=listing_id)
+
+    def test_requests_over_the_user_limit_are_rejected(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend), override_settings(RATE_LIMIT_BACKEND=backend):
+                cache.clear()
+                self.assertEqual([self.request(self.users[0], listing_id=0).status_code for _ in range(2)],
+                                 [200, 200])
+                response = self.request(self.users[0], listing_id=0)
+                self.assertEqual(response.status_code, 429)
+                self.assertTrue(0 < int(response["Retry-After"]) <= 60)
+                # Other users are not limited
+                self.assertEqual(self.request(self.users[1], listing_id=0).status_code, 200)
+
+    def test_requests_over_the_listing_limit_are_rejected(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend), override_settings(RATE_LIMIT_BACKEND=backend):
+                cache.clear()
+                statuses = [self.request(user, listing_id=2).status_code for user in self.users + self.users[:1]]
+                self.assertEqual(statuses, [200, 200, 200, 200, 429])
+                self.assertEqual(self.request(self.users[1], listing_id=3).status_code, 200)
+
+    def test_client_address_is_read_from_the_configured_header(self):
+        # The proxy appends the address of the client to the addresses sent by the client
+        headers = {"HTTP_X_FORWARDED_FOR": "10.0.0.1, 192.0.2.1"}
+        with override_settings(RATE_LIMIT_CLIENT_ADDRESS="HTTP_X_FORWARDED_FOR"):
+            statuses = [self.request(listing_id=i, **headers).status_code for i in range(4)]
+            self.assertEqual(statuses, [200, 200, 200, 429])
+            self.assertEqual(self.request(listing_id=4, HTTP_X_FORWARDED_FOR="192.0.2.2").status_code, 200)
+
+    def test_client_address_is_not_limited_by_default(self):
+        # Behind the proxy every client has the address of the proxy
+        statuses = [self.request(listing_id=i, REMOTE_ADDR="127.0.0.1").status_code for i in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 200])
+
+
+class TrendingTests(TestCase):
+    """
+    Trending scores computed from the bid and watch events.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = Listing.objects.create(title="Lamp", description="A lamp", init_bid=1, current_bid=1,
+                                              creator=self.seller)
+        self.bid = Bid.objects.create(listing=self.listing, bidder=self.seller, amount=1)
+
+    def get_score(self):
+        rank = ListingRank.objects.filter(listing=self.listing).first()
+        return rank and rank.score
+
+    def test_initial_bid_of_the_creator_is_not_counted(self):
+        self.assertEqual(trending.refresh(), 1)
+        self.assertIsNone(self.get_score())
+
+    def test_adding_a_listing_to_the_watchlist_again_is_not_counted(self):
+        watchlist = Watchlist.objects.create(user=self.bidder)
+        watchlist.listings.add(self.listing)
+        trending.refresh()
+        score = self.get_score()
+        self.assertIsNotNone(score)
+
+        watchlist.listings.remove(self.listing)
+        watchlist.listings.add(self.listing)
+        self.assertEqual(trending.refresh(), 1)
+        self.assertEqual(self.get_score(), score)
+
+    def test_bids_committed_after_later_bids_are_read_are_counted(self):
+        trending.refresh()
+        late, later = [Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=amount) for amount in (2, 3)]
+        # The transaction of the first bid has not committed when the second bid is read
+        late_id = late.pk
+        late.delete()
+        self.assertEqual(trending.refresh(), 1)
+        cursor = EventCursor.objects.get(name=trending.CURSOR_NAME)
+        self.assertEqual((cursor.last_bid_id, [pk for pk, _ in cursor.bid_gaps]), (later.pk, [late_id]))
+
+        Bid.objects.create(pk=late_id, listing=self.listing, bidder=self.bidder, amount=2)
+        self.assertEqual(trending.refresh(), 1)
+        self.assertEqual(EventCursor.objects.get(name=trending.CURSOR_NAME).bid_gaps, [])
+        self.assertEqual(trending.refresh(), 0)
+
+    def test_gaps_expire(self):
+        trending.refresh()
+        late, _ = [Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=amount) for amount in (2, 3)]
+        late_id = late.pk
+        late.delete()
+        trending.refresh()
+
+        # Rolled back transactions never commit their bids
+        with override_settings(EVENT_GAP_TIMEOUT=0):
+            Bid.objects.create(pk=late_id, listing=self.listing, bidder=self.bidder, amount=2)
+            self.assertEqual(trending.refresh(), 0)
+            Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=4)
+            self.assertEqual(trending.refresh(), 1)
+        self.assertEqual(EventCursor.objects.get(name=trending.CURSOR_NAME).bid_gaps, [])
+
+
+class SimilarityTests(TestCase):
+    """
+    Similar listings computed from the bid and watch events.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listings = [Listing.objects.create(title=f"Lamp {i}", description="A lamp", init_bid=1, current_bid=1,
+                                                creator=self.seller) for i in range(4)]
+        for listing in self.listings:
+            Bid.objects.create(listing=listing, bidder=self.seller, amount=1)
+
+    def get_score(self, listing, similar):
+        row = ListingSimilarity.objects.filter(listing=listing, similar=similar).first()
+        return row and row.score
+
+    def test_first_interactions_pair_listings(self):
+        first, second = self.listings[:2]
+        Bid.objects.create(listing=first, bidder=self.bidder, amount=2)
+        Watchlist.objects.create(user=self.bidder).listings.add(second)
+        similarity.update()
+        self.assertAlmostEqual(self.get_score(first, second), 1 / math.log2(3))
+        self.assertAlmostEqual(self.get_score(second, first), 1 / math.log2(3))
+        self.assertEqual(similarity.get_similar_listings(first.pk), [second])
+
+        # Bidding again on a listing says nothing new
+        Bid.objects.create(listing=first, bidder=self.bidder, amount=3)
+        self.assertEqual(similarity.update(), 1)
+        self.assertAlmostEqual(self.get_score(first, second), 1 / math.log2(3))
+
+    def test_users_with_too_many_listings_are_ignored(self):
+        with override_settings(SIMILAR_MAX_USER_LISTINGS=2):
+            for listing in self.listings:
+                Bid.objects.create(listing=listing, bidder=self.bidder, amount=2)
+            similarity.update()
+        self.assertIsNotNone(self.get_score(self.listings[0], self.listings[1]))
+        self.assertIsNone(self.get_score(self.listings[3], self.listings[0]))
+
+    @override_settings(SIMILAR_MAX_USER_LISTINGS=2)
+    def test_only_the_last_interactions_of_a_user_are_read(self):
+        for amount in range(2, 12):
+            Bid.objects.create(listing=self.listings[amount % 4], bidder=self.bidder, amount=amount)
+        cursor = EventCursor.objects.create(name="test", last_bid_id=Bid.objects.latest("pk").pk)
+        with self.assertNumQueries(2):
+            listings = similarity.get_user_listings({self.bidder.pk}, cursor)
+        self.assertEqual(list(listings[self.bidder.pk]), [self.listings[i].pk for i in (1, 2, 3)])
+
+
+class ProfilingTests(TestCase):
+    """
+    Requests profiled on demand by staff users.
+    """
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        overridden = override_settings(PROFILE_DIR=self.profile_dir)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.staff = User.objects.create_user("staff", "staff@example.com", "password", is_staff=True)
+
+    def get_files(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_staff_requests_are_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("index"), {"profile": "1"})
+        name = response["X-Profile"]
+        self.assertTrue(name.startswith("index-"))
+        self.assertEqual(self.get_files(), [name + ".folded", name + ".prof", name + ".sql.folded"])
+
+    def test_streaming_responses_are_profiled_once_streamed(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("export", args=("bids",)), {"format": "csv"}, HTTP_X_PROFILE="1")
+        self.assertEqual(self.get_files(), [])
+        b"".join(response.streaming_content)
+        self.assertEqual(self.get_files(), [response["X-Profile"] + extension for extension in (".folded", ".prof",
+                                                                                                ".sql.folded")])
+
+    def test_other_requests_are_not_profiled(self):
+        self.client.force_login(User.objects.create_user("user", "user@example.com", "password"))
+        response = self.client.get(reverse("index"), {"profile": "1"})
+        self.assertFalse(response.has_header("X-Profile"))
+        self.assertEqual(self.get_files(), [])
+
+
+class CommentCountTests(TransactionTestCase):
+    """
+    Comment counts of the listings kept up to date when comments are deleted.
+    """
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.spammer = User.objects.create_user("spammer", "spammer@example.com", "password")
+        self.listings = [Listing.objects.create(title=title, description=title, init_bid=1, current_bid=1,
+                                                creator=self.seller, comment_count=2) for title in ("Lamp", "Vase")]
+        for listing in self.listings:
+            Comment.objects.create(listing=listing, user=self.seller, content="Still available")
+            Comment.objects.create(listing=listing, user=self.spammer, content="Buy now")
+
+    def get_counts(self):
+        return [Listing.objects.get(pk=listing.pk).comment_count for listing in self.listings]
+
+    def test_deleting_a_user_recounts_the_comments_of_the_listings(self):
+        self.spammer.delete()
+        self.assertEqual(self.get_counts(), [1, 1])
+
+    def test_deleting_a_comment_recounts_after_a_rolled_back_delete(self):
+        try:
+            with transaction.atomic():
+                Comment.objects.filter(user=self.spammer).delete()
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(self.get_counts(), [2, 2])
+
+        Comment.objects.filter(user=self.seller, listing=self.listings[1]).delete()
+        self.assertEqual(self.get_counts(), [2, 1])
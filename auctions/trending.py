@@ -0,0 +1,122 @@
+import math
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import events, pagecache
+from .models import Listing, ListingRank, ListingWatcher
+
+# Name of the event cursor of the trending rankings
+CURSOR_NAME = "trending"
+
+
+def get_decay():
+    """
+    Returns the decay rate of the scores per second.
+    """
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def get_trending_listings():
+    """
+    Returns the TRENDING_LISTINGS active listings with the highest trending scores, read from the score index.
+    """
+    ranks = (ListingRank.objects.filter(listing__active=True).select_related("listing")
+             .order_by("-score")[:settings.TRENDING_LISTINGS])
+    return [rank.listing for rank in ranks]
+
+
+def refresh(batch_size=None):
+    """
+    Adds the bid and watch events since the last refresh to the scores of their listings. The events are read in
+    batches, each processed in its own transaction, so the work done is proportional to the number of new events.
+    Events are dated at the time of the refresh since bids and watchlist entries are not timestamped. Returns the
+    number of events processed.
+    """
+    batch_size = batch_size or settings.TRENDING_BATCH_SIZE
+    processed = 0
+    while True:
+        with transaction.atomic():
+            cursor, bids, watches = events.read_events(CURSOR_NAME, batch_size)
+            if not bids and not watches:
+                break
+
+            # Sum the weights of the new events per listing
+            weights = {}
+            creators = dict(Listing.objects.filter(pk__in={listing_id for _, listing_id, _ in bids + watches})
+                            .values_list("pk", "creator"))
+            for _, listing_id, bidder_id in bids:
+                # The initial bid of a listing is placed by its creator and shows no interest in the listing
+                if creators.get(listing_id) != bidder_id:
+                    weights[listing_id] = weights.get(listing_id, 0) + settings.TRENDING_BID_WEIGHT
+            for listing_id, _ in get_first_watches(watches, creators):
+                weights[listing_id] = weights.get(listing_id, 0) + settings.TRENDING_WATCH_WEIGHT
+            add_scores(weights, time.time())
+
+            events.advance(cursor, bids, watches)
+            processed += len(bids) + len(watches)
+
+    if processed:
+        # The home page shows the trending listings
+        pagecache.invalidate(sender=ListingRank)
+    return processed
+
+
+def get_first_watches(watches, listing_ids):
+    """
+    Returns the (listing id, user id) pairs of the watchlist entries that add a listing to the watchlist of a user for
+    the first time, and records them. Adding a listing again after removing it creates a new entry, which is left out.
+    Entries of listings that are not in listing_ids, since they have been deleted in the meantime, are skipped.
+    """
+    pairs = {(listing_id, user_id) for _, listing_id, user_id in watches if listing_id in listing_ids}
+    if not pairs:
+        return set()
+    watched = set(ListingWatcher.objects.filter(listing__in={listing_id for listing_id, _ in pairs},
+                                                user__in={user_id for _, user_id in pairs})
+                  .values_list("listing", "user"))
+    first = pairs - watched
+    ListingWatcher.objects.bulk_create([ListingWatcher(listing_id=listing_id, user_id=user_id)
+                                        for listing_id, user_id in first])
+    return first
+
+
+def add_scores(weights, now):
+    """
+    Adds events with the given weight per listing, happening at the time now, to the scores of the listings.
+    """
+    offset = get_decay() * now
+    ranks = ListingRank.objects.in_bulk(list(weights))
+    # Events of listings that have been deleted in the meantime are skipped
+    listing_ids = set(Listing.objects.filter(pk__in=[pk for pk in weights if pk not in ranks])
+                      .values_list("pk", flat=True))
+
+    new_ranks = []
+    for listing_id, weight in weights.items():
+        score = math.log(weight) + offset
+        if listing_id in ranks:
+            ranks[listing_id].score = add_logs(ranks[listing_id].score, score)
+        elif listing_id in listing_ids:
+            new_ranks.append(ListingRank(listing_id=listing_id, score=score))
+    ListingRank.objects.bulk_update(ranks.values(), ["score"], batch_size=500)
+    ListingRank.objects.bulk_create(new_ranks, batch_size=500)
+
+
+def add_logs(a, b):
+    """
+    Returns log(exp(a) + exp(b)) without overflowing.
+    """
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def prune():
+    """
+    Deletes the scores of the closed listings and the scores that have decayed below TRENDING_PRUNE_BELOW, so that the
+    ranking table only holds the listings with recent activity. Returns the number of deleted scores.
+    """
+    floor = math.log(settings.TRENDING_PRUNE_BELOW) + get_decay() * time.time()
+    deleted, _ = ListingRank.objects.filter(score__lt=floor).delete()
+    closed, _ = ListingRank.objects.filter(listing__active=False).delete()
+    return deleted + closed
@@ -12,8 +12,12 @@ urlpatterns = [
     path("updateprice/<int:listing_id>", views.update_price, name="update_price"),
     path("editwatchlist/<int:listing_id>", views.edit_watchlist, name="edit_watchlist"),
     path("watchlist", views.display_watchlist, name="display_watchlist"),
+    path("mybids", views.display_my_bids, name="display_my_bids"),
+    path("won", views.display_won_listings, name="display_won_listings"),
+    path("export/<str:kind>", views.export, name="export"),
     path("close/<int:listing_id>", views.close_listing, name="close_listing"),
     path("comment/<int:listing_id>", views.create_comment, name="create_comment"),
+    path("autocomplete", views.suggest_titles, name="autocomplete"),
     path("categories", views.display_all_categories, name="display_all_categories"),
     path("category/<int:category_id>", views.display_single_category, name="display_single_category"),
 ]
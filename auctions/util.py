@@ -1,22 +1,49 @@
+import threading
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from .models import Watchlist, Listing, Comment
 
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
-def get_listing_data(request, listing):
+from . import hot
+from .models import Watchlist, Listing, Comment, Bid, ArchivedListing
+
+# Number of comments displayed per page on the listing page
+COMMENTS_PER_PAGE = 20
+
+# Number of listings displayed per page on the browse pages
+LISTINGS_PER_PAGE = 50
+
+# Orderings of the sort options of the browse pages. Each of them is served by an index on the listings.
+LISTING_ORDERINGS = {
+    "newest": ["-created_on"],
+    "price_asc": ["current_bid"],
+    "price_desc": ["-current_bid"],
+    "bids": ["-bid_count"],
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def get_listing_data(request, listing, before=None):
     """
     Returns the following listing attributes.
     in_watchlist: boolean value to indicate whether the listing is in the user's watchlist
     is_creator: boolean value to indicate whether the user is the creator of the listing
     is_winner: boolean value to indicate whether the user is the winner of the auction
-    comments: set of Comment objects of the listing
+    comments: list of Comment objects on the requested page of the listing's comments
+    next_comments: cursor of the page of older comments, or None if there are no older comments
     min_required_bid: equal to current bid + 0.01 if other users have placed bids. If no bids have been placed yet this
     will be equal to the initial bid.
+    The before argument is a cursor returned in next_comments. If it is None, the newest comments are returned.
     """
     # Initialize variables
     in_watchlist = False
     is_creator = False
     is_winner = False
-    comments = None
     min_required_bid = listing.init_bid
 
     # Check if the user is logged in
@@ -32,13 +59,141 @@ def get_listing_data(request, listing):
         if request.user == listing.winner:
             is_winner = True
 
-    # Check if there is a Comment object associated with this listing
-    if Comment.objects.filter(listing=listing).exists():
-        # Get all comment objects associated with this listing
-        comments = Comment.objects.filter(listing=listing)
+    # Get a single page of comments. The comment count is stored on the listing so the comments are only queried when
+    # there are any.
+    comments, next_comments = [], None
+    if listing.comment_count:
+        comments, next_comments = get_comment_page(
+            Comment.objects.filter(listing=listing).select_related("user"), before)
 
-    # If any bid exists other than the initial bid, set the min_required_bid to current_bid + 0.01
-    if len(listing.bids.all()) > 1:
+    # If any bid exists other than the initial bid, set the min_required_bid to current_bid + 0.01. The bid count
+    # includes the bids held in memory by the hot listing cache.
+    if hot.get_bid_count(listing) > 1:
         min_required_bid = listing.current_bid + Decimal(0.01)
 
-    return in_watchlist, is_creator, is_winner, comments, round(min_required_bid, 2)
+    return in_watchlist, is_creator, is_winner, comments, next_comments, round(min_required_bid, 2)
+
+
+def get_comment_page(comments, before=None):
+    """
+    Returns a page of the comments of a listing, newest first, and the cursor of the next (older) page or None if this
+    is the last page. Works for both the comments and the archived comments of a listing.
+    Pages are keyed by (date_posted, id) of the last comment on the previous page rather than by an offset, so that each
+    page is read from the (listing, -date_posted) index regardless of how deep it is.
+    """
+    comments = comments.order_by("-date_posted", "-id")
+
+    # Only keep the comments older than the cursor. Ignore malformed cursors and return the newest comments.
+    position = parse_comment_cursor(before)
+    if position is not None:
+        date_posted, pk = position
+        comments = comments.filter(Q(date_posted__lt=date_posted) | Q(date_posted=date_posted, id__lt=pk))
+
+    # Fetch one extra comment to find out whether there is a next page
+    comments = list(comments[:COMMENTS_PER_PAGE + 1])
+    if len(comments) > COMMENTS_PER_PAGE:
+        comments = comments[:COMMENTS_PER_PAGE]
+        last = comments[-1]
+        return comments, f"{(last.date_posted - EPOCH) // timedelta(microseconds=1)}-{last.id}"
+    return comments, None
+
+
+def parse_comment_cursor(cursor):
+    """
+    Returns the (date_posted, id) pair encoded in a comment cursor, or None if the cursor is missing or malformed.
+    """
+    try:
+        micros, pk = cursor.split("-")
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def get_bid_listings(user):
+    """
+    Returns the active listings the user has placed a bid on, in a single query. Each listing is annotated with:
+    my_bid: the highest bid of the user on the listing
+    is_winning: boolean value to indicate whether the user's highest bid is the current bid of the listing
+    Listings created by the user are excluded since their initial bid is recorded under the creator.
+    """
+    # Highest bid of the user per listing, resolved from the (bidder, listing, amount) index
+    my_bid = Bid.objects.filter(bidder=user, listing=OuterRef("pk")).values("listing").annotate(
+        highest=Max("amount")).values("highest")
+
+    return Listing.objects.filter(
+        active=True, pk__in=Bid.objects.filter(bidder=user).values("listing")
+    ).exclude(creator=user).annotate(
+        my_bid=Subquery(my_bid)
+    ).annotate(
+        is_winning=ExpressionWrapper(Q(current_bid__lte=F("my_bid")), output_field=BooleanField())
+    )
+
+
+def get_won_listings(user):
+    """
+    Returns the closed listings won by the user, resolved from the (winner, active) index.
+    """
+    return Listing.objects.filter(winner=user, active=False)
+
+
+def get_archived_won_listings(user):
+    """
+    Returns the archived listings won by the user.
+    """
+    return ArchivedListing.objects.filter(winner_id=user.pk).order_by("-closed_on")
+
+
+def refresh_comment_counts(listing_ids):
+    """
+    Recounts the comments of the listings with a single UPDATE. Used after comments are deleted, see recount_comments.
+    """
+    counts = Comment.objects.filter(listing=OuterRef("pk")).order_by().values("listing").annotate(
+        total=Count("pk")).values("total")
+    Listing.objects.filter(pk__in=listing_ids).update(comment_count=Coalesce(Subquery(counts), 0))
+
+
+# Listings whose comments have been deleted by the current transaction of each thread, recounted once it commits
+_recount = threading.local()
+
+
+@receiver(post_delete, sender=Comment)
+def recount_comments(sender, instance, **kwargs):
+    """
+    Recounts the comments of the listing of the deleted comment once the current transaction has been committed. The
+    comments deleted by a transaction, e.g. along with their author, are recounted with a single UPDATE.
+    """
+    listing_ids = getattr(_recount, "listing_ids", None)
+    # Start a new set unless the current transaction already has one
+    if listing_ids is None or not any(func is _recount.callback for _, func in connection.run_on_commit):
+        listing_ids = {instance.listing_id}
+
+        def callback():
+            _recount.listing_ids = None
+            refresh_comment_counts(listing_ids)
+        _recount.listing_ids, _recount.callback = listing_ids, callback
+        transaction.on_commit(callback)
+    else:
+        listing_ids.add(instance.listing_id)
+
+
+def filter_listings(listings, filters):
+    """
+    Returns the listings filtered by price and image and sorted according to the cleaned data of a ListingFilterForm.
+    The category filter is applied separately, see get_facets.
+    """
+    if filters.get("min_price") is not None:
+        listings = listings.filter(current_bid__gte=filters["min_price"])
+    if filters.get("max_price") is not None:
+        listings = listings.filter(current_bid__lte=filters["max_price"])
+    if filters.get("has_image"):
+        listings = listings.exclude(url="")
+    return listings.order_by(*LISTING_ORDERINGS[filters.get("sort") or "newest"])
+
+
+def get_facets(listings):
+    """
+    Returns a dictionary that maps the category ids of the listings to a (number of listings, number of listings with an
+    image) pair, computed with a single grouped query.
+    """
+    rows = listings.order_by().values("category").annotate(total=Count("pk"), with_image=Count("pk", filter=~Q(url="")))
+    return {row["category"]: (row["total"], row["with_image"]) for row in rows}
@@ -1,14 +1,27 @@
+from uuid import uuid4
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db import IntegrityError
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.forms import ModelForm
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
 
-from . import util
-from .models import User, Watchlist, Listing, Bid, Comment, Category
+from . import autocomplete, categories, exports, hot, similarity, trending, util
+from .idempotency import idempotent
+from .models import User, Watchlist, Listing, Bid, Comment, Category, ArchivedListing
+from .pagecache import anonymous_cache_page
+from .ratelimit import rate_limit
+from .routers import use_primary, use_replica
+from .signals import bid_placed, listing_closed, listing_created
 
 
 class NewListingForm(ModelForm):
@@ -20,12 +33,13 @@ class NewListingForm(ModelForm):
         fields = ["title", "description", "init_bid", "url", "category"]
         # Rename "url" label as "Image URL"
         labels = {"url": "Image URL"}
+        widgets = {"category": categories.CategorySelect}
 
     def __init__(self, *args, **kwargs):
         # Call super() to extend the functionality of the superclass
         super().__init__(*args, **kwargs)
-        # Populate the "category" queryset with Category objects to display the categories in a select field in HTML
-        self.fields["category"].queryset = Category.objects.all()
+        # Display the categories held in memory in a select field in HTML instead of querying them for every form
+        categories.set_choices(self.fields["category"])
         # self.fields["url"].required = False
 
 
@@ -33,6 +47,9 @@ class NewBidForm(ModelForm):
     """
     ModelForm for creating a new bidding form.
     """
+    # Key that identifies the submission of this form, so that retried submissions place the bid only once
+    idempotency_key = forms.UUIDField(required=False, initial=uuid4, widget=forms.HiddenInput)
+
     class Meta:
         model = Bid
         fields = ["amount"]
@@ -40,10 +57,33 @@ class NewBidForm(ModelForm):
         labels = {"amount": ""}
 
 
+class ListingFilterForm(forms.Form):
+    """
+    Form for filtering and sorting the listings on the browse pages.
+    """
+    min_price = forms.DecimalField(required=False, min_value=0, decimal_places=2, label="Min price")
+    max_price = forms.DecimalField(required=False, min_value=0, decimal_places=2, label="Max price")
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False, empty_label="All categories",
+                                      widget=categories.CategorySelect)
+    has_image = forms.BooleanField(required=False, label="Has image")
+    sort = forms.ChoiceField(required=False, choices=[("newest", "Newest"),
+                                                      ("price_asc", "Price: low to high"),
+                                                      ("price_desc", "Price: high to low"),
+                                                      ("bids", "Most bids")])
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Display the categories held in memory instead of querying them for every page
+        categories.set_choices(self.fields["category"])
+
+
 class NewCommentForm(ModelForm):
     """
     ModelForm for creating a new comment.
     """
+    # Key that identifies the submission of this form, so that retried submissions post the comment only once
+    idempotency_key = forms.UUIDField(required=False, initial=uuid4, widget=forms.HiddenInput)
+
     class Meta:
         model = Comment
         fields = ["content"]
@@ -56,11 +96,70 @@ class NewCommentForm(ModelForm):
         }
 
 
+@use_replica
+@anonymous_cache_page
 def index(request):
     """
     Default route that returns active listings.
     """
-    return render(request, "auctions/index.html", {"header": "Active Listings", "listings": Listing.objects.filter(active=True)})
+    # Show the trending listings above the plain list of listings
+    trending_listings = [] if request.GET else trending.get_trending_listings()
+    return render_listings(request, "Active Listings", Listing.objects.filter(active=True),
+                           trending_listings=trending_listings)
+
+
+def render_listings(request, header, listings, category=None, trending_listings=()):
+    """
+    Renders a page of the listings, filtered and sorted according to the query parameters, along with the number of
+    listings per category and the number of listings with an image for the current filters. If category is given, the
+    listings are already limited to that category and the category filter is not offered. The trending_listings are
+    displayed above the listings.
+    """
+    # Fetch the filter form. Invalid filters are ignored.
+    filter_form = ListingFilterForm(request.GET)
+    filters = filter_form.cleaned_data if filter_form.is_valid() else {}
+    if category is not None:
+        del filter_form.fields["category"]
+        filters["category"] = category
+
+    # Count the listings per category before filtering by category so that the counts of the other categories can be
+    # displayed
+    listings = util.filter_listings(listings, filters)
+    facets = util.get_facets(listings)
+    if filters.get("category"):
+        listings = listings.filter(category=filters["category"])
+        total, with_image = facets.get(filters["category"].pk, (0, 0))
+    else:
+        total, with_image = sum(count for count, _ in facets.values()), sum(count for _, count in facets.values())
+
+    # Link each category with listings to the same page filtered by that category
+    category_facets = []
+    if category is None:
+        _, choices = categories.get_choices()
+        for pk, name in choices:
+            if pk in facets:
+                params = request.GET.copy()
+                params["category"] = pk
+                params.pop("page", None)
+                category_facets.append((Category(pk=pk, name=name), facets[pk][0], params.urlencode()))
+
+    # The number of listings is known from the facets, so the paginator does not need to count them
+    paginator = Paginator(listings, util.LISTINGS_PER_PAGE)
+    paginator.count = total
+    page = paginator.get_page(request.GET.get("page"))
+
+    # Keep the filters in the links to the other pages
+    params = request.GET.copy()
+    params.pop("page", None)
+
+    return render(request, "auctions/index.html", {"header": header,
+                                                   "trending": trending_listings,
+                                                   "listings": page,
+                                                   "filter_form": filter_form,
+                                                   "category_facets": category_facets,
+                                                   "with_image": with_image,
+                                                   "total": total,
+                                                   "query": params.urlencode()})
 
 
 def login_view(request):
@@ -125,6 +224,7 @@ def register(request):
         return render(request, "auctions/register.html")
 
 
+@use_primary
 def create_listing(request):
     """
     Creates Listing and Bid objects. Then redirects to the index page.
@@ -144,12 +244,16 @@ def create_listing(request):
 
             # Create a new Listing object
             new_listing = Listing(title=title, description=description, init_bid=init_bid, current_bid=init_bid,
-                                  url=url, creator=request.user, category=category)
-            new_listing.save()
+                                  url=url, creator=request.user, category=category, bid_count=1)
+            # Create the listing and its initial bid together so that a listing never exists without a bid
+            with transaction.atomic():
+                new_listing.save()
+
+                # Create a new Bid object. The bid has no primary key yet, so it is saved with a single INSERT.
+                Bid.objects.create(listing=new_listing, amount=init_bid, bidder=request.user)
 
-            # Create a new Bid object
-            bid = Bid(listing=new_listing, amount=init_bid, bidder=request.user)
-            bid.save()
+                # Notify the receivers, e.g. to invalidate the cached pages
+                listing_created.send(sender=Listing, listing=new_listing)
 
             # Redirect to the index page
             return HttpResponseRedirect(reverse("index"))
@@ -167,9 +271,16 @@ def display_listing(request, listing_id):
     Displays listing based on the listing_id.
     """
     # Get the listing object
-    listing = Listing.objects.get(pk=listing_id)
+    try:
+        listing = Listing.objects.get(pk=listing_id)
+    except Listing.DoesNotExist:
+        # Listings closed long ago are moved to the archive
+        return display_archived_listing(request, listing_id)
+    # Show the current bid held in memory if the listing is being bid on
+    hot.apply(listing)
     # Get the listing data
-    in_watchlist, is_creator, is_winner, comments, min_required_bid = util.get_listing_data(request, listing)
+    in_watchlist, is_creator, is_winner, comments, next_comments, min_required_bid = util.get_listing_data(
+        request, listing, request.GET.get("before"))
 
     # Render the listing page using the listing data
     return render(request, "auctions/listing.html",
@@ -182,10 +293,32 @@ def display_listing(request, listing_id):
                    "is_winner": is_winner,
                    "active": listing.active,
                    "comment_form": NewCommentForm(),
-                   "comments": comments})
+                   "comments": comments,
+                   "next_comments": next_comments,
+                   "similar_listings": similarity.get_similar_listings(listing.pk)})
+
+
+def display_archived_listing(request, listing_id):
+    """
+    Displays a read-only page of the archived listing with pk=listing_id.
+    """
+    listing = get_object_or_404(ArchivedListing, pk=listing_id)
+    # Get a single page of comments
+    comments, next_comments = [], None
+    if listing.comment_count:
+        comments, next_comments = util.get_comment_page(listing.comments.all(), request.GET.get("before"))
+
+    return render(request, "auctions/archived_listing.html",
+                  {"listing": listing,
+                   "is_winner": request.user.is_authenticated and request.user.pk == listing.winner_id,
+                   "comments": comments,
+                   "next_comments": next_comments})
 
 
 @login_required(login_url="login")
+@rate_limit
+@use_primary
+@idempotent
 def update_price(request, listing_id):
     """
     Updates the listing price based on the bid. The price is updated only if the bid is at least as large as the initial
@@ -193,28 +326,43 @@ def update_price(request, listing_id):
     presented with an error.
     """
     if request.method == "POST":
-        # Get the listing object
-        listing = Listing.objects.get(pk=listing_id)
-
         # Fetch the bidding form
         bidding_form = NewBidForm(request.POST)
 
+        # If the hot listing cache is enabled, validate and accept the bid in memory and redirect to the listing page
+        if hot.enabled() and bidding_form.is_valid():
+            if hot.place_bid(listing_id, request.user, bidding_form.cleaned_data["amount"]):
+                return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
+
+        # Get the listing object with the current bid held in memory, if any
+        listing = Listing.objects.get(pk=listing_id)
+        hot.apply(listing)
+
         # Get the listing data
-        in_watchlist, is_creator, is_winner, comments, min_required_bid = util.get_listing_data(request, listing)
+        in_watchlist, is_creator, is_winner, comments, next_comments, min_required_bid = util.get_listing_data(
+            request, listing)
 
         # Check if the bidding form is valid
         if bidding_form.is_valid():
             # Get the bidding amount
             new_bid = bidding_form.cleaned_data["amount"]
 
-            # Check if new bid is greater than or equal to the minimum required bid
-            if min_required_bid <= new_bid:
-                # Create a Bid object
-                bid = Bid(listing=listing, amount=new_bid, bidder=request.user)
-                bid.save()
-                # Update the current bid of the listing
-                listing.current_bid = new_bid
-                listing.save()
+            # Check if new bid is greater than or equal to the minimum required bid. If the hot listing cache is enabled
+            # the bid has already been rejected in memory.
+            if min_required_bid <= new_bid and not hot.enabled():
+                with transaction.atomic():
+                    # Get the last (highest) Bid before this one
+                    previous_bid = listing.bids.last()
+                    # Create a Bid object
+                    bid = Bid(listing=listing, amount=new_bid, bidder=request.user)
+                    bid.save()
+                    # Update the current bid and increment the bid count of the listing. Only these fields are
+                    # written so that concurrent increments of the comment count are not overwritten.
+                    listing.current_bid = new_bid
+                    listing.bid_count = F("bid_count") + 1
+                    listing.save(update_fields=["current_bid", "bid_count", "modified_on"])
+                    # Notify the receivers, e.g. to let the previous highest bidder know they have been outbid
+                    bid_placed.send(sender=Bid, bid=bid, previous_bid=previous_bid)
             else:
                 # Render the listing page with an error saying the bid must be greater than the minimum required bid
                 return render(request, "auctions/listing.html",
@@ -227,7 +375,8 @@ def update_price(request, listing_id):
                                "is_winner": is_winner,
                                "active": listing.active,
                                "comment_form": NewCommentForm(),
-                               "comments": comments})
+                               "comments": comments,
+                               "next_comments": next_comments})
         else:
             # If the bidding form is invalid then get the listing data and render the listing page
             return render(request, "auctions/listing.html",
@@ -240,13 +389,16 @@ def update_price(request, listing_id):
                            "is_winner": is_winner,
                            "active": listing.active,
                            "comment_form": NewCommentForm(),
-                           "comments": comments})
+                           "comments": comments,
+                           "next_comments": next_comments})
 
     # If request is not a post request, redirect to the listing page
     return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
 
 
 @login_required(login_url="login")
+@rate_limit
+@use_primary
 def edit_watchlist(request, listing_id):
     """
     Adds/Removes the Listing to/from the Watchlist.
@@ -288,25 +440,46 @@ def display_watchlist(request):
     return render(request, "auctions/watchlist.html", {"listings": listings})
 
 
+@login_required(login_url="login")
+@use_primary
 def close_listing(request, listing_id):
     """
-    Deactivates the listing and makes the last (highest) bidder the winner of the auction.
+    Deactivates the listing and makes the last (highest) bidder the winner of the auction. Only the creator of the
+    listing can close it, and closing a closed listing does nothing.
     """
     # Get the listing object
-    listing = Listing.objects.get(pk=listing_id)
+    listing = get_object_or_404(Listing, pk=listing_id)
+    if listing.creator_id != request.user.pk:
+        raise PermissionDenied
+    if not listing.active:
+        return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
+
+    # Stop accepting bids in memory and write the pending bids to the database
+    hot.deactivate(listing_id)
     # Deactivate the listing
     listing.active = False
+    listing.closed_on = timezone.now()
     # Get the last Bid
     last_bid = listing.bids.last()
     # Make the last bidder the winner
     listing.winner = last_bid.bidder
-    listing.save()
+    with transaction.atomic():
+        # Only the request that deactivates the listing closes it, so that concurrent closes notify the winner once
+        if not Listing.objects.filter(pk=listing_id, active=True).update(active=False):
+            return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
+        # Only write the closing fields so that concurrent increments of the bid and comment counts are not overwritten
+        listing.save(update_fields=["active", "closed_on", "winner", "modified_on"])
+        # Notify the receivers, e.g. to let the winner know they have won the auction
+        listing_closed.send(sender=Listing, listing=listing)
 
     # Redirect to the listing page
     return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
 
 
 @login_required(login_url="login")
+@rate_limit
+@use_primary
+@idempotent
 def create_comment(request, listing_id):
     """
     Creates a new Comment object and redirects to the listing page.
@@ -322,15 +495,19 @@ def create_comment(request, listing_id):
         if comment_form.is_valid():
             # Get the content and create a new Comment object
             content = comment_form.cleaned_data["content"]
-            new_comment = Comment(user=request.user, listing=listing, content=content)
-            new_comment.save()
+            with transaction.atomic():
+                new_comment = Comment(user=request.user, listing=listing, content=content)
+                new_comment.save()
+                # Increment the comment count of the listing in the database to avoid lost updates
+                Listing.objects.filter(pk=listing_id).update(comment_count=F("comment_count") + 1)
 
             # Redirect to the listing page
             return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
 
         else:
             # If the comment form is invalid then get the listing data and render the listing page
-            in_watchlist, is_creator, is_winner, comments, min_required_bid = util.get_listing_data(request, listing)
+            in_watchlist, is_creator, is_winner, comments, next_comments, min_required_bid = util.get_listing_data(
+                request, listing)
             return render(request, "auctions/listing.html", {"listing": listing,
                                                              "in_watchlist": in_watchlist,
                                                              "bidding_form": NewBidForm(),
@@ -340,12 +517,71 @@ def create_comment(request, listing_id):
                                                              "is_winner": is_winner,
                                                              "active": listing.active,
                                                              "comment_form": comment_form,
-                                                             "comments": comments})
+                                                             "comments": comments,
+                                                             "next_comments": next_comments})
 
     # If request is not a post request, redirect to the listing page
     return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
 
 
+@login_required(login_url="login")
+def display_my_bids(request):
+    """
+    Displays the active listings the user has bid on along with whether the user is winning or has been outbid.
+    """
+    return render(request, "auctions/my_bids.html", {"listings": util.get_bid_listings(request.user)})
+
+
+@login_required(login_url="login")
+def display_won_listings(request):
+    """
+    Displays the auctions won by the user.
+    """
+    # Listings closed long ago are moved to the archive, which may be a separate database
+    listings = list(util.get_won_listings(request.user)) + list(util.get_archived_won_listings(request.user))
+    return render(request, "auctions/won.html", {"listings": listings})
+
+
+@login_required(login_url="login")
+def export(request, kind):
+    """
+    Streams an export of the bids or the watchlist entries as CSV or JSON Lines, depending on the format query
+    parameter. Staff users export every row, other users export the bids on their own listings or their own watchlist.
+    The export can be limited to a single listing with the listing query parameter.
+    """
+    fmt = request.GET.get("format", "csv")
+    if kind not in exports.COLUMNS or fmt not in exports.CONTENT_TYPES:
+        raise Http404("Unknown export")
+    try:
+        listing_id = int(request.GET["listing"]) if "listing" in request.GET else None
+    except ValueError:
+        raise Http404("Unknown listing")
+
+    # Limit the export to the rows of the user unless the user is a staff member
+    scope = {} if request.user.is_staff else {"seller": request.user, "user": request.user}
+    rows = exports.get_rows(kind, listing_id=listing_id, **scope)
+
+    # Stream the rows as they are read instead of building the whole export in memory
+    response = StreamingHttpResponse(exports.render(kind, rows, fmt), content_type=exports.CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+def suggest_titles(request):
+    """
+    Returns the active listings whose title starts with the "q" parameter as JSON, for suggesting listings as the user
+    types. The titles are looked up in the autocomplete index held in memory rather than in the database.
+    """
+    suggestions = [{"id": listing_id, "title": title, "url": reverse("listing", args=(listing_id,))}
+                   for listing_id, title in autocomplete.suggest(request.GET.get("q", ""))]
+    response = JsonResponse({"suggestions": suggestions})
+    # The suggestions are the same for every user
+    patch_cache_control(response, public=True, max_age=settings.AUTOCOMPLETE_MAX_AGE)
+    return response
+
+
+@use_replica
+@anonymous_cache_page
 def display_all_categories(request):
     """
     Displays a list of all listing categories. Clicking on the name of any category takes the user to a page that
@@ -361,6 +597,8 @@ def display_all_categories(request):
     return render(request, "auctions/all_categories.html", {"categories": categories})
 
 
+@use_replica
+@anonymous_cache_page
 def display_single_category(request, category_id):
     """
     Displays all of the active listings in the category with pk=category_id.
@@ -371,4 +609,4 @@ def display_single_category(request, category_id):
     listings = Listing.objects.filter(category=category, active=True)
 
     # Render the category page
-    return render(request, "auctions/index.html", {"header": category.name, "listings": listings})
+    return render_listings(request, category.name, listings, category)
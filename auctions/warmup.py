@@ -0,0 +1,118 @@
+"""
+Warm-up of a freshly started process, so that its first requests are not slowed down by work that happens once per
+process: importing the views and populating the URL resolvers, compiling the templates, setting up the forms and their
+widget templates, connecting to the databases, loading the categories and the autocomplete index and recovering the bids
+left in the journal of the hot listings.
+
+The warm-up is run by commerce/wsgi.py and commerce/asgi.py when WARMUP is set. With gunicorn's preload_app, see
+gunicorn.conf.py, it runs once in the master process and the workers inherit its result when they are forked, except
+for the database connections, which each worker opens after the fork.
+"""
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import Resolver404, resolve, reverse
+
+# Phases and their duration in seconds, of the last run
+timings = []
+
+
+def warm_urls():
+    """
+    Imports the URLconf and the views, and populates the resolvers so that the first reverse() and resolve() do not
+    have to.
+    """
+    # Resolving a path that matches no pattern compiles the regular expressions of the patterns on the way
+    try:
+        resolve("/__warmup__")
+    except Resolver404:
+        pass
+    # Reversing populates the reverse dictionaries of the resolver and of the admin namespace
+    reverse("index")
+    reverse("admin:index")
+
+
+def warm_templates():
+    """
+    Compiles the templates of the auctions app. They are kept by the cached template loader, which is used unless DEBUG
+    is on.
+    """
+    directory = os.path.join(apps.get_app_config("auctions").path, "templates")
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".html"):
+                get_template(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/"))
+
+
+def warm_connections():
+    """
+    Connects to every database. The connections are kept between requests for CONN_MAX_AGE seconds.
+    """
+    for alias in settings.DATABASES:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+
+def warm_caches():
+    """
+    Loads the categories and the autocomplete index held in memory by each process.
+    """
+    from . import autocomplete, categories
+    categories.get_choices()
+    autocomplete.get_index()
+
+
+def warm_hot_listings():
+    """
+    Writes the bids left in the journal by a previous process to the database, so that the listing pages show them.
+    """
+    from . import hot
+    if hot.enabled():
+        hot.recover()
+
+
+def warm_forms():
+    """
+    Renders the forms of the views once, which sets up their fields and compiles the templates of their widgets.
+    """
+    from . import views
+    for form_class in [views.NewListingForm, views.NewBidForm, views.NewCommentForm, views.ListingFilterForm]:
+        str(form_class())
+
+
+# Phases of the warm-up, in the order they are run
+PHASES = {
+    "urls": warm_urls,
+    "templates": warm_templates,
+    "connections": warm_connections,
+    "caches": warm_caches,
+    "hot": warm_hot_listings,
+    "forms": warm_forms,
+}
+
+
+def run(phases=None, setup=None):
+    """
+    Runs the given phases of the warm-up, all of them by default, and returns the phases with their duration in
+    seconds. setup is the number of seconds it took to set up Django and the application, which is reported first.
+    """
+    timings.clear()
+    if setup is not None:
+        timings.append(("setup", setup))
+    for name in phases or PHASES:
+        start = time.perf_counter()
+        PHASES[name]()
+        timings.append((name, time.perf_counter() - start))
+    return list(timings)
+
+
+def describe(phase_timings=None):
+    """
+    Returns the phases of the last run with their duration, in a single line.
+    """
+    phase_timings = timings if phase_timings is None else phase_timings
+    return ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in phase_timings)
@@ -8,9 +8,18 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
 
 import os
+import time
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
+start = time.perf_counter()
 application = get_asgi_application()
+
+# Warm up the process before it serves requests, see auctions/warmup.py
+if settings.WARMUP:
+    from auctions import warmup
+    # The views run in a pool of threads with their own database connections, which the warm-up cannot open
+    warmup.run([phase for phase in warmup.PHASES if phase != "connections"], setup=time.perf_counter() - start)
@@ -31,7 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'auctions',
+    'auctions.apps.AuctionsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -41,8 +41,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'auctions.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'auctions.middleware.PrimaryPinMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -56,7 +59,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -64,6 +66,13 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Load the templates of the apps with their indentation stripped, see auctions/loaders.py. The compiled
+            # templates are cached unless DEBUG is on, so that changes to the templates show up while developing.
+            'loaders': [
+                'auctions.loaders.MinifyingLoader',
+            ] if DEBUG else [
+                ('django.template.loaders.cached.Loader', ['auctions.loaders.MinifyingLoader']),
+            ],
         },
     },
 ]
@@ -74,15 +83,125 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# Seconds the database connections are kept open between requests, so that the connections opened by the warm-up of a
+# worker, see auctions/warmup.py, serve its requests
+DATABASE_CONN_MAX_AGE = 60
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
     }
 }
 
+# Optional read replica. Reads of the browse pages are routed to the replicas while writes always go to "default". To
+# try it locally, copy db.sqlite3 and point REPLICA_DATABASE_PATH to the copy.
+if os.environ.get('REPLICA_DATABASE_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['REPLICA_DATABASE_PATH'],
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        # Tests read the replica through the test database of the primary
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Closed listings are moved to archive tables by the archive_closed_auctions command. The archive tables are kept in the
+# primary database unless ARCHIVE_DATABASE_PATH points to a separate SQLite file, which is then created with
+# "python manage.py migrate --database archive".
+if os.environ.get('ARCHIVE_DATABASE_PATH'):
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['ARCHIVE_DATABASE_PATH'],
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+    }
+
+# Alias of the database holding the archive tables
+ARCHIVE_DATABASE = 'archive' if 'archive' in DATABASES else 'default'
+
+DATABASE_ROUTERS = ['auctions.routers.ArchiveRouter', 'auctions.routers.ReplicaRouter']
+
+# Aliases of the databases reads are routed to
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias not in ('default', 'archive')]
+
+# Seconds a session reads from the primary after it writes, so that users always see their own bids and comments
+PRIMARY_PIN_SECONDS = 10
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# The local memory cache is private to each process. Set CACHE_LOCATION to the address of a memcached server when
+# running multiple processes, so that the idempotency keys, the rate limits and the invalidation of the cached pages are
+# shared by every process. The memcached backend needs the python-memcached package.
+if os.environ.get('CACHE_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ['CACHE_LOCATION'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a browse page rendered for logged out users is kept in the cache
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 300
+# Seconds browsers may use a browse page without revalidating it
+ANONYMOUS_PAGE_MAX_AGE = 0
+# Seconds each process keeps the time of the last change to the listings before reading it from the database again.
+# Bounds how long a process that does not share the cache of the process that changed a listing serves the old pages.
+LAST_MODIFIED_TIMEOUT = 10
+# Seconds each process keeps the version of the categories before checking the categories in the database again. Bounds
+# how long a process that does not share the cache of the process that changed a category shows the old categories.
+CATEGORIES_VERSION_TIMEOUT = 60
+
+# Seconds the outcome of an accepted bid or comment is remembered, so that retried submissions of the same form are not
+# processed again
+IDEMPOTENCY_KEY_TIMEOUT = 600
+# Seconds a retried submission waits for the outcome of the submission still being processed
+IDEMPOTENCY_WAIT = 5
+
+# Rate limits of the views that write, as (requests, seconds) per user, per client address and per listing. Requests
+# over a limit are answered with 429 Too Many Requests.
+RATE_LIMITS = {
+    'update_price': {'user': (20, 60), 'ip': (60, 60), 'listing': (300, 60)},
+    'create_comment': {'user': (10, 60), 'ip': (30, 60), 'listing': (60, 60)},
+    'edit_watchlist': {'user': (30, 60), 'ip': (90, 60)},
+}
+# Backend counting the requests. CacheBackend shares the counts between processes through the cache, MemoryBackend
+# keeps exact counts in each process.
+RATE_LIMIT_BACKEND = 'auctions.ratelimit.CacheBackend'
+# Request META key holding the client address that the "ip" limits count, e.g. HTTP_X_REAL_IP or HTTP_X_FORWARDED_FOR
+# as set by the reverse proxy in front of the application. gunicorn.conf.py binds to 127.0.0.1, so REMOTE_ADDR would be
+# the address of the proxy and shared by every client. The "ip" limits are not applied while this is empty.
+RATE_LIMIT_CLIENT_ADDRESS = os.environ.get('RATE_LIMIT_CLIENT_ADDRESS', '')
+
+# Directory the request profiles are written to. Staff users profile a request by sending the X-Profile header or
+# adding ?profile=1 to the URL.
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+# Fraction of all requests that is profiled, e.g. 0.001 for one in a thousand
+PROFILE_SAMPLE_RATE = 0
+# Seconds between two samples of the stack of a profiled request
+PROFILE_SAMPLE_INTERVAL = 0.001
+
+# Responses smaller than this many bytes are not compressed, since the savings do not make up for the work
+COMPRESSION_MIN_SIZE = 512
+# Compression levels of gzip (1-9) and brotli (0-11). Brotli is used when the brotli package is installed.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Number of rows fetched from the database and written at a time by the bid and watchlist exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Admin changelists of unfiltered tables with at least this many rows show an estimated count instead of running
+# COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -121,3 +240,113 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 # LOGIN_REDIRECT_URL = '/login/'
+
+
+# Email
+# https://docs.djangoproject.com/en/3.0/topics/email/
+
+# Emails are written to files for local testing. Tests use the locmem backend automatically.
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+DEFAULT_FROM_EMAIL = 'auctions@localhost'
+
+# Base URL used for the links in emails
+SITE_URL = 'http://localhost:8000'
+
+
+# Background jobs
+
+# Maximum number of jobs claimed by a worker at a time
+JOB_BATCH_SIZE = 100
+# Seconds after which a claimed job that has not been completed is claimed again
+JOB_LEASE = 300
+# Number of attempts before a job is marked as failed
+JOB_MAX_ATTEMPTS = 5
+# Seconds to wait before the first retry of a failed job. Doubles with every attempt.
+JOB_RETRY_DELAY = 30
+# Outbid notifications of the same bidder on the same listing within this many seconds are sent as one email
+OUTBID_NOTIFICATION_WINDOW = 300
+
+
+
+# Hot listings
+
+# Validate bids in memory and write them to the database in batches. Requires every bid of a listing to be handled by
+# the same process, see auctions/hot.py.
+HOT_LISTINGS_ENABLED = False
+# Maximum number of listings held in memory
+HOT_LISTINGS_MAX = 1000
+# Number of accepted bids that triggers a write to the database
+HOT_BID_BATCH_SIZE = 50
+# Maximum number of seconds an accepted bid waits before it is written to the database
+HOT_BID_FLUSH_INTERVAL = 1.0
+# Journal of the accepted bids that have not been written to the database yet
+HOT_BID_JOURNAL = os.path.join(BASE_DIR, 'hot_bids.journal')
+
+
+
+# Event cursors
+
+# Seconds the ids skipped by the cursors of the trending rankings and of the similar listings are read again, in case
+# the transactions that created them commit after later events have been read
+EVENT_GAP_TIMEOUT = 300
+# Maximum number of skipped ids kept per cursor and kind of event
+EVENT_MAX_GAPS = 500
+
+
+
+# Trending listings
+
+# Number of trending listings on the home page, ranked by the refresh_trending command
+TRENDING_LISTINGS = 10
+# Seconds after which the weight of a bid or watch event in the trending score has halved
+TRENDING_HALF_LIFE = 6 * 60 * 60
+# Weights of a bid and of a watchlist addition in the trending score
+TRENDING_BID_WEIGHT = 1.0
+TRENDING_WATCH_WEIGHT = 0.5
+# Scores that have decayed below this weight are deleted
+TRENDING_PRUNE_BELOW = 0.01
+# Maximum number of bids and of watchlist additions processed per transaction
+TRENDING_BATCH_SIZE = 10000
+
+
+
+# Similar listings
+
+# Number of similar listings on the listing page, found by the build_similar_listings command
+SIMILAR_LISTINGS = 6
+# Number of similar listings kept per listing. Listings that drop out lose their score.
+SIMILAR_LISTINGS_KEPT = 50
+# Users who have bid on or watched more listings than this are ignored, since they say little about similarity
+SIMILAR_MAX_USER_LISTINGS = 500
+# Number of the last listings of a user paired with each listing the user bids on or watches, which bounds the work
+# done per event
+SIMILAR_RECENT_LISTINGS = 20
+# Maximum number of bids and of watchlist additions processed per transaction
+SIMILAR_BATCH_SIZE = 10000
+
+
+
+# Autocomplete
+
+# Maximum number of listing titles held in the autocomplete index of each process. Each title takes about 230 bytes, so
+# 200,000 titles take about 46 MB per process.
+AUTOCOMPLETE_MAX_TITLES = 200000
+# Seconds between two updates of the index with the listings changed by the other processes
+AUTOCOMPLETE_SYNC_INTERVAL = 30
+# Number of titles checked against the database on each update, so that the titles of the listings deleted by the
+# other processes are dropped. The 200,000 titles are checked within 5 minutes.
+AUTOCOMPLETE_VERIFY_BATCH = 20000
+# Minimum number of characters typed before titles are suggested, and maximum number of suggestions
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_LIMIT = 10
+# Seconds the browsers may reuse the suggestions for a prefix
+AUTOCOMPLETE_MAX_AGE = 60
+
+
+
+# Warm-up
+
+# Warm up each process before it serves requests, see auctions/warmup.py. Turned on by setting the WARMUP environment
+# variable, as gunicorn.conf.py does.
+WARMUP = bool(os.environ.get('WARMUP'))
@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/wsgi/
 """
 
 import os
+import time
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
+start = time.perf_counter()
 application = get_wsgi_application()
+
+# Warm up the process before it serves requests, see auctions/warmup.py
+if settings.WARMUP:
+    from auctions import warmup
+    warmup.run(setup=time.perf_counter() - start)
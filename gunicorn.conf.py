@@ -0,0 +1,50 @@
+"""
+gunicorn configuration, used by "gunicorn commerce.wsgi" when run from this directory.
+
+The application is loaded and warmed up once in the master process, see auctions/warmup.py, before the workers are
+forked. The workers share the imported modules, compiled templates and caches of the master instead of each setting
+them up on its first requests.
+
+By default a single worker serves the requests with GUNICORN_THREADS threads. The idempotency keys, the rate limits and
+the invalidation of the cached pages and categories are kept in the Django cache, which is private to each process
+unless CACHE_LOCATION points commerce/settings.py to a shared memcached server. Only raise WEB_CONCURRENCY above 1
+along with CACHE_LOCATION, e.g. "CACHE_LOCATION=127.0.0.1:11211 WEB_CONCURRENCY=4 gunicorn commerce.wsgi".
+"""
+import gc
+import os
+
+# Turn on the warm-up in commerce/wsgi.py
+os.environ.setdefault("WARMUP", "1")
+
+bind = os.environ.get("BIND", "127.0.0.1:8000")
+# Several workers need a shared cache, see above
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# Load the application in the master before forking the workers
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Logs the duration of each phase of the warm-up of the master.
+    """
+    from auctions import warmup
+    server.log.info("Warm-up: %s", warmup.describe())
+
+
+def pre_fork(server, worker):
+    """
+    Closes the database connections of the master so that the workers do not share them, and moves the objects of the
+    master out of reach of the garbage collector so that the memory pages the workers share with it stay shared.
+    """
+    from django.db import connections
+    connections.close_all()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Opens the database connections of the worker.
+    """
+    from auctions import warmup
+    server.log.info("Worker %s warm-up: %s", worker.pid, warmup.describe(warmup.run(["connections"])))